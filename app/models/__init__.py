@@ -2,7 +2,7 @@
 from app.models.user import User, UserRole
 from app.models.class_model import Class, class_student, class_teacher
 from app.models.assignment import Assignment, AssignmentGrade
-from app.models.submission import Submission
+from app.models.submission import Submission, SubmissionText
 from app.models.notification import Notification
 from app.models.makeup_request import MakeupRequest
 from app.models.operation_log import OperationLog
@@ -13,13 +13,15 @@ from app.models.team import (
     TeamTask, TaskProgress,
     MajorAssignmentAttachment, MajorAssignmentLink
 )
-from app.models.ai_grading_task import AIGradingTask, AIGradingConfig
+from app.models.ai_grading_task import AIGradingTask, AIGradingConversation, AIGradingConfig
+from app.models.cache_stat import CacheStat
+from app.models.batch_download_job import BatchDownloadJob
 
 __all__ = [
     'User', 'UserRole',
     'Class', 'class_student', 'class_teacher',
     'Assignment', 'AssignmentGrade',
-    'Submission',
+    'Submission', 'SubmissionText',
     'Notification',
     'MakeupRequest',
     'OperationLog',
@@ -28,5 +30,7 @@ __all__ = [
     'Stage', 'DivisionRole', 'TeamDivision',
     'TeamTask', 'TaskProgress',
     'MajorAssignmentAttachment', 'MajorAssignmentLink', 'StageSubmission',
-    'AIGradingTask', 'AIGradingConfig'
+    'AIGradingTask', 'AIGradingConversation', 'AIGradingConfig',
+    'CacheStat',
+    'BatchDownloadJob'
 ]
@@ -1,5 +1,11 @@
 """AI 批改任务队列模型"""
-from datetime import datetime
+import json
+import os
+import socket
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_, select, update, insert, text
 from app.extensions import db
 
 
@@ -12,14 +18,31 @@ class AIGradingTask(db.Model):
     STATUS_PROCESSING = 1   # 批改中
     STATUS_COMPLETED = 2    # 完成
     STATUS_FAILED = 3       # 失败
+    STATUS_DEFERRED = 4     # 待参考答案（模式2：上传参考答案后统一入队）
     
     STATUS_TEXT = {
         0: '等待中',
         1: '批改中',
         2: '完成',
-        3: '失败'
+        3: '失败',
+        4: '待参考答案'
     }
     
+    # 租约配置：处理中的任务需定期续约，租约过期后可被其他 worker 回收
+    LEASE_SECONDS = 120         # 租约时长
+    HEARTBEAT_INTERVAL = 30     # 续约间隔
+    MAX_ATTEMPTS = 3            # 最多领取次数（防止导致 worker 崩溃的任务无限重试）
+    
+    # 优先级
+    PRIORITY_NORMAL = 0
+    PRIORITY_HIGH = 1           # 教师手动重新评分/插队
+    
+    # 公平调度：按「轮次」排序，每个教师、每份作业每轮各取一个任务；
+    # 每级优先级提前 PRIORITY_ROUNDS 轮，每等待 AGING_MINUTES 分钟提前一轮（防止饿死）。
+    # 单个任务约需 1 分钟，老化间隔需远大于任务耗时，否则大批量积压很快就会排到其他教师的新任务前面
+    PRIORITY_ROUNDS = 1000
+    AGING_MINUTES = 30
+    
     id = db.Column(db.Integer, primary_key=True)
     
     # 关联信息
@@ -28,23 +51,64 @@ class AIGradingTask(db.Model):
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
     # 状态和结果
-    status = db.Column(db.Integer, default=STATUS_PENDING)  # 0=等待中, 1=批改中, 2=完成, 3=失败
+    status = db.Column(db.Integer, default=STATUS_PENDING)  # 0=等待中, 1=批改中, 2=完成, 3=失败, 4=待参考答案
     score = db.Column(db.Float, nullable=True)              # AI 评分
     feedback = db.Column(db.Text, nullable=True)            # AI 反馈
     error_message = db.Column(db.Text, nullable=True)       # 错误信息
     
-    # 详细对话记录（存储 JSON 格式的 API 请求和响应）
-    conversation_log = db.Column(db.Text, nullable=True)
+    # 详细对话记录（旧版内联存储，新记录写入 ai_grading_conversation 表，见 get_conversation_log）
+    # 延迟加载：列表页查询不读取该大字段
+    conversation_log = db.deferred(db.Column(db.Text, nullable=True))
     
     # 时间戳
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     started_at = db.Column(db.DateTime, nullable=True)      # 开始处理时间
     completed_at = db.Column(db.DateTime, nullable=True)    # 完成时间
     
+    # 租约信息（多进程/多节点安全领取）
+    worker_id = db.Column(db.String(100), nullable=True)         # 领取该任务的 worker 标识
+    lease_token = db.Column(db.String(36), nullable=True, index=True)  # 本次领取的租约令牌
+    lease_expires_at = db.Column(db.DateTime, nullable=True)     # 租约到期时间
+    heartbeat_at = db.Column(db.DateTime, nullable=True)         # 最近一次续约时间
+    attempts = db.Column(db.Integer, default=0)                  # 已领取次数
+    
+    # 批量批改作业标识（同一次批量提交的任务共享）
+    batch_id = db.Column(db.String(36), nullable=True, index=True)
+    
+    # 跳过评分结果缓存，强制重新调用 AI（重新评分时使用）
+    bypass_cache = db.Column(db.Boolean, default=False)
+    
+    # 调度优先级（数值越大越优先）
+    priority = db.Column(db.Integer, default=PRIORITY_NORMAL)
+    
+    # 分阶段耗时（毫秒）与 token 用量
+    wait_ms = db.Column(db.Integer, nullable=True)          # 排队等待
+    extract_ms = db.Column(db.Integer, nullable=True)       # 文件文本提取（不含 OCR）
+    ocr_ms = db.Column(db.Integer, nullable=True)           # OCR 识别
+    prompt_ms = db.Column(db.Integer, nullable=True)        # Prompt 构建
+    llm_ms = db.Column(db.Integer, nullable=True)           # AI 调用（含限流等待和重试）
+    validate_ms = db.Column(db.Integer, nullable=True)      # 结果校验
+    prompt_tokens = db.Column(db.Integer, nullable=True)
+    completion_tokens = db.Column(db.Integer, nullable=True)
+    prompt_cache_hit_tokens = db.Column(db.Integer, nullable=True)  # 命中上游上下文缓存的输入 token
+    ocr_saved_ms = db.Column(db.Integer, nullable=True)     # 图片 OCR 缓存命中节省的识别耗时
+    
+    # 参与统计的阶段（字段名 -> 显示名称）
+    STAGE_FIELDS = {
+        'wait_ms': '排队等待',
+        'extract_ms': '文本提取',
+        'ocr_ms': 'OCR',
+        'prompt_ms': 'Prompt 构建',
+        'llm_ms': 'AI 调用',
+        'validate_ms': '结果校验'
+    }
+    
     # 关联关系
     submission = db.relationship('Submission', backref=db.backref('ai_grading_tasks', lazy='dynamic'))
     assignment = db.relationship('Assignment', backref=db.backref('ai_grading_tasks', lazy='dynamic'))
     student = db.relationship('User', backref=db.backref('ai_grading_tasks', lazy='dynamic'))
+    conversation = db.relationship('AIGradingConversation', uselist=False, lazy='select',
+                                   cascade='all, delete-orphan')
     
     @property
     def status_text(self):
@@ -66,10 +130,504 @@ class AIGradingTask(db.Model):
             return self.assignment.class_info.teachers[0].real_name
         return '未知'
     
+    @staticmethod
+    def current_worker_id():
+        """当前进程的 worker 标识（主机名:进程号）"""
+        return f'{socket.gethostname()}:{os.getpid()}'
+    
+    @staticmethod
+    def _claimable_condition(now):
+        """可领取条件：等待中，或处理中但租约已过期（worker 已失联）"""
+        return or_(
+            AIGradingTask.status == AIGradingTask.STATUS_PENDING,
+            and_(
+                AIGradingTask.status == AIGradingTask.STATUS_PROCESSING,
+                or_(AIGradingTask.lease_expires_at.is_(None), AIGradingTask.lease_expires_at < now)
+            )
+        )
+    
+    @staticmethod
+    def _schedule_order(condition, now):
+        """
+        公平调度顺序（返回按调度先后排序的 id 查询）
+        
+        1. 作业内按创建时间编号（第几个），得到作业内轮次
+        2. 教师内按作业内轮次交错编号，同一教师的多份作业轮流出队
+        3. 排序分 = 教师内轮次 - 优先级 × PRIORITY_ROUNDS - 等待分钟数 / AGING_MINUTES
+        
+        一位教师批量提交几百份作业时，其他教师的任务仍能在下一轮被领取。
+        """
+        from app.models.assignment import Assignment
+        
+        assignment_round = db.func.row_number().over(
+            partition_by=AIGradingTask.assignment_id,
+            order_by=(AIGradingTask.created_at.asc(), AIGradingTask.id.asc())
+        )
+        per_assignment = select(
+            AIGradingTask.id.label('id'),
+            AIGradingTask.created_at.label('created_at'),
+            db.func.coalesce(AIGradingTask.priority, 0).label('priority'),
+            Assignment.teacher_id.label('teacher_id'),
+            assignment_round.label('assignment_round')
+        ).select_from(AIGradingTask).outerjoin(
+            Assignment, Assignment.id == AIGradingTask.assignment_id
+        ).where(condition).subquery()
+        
+        teacher_round = db.func.row_number().over(
+            partition_by=per_assignment.c.teacher_id,
+            order_by=(per_assignment.c.assignment_round.asc(), per_assignment.c.created_at.asc(), per_assignment.c.id.asc())
+        )
+        per_teacher = select(
+            per_assignment.c.id,
+            per_assignment.c.created_at,
+            per_assignment.c.priority,
+            teacher_round.label('teacher_round')
+        ).subquery()
+        
+        waited_minutes = (db.func.julianday(now) - db.func.julianday(per_teacher.c.created_at)) * 1440
+        score = (
+            per_teacher.c.teacher_round
+            - per_teacher.c.priority * AIGradingTask.PRIORITY_ROUNDS
+            - waited_minutes / AIGradingTask.AGING_MINUTES
+        )
+        return select(per_teacher.c.id).order_by(score.asc(), per_teacher.c.created_at.asc(), per_teacher.c.id.asc())
+    
+    @staticmethod
+    def estimate_start_times(concurrency, task_ids=None):
+        """
+        估算等待中任务的开始时间
+        
+        按当前调度顺序排队，每 concurrency 个任务为一批，每批耗时取最近完成任务的平均处理时长。
+        
+        返回: {task_id: 预计开始时间(UTC)}
+        """
+        now = datetime.utcnow()
+        order = [row[0] for row in db.session.execute(
+            AIGradingTask._schedule_order(AIGradingTask.status == AIGradingTask.STATUS_PENDING, now)
+        )]
+        if not order:
+            return {}
+        
+        recent = db.session.query(AIGradingTask.started_at, AIGradingTask.completed_at).filter(
+            AIGradingTask.status == AIGradingTask.STATUS_COMPLETED,
+            AIGradingTask.started_at.isnot(None),
+            AIGradingTask.completed_at.isnot(None)
+        ).order_by(AIGradingTask.completed_at.desc()).limit(50).all()
+        durations = [(c - s).total_seconds() for s, c in recent if c >= s]
+        avg_seconds = sum(durations) / len(durations) if durations else 30
+        
+        concurrency = max(concurrency or 1, 1)
+        free_slots = max(concurrency - AIGradingTask.count_active_leases(), 0)
+        wanted = set(task_ids) if task_ids is not None else None
+        estimates = {}
+        for position, task_id in enumerate(order):
+            if wanted is not None and task_id not in wanted:
+                continue
+            if position < free_slots:
+                estimates[task_id] = now
+                continue
+            # 处理中的任务按平均已进行一半估算
+            batches = (position - free_slots) // concurrency
+            estimates[task_id] = now + timedelta(seconds=avg_seconds * (batches + 0.5))
+        return estimates
+    
+    @staticmethod
+    def get_metrics(hours=24, limit=5000):
+        """
+        统计最近一段时间已结束任务的分阶段耗时分位数、吞吐量和 token 用量
+        
+        返回: dict {window_hours, completed, failed, throughput_per_hour, stages, tokens, prompt_cache, ocr_saved_ms_total}
+        """
+        since = datetime.utcnow() - timedelta(hours=hours)
+        columns = [getattr(AIGradingTask, field) for field in AIGradingTask.STAGE_FIELDS]
+        rows = db.session.query(
+            AIGradingTask.status,
+            AIGradingTask.prompt_tokens,
+            AIGradingTask.completion_tokens,
+            AIGradingTask.prompt_cache_hit_tokens,
+            AIGradingTask.ocr_saved_ms,
+            *columns
+        ).filter(
+            AIGradingTask.status.in_([AIGradingTask.STATUS_COMPLETED, AIGradingTask.STATUS_FAILED]),
+            AIGradingTask.completed_at >= since
+        ).order_by(AIGradingTask.completed_at.desc()).limit(limit).all()
+        
+        def percentile(values, p):
+            index = min(int(round(p / 100 * (len(values) - 1))), len(values) - 1)
+            return values[index]
+        
+        stages = {}
+        for i, (field, label) in enumerate(AIGradingTask.STAGE_FIELDS.items()):
+            values = sorted(row[5 + i] for row in rows if row[5 + i] is not None)
+            stages[field[:-3]] = {
+                'label': label,
+                'count': len(values),
+                'avg_ms': int(sum(values) / len(values)) if values else None,
+                'p50_ms': percentile(values, 50) if values else None,
+                'p95_ms': percentile(values, 95) if values else None,
+                'p99_ms': percentile(values, 99) if values else None,
+                'max_ms': values[-1] if values else None
+            }
+        
+        completed = sum(1 for row in rows if row[0] == AIGradingTask.STATUS_COMPLETED)
+        prompt_tokens = [row[1] for row in rows if row[1] is not None]
+        completion_tokens = [row[2] for row in rows if row[2] is not None]
+        cache_hit_tokens = sum(row[3] for row in rows if row[3] is not None)
+        ocr_saved_ms = sum(row[4] for row in rows if row[4] is not None)
+        
+        # 上下文缓存命中与未命中的 AI 调用耗时对比
+        llm_index = 5 + list(AIGradingTask.STAGE_FIELDS).index('llm_ms')
+        llm_hit = sorted(row[llm_index] for row in rows if row[llm_index] is not None and row[3])
+        llm_miss = sorted(row[llm_index] for row in rows if row[llm_index] is not None and row[3] == 0)
+        
+        return {
+            'window_hours': hours,
+            'completed': completed,
+            'failed': len(rows) - completed,
+            'throughput_per_hour': round(len(rows) / hours, 2) if hours else None,
+            'stages': stages,
+            'tokens': {
+                'prompt_total': sum(prompt_tokens),
+                'completion_total': sum(completion_tokens),
+                'prompt_avg': int(sum(prompt_tokens) / len(prompt_tokens)) if prompt_tokens else None,
+                'completion_avg': int(sum(completion_tokens) / len(completion_tokens)) if completion_tokens else None
+            },
+            'prompt_cache': {
+                'hit_tokens_total': cache_hit_tokens,
+                'hit_ratio': round(cache_hit_tokens * 100 / sum(prompt_tokens), 1) if prompt_tokens and sum(prompt_tokens) else 0.0,
+                'llm_p50_ms_hit': percentile(llm_hit, 50) if llm_hit else None,
+                'llm_p50_ms_miss': percentile(llm_miss, 50) if llm_miss else None
+            },
+            'ocr_saved_ms_total': ocr_saved_ms
+        }
+    
+    @staticmethod
+    def count_active_leases():
+        """统计持有有效租约的处理中任务数（所有 worker 合计）"""
+        return AIGradingTask.query.filter(
+            AIGradingTask.status == AIGradingTask.STATUS_PROCESSING,
+            AIGradingTask.lease_expires_at >= datetime.utcnow()
+        ).count()
+    
+    @staticmethod
+    def claim_batch(limit, worker_id=None, lease_seconds=None):
+        """
+        原子领取一批任务
+        
+        使用单条 UPDATE 语句把可领取的任务标记为处理中并写入租约令牌，
+        多个进程或节点同时领取时同一任务只会被一个 worker 拿到。
+        领取顺序见 _schedule_order（优先级 + 教师/作业公平轮转 + 等待老化）。
+        
+        返回: (lease_token, 领取到的任务列表)
+        """
+        if limit <= 0:
+            return None, []
+        
+        now = datetime.utcnow()
+        token = str(uuid.uuid4())
+        lease_seconds = lease_seconds or AIGradingTask.LEASE_SECONDS
+        claimable = AIGradingTask._claimable_condition(now)
+        
+        candidate_ids = AIGradingTask._schedule_order(claimable, now).limit(limit).scalar_subquery()
+        
+        db.session.execute(
+            update(AIGradingTask)
+            .where(AIGradingTask.id.in_(candidate_ids), claimable)
+            .values(
+                status=AIGradingTask.STATUS_PROCESSING,
+                worker_id=worker_id or AIGradingTask.current_worker_id(),
+                lease_token=token,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                heartbeat_at=now,
+                started_at=now,
+                attempts=db.func.coalesce(AIGradingTask.attempts, 0) + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        
+        tasks = AIGradingTask.query.filter_by(lease_token=token).order_by(AIGradingTask.id.asc()).all()
+        return token, tasks
+    
+    @staticmethod
+    def renew_leases(task_ids, lease_tokens, lease_seconds=None):
+        """为仍由当前 worker 持有的任务续约，返回续约成功的任务数"""
+        if not task_ids:
+            return 0
+        
+        now = datetime.utcnow()
+        lease_seconds = lease_seconds or AIGradingTask.LEASE_SECONDS
+        result = db.session.execute(
+            update(AIGradingTask)
+            .where(
+                AIGradingTask.id.in_(list(task_ids)),
+                AIGradingTask.lease_token.in_(list(set(lease_tokens))),
+                AIGradingTask.status == AIGradingTask.STATUS_PROCESSING
+            )
+            .values(lease_expires_at=now + timedelta(seconds=lease_seconds), heartbeat_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount
+    
+    @staticmethod
+    def release_lease(task_id, lease_token, final_status):
+        """
+        以租约持有者身份结束任务
+        
+        返回: 是否仍持有租约（False 表示任务已被其他 worker 回收，本次结果应丢弃）
+        """
+        # 禁止自动 flush，避免会话中尚未提交的状态修改先于租约校验写入
+        with db.session.no_autoflush:
+            result = db.session.execute(
+                update(AIGradingTask)
+                .where(
+                    AIGradingTask.id == task_id,
+                    AIGradingTask.lease_token == lease_token,
+                    AIGradingTask.status == AIGradingTask.STATUS_PROCESSING
+                )
+                .values(status=final_status, lease_expires_at=None)
+                .execution_options(synchronize_session=False)
+            )
+        return result.rowcount == 1
+    
+    @staticmethod
+    def enqueue_batch(submissions, batch_id=None, chunk_size=150):
+        """
+        批量入队
+        
+        已有等待中/批改中任务的提交会被跳过，其余提交用多行 INSERT 一次写入，
+        避免逐条 add/commit。每个 INSERT 限制行数，防止超出 SQLite 参数上限。
+        
+        返回: (batch_id, 入队数量, 跳过数量)
+        """
+        batch_id = batch_id or str(uuid.uuid4())
+        submissions = list(submissions)
+        if not submissions:
+            return batch_id, 0, 0
+        
+        submission_ids = [s.id for s in submissions]
+        active_ids = set()
+        for i in range(0, len(submission_ids), 500):
+            active_ids.update(
+                row[0] for row in db.session.query(AIGradingTask.submission_id).filter(
+                    AIGradingTask.submission_id.in_(submission_ids[i:i + 500]),
+                    AIGradingTask.status.in_([AIGradingTask.STATUS_PENDING, AIGradingTask.STATUS_PROCESSING])
+                )
+            )
+        
+        pending = [s for s in submissions if s.id not in active_ids]
+        AIGradingTask._bulk_insert(pending, batch_id, chunk_size=chunk_size)
+        db.session.commit()
+        
+        return batch_id, len(pending), len(submissions) - len(pending)
+    
+    @staticmethod
+    def _bulk_insert(submissions, batch_id, status=None, chunk_size=150):
+        """用多行 INSERT 为提交批量创建任务（不提交会话）"""
+        now = datetime.utcnow()
+        rows = [{
+            'submission_id': s.id,
+            'assignment_id': s.assignment_id,
+            'student_id': s.student_id,
+            'status': AIGradingTask.STATUS_PENDING if status is None else status,
+            'attempts': 0,
+            'batch_id': batch_id,
+            'created_at': now
+        } for s in submissions]
+        
+        for i in range(0, len(rows), chunk_size):
+            db.session.execute(insert(AIGradingTask).values(rows[i:i + chunk_size]))
+        return len(rows)
+    
+    @staticmethod
+    def release_deferred(assignment_id, latest_only=True):
+        """
+        参考答案到位后，把作业下待参考答案的提交统一入队（模式2）
+        
+        - latest_only: 每个学生只批改最新一次提交，其余待处理记录作废
+        - 已有等待中/批改中/已完成任务的提交，以及已有 AI 评分的提交不会重复入队
+          （已完成任务可能已被归档或清除，以提交上的 ai_score 为准）
+        - 旧版本遗留、没有待处理记录的提交也会一并补建任务
+        
+        所有变更在同一个显式事务（BEGIN IMMEDIATE）内完成：引擎以自动提交模式运行，
+        不显式开启事务时作废和分批插入是各自独立提交的语句，中途出错会丢失或重复任务。
+        
+        返回: (batch_id, 入队数量, 作废的待处理记录数)
+        """
+        # 先结束会话中已有的事务，再在同一连接上开启写事务（读取也在事务内，保证一致）
+        db.session.commit()
+        db.session.execute(text('BEGIN IMMEDIATE'))
+        try:
+            result = AIGradingTask._release_deferred(assignment_id, latest_only)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return result
+    
+    @staticmethod
+    def _release_deferred(assignment_id, latest_only):
+        """release_deferred 的具体变更（在调用方开启的事务内执行，不提交会话）"""
+        from app.models.submission import Submission
+        
+        query = Submission.query.filter(
+            Submission.assignment_id == assignment_id,
+            Submission.student_id.isnot(None)
+        )
+        if latest_only:
+            latest_ids = db.session.query(db.func.max(Submission.id)).filter(
+                Submission.assignment_id == assignment_id,
+                Submission.student_id.isnot(None)
+            ).group_by(Submission.student_id)
+            query = query.filter(Submission.id.in_(latest_ids))
+        submissions = [s for s in query.all() if s.file_path]
+        
+        handled_ids = set(row[0] for row in db.session.query(AIGradingTask.submission_id).filter(
+            AIGradingTask.assignment_id == assignment_id,
+            AIGradingTask.status.in_([
+                AIGradingTask.STATUS_PENDING,
+                AIGradingTask.STATUS_PROCESSING,
+                AIGradingTask.STATUS_COMPLETED
+            ])
+        ))
+        handled_ids.update(s.id for s in submissions if s.ai_score is not None)
+        deferred_ids = set(row[0] for row in db.session.query(AIGradingTask.submission_id).filter(
+            AIGradingTask.assignment_id == assignment_id,
+            AIGradingTask.status == AIGradingTask.STATUS_DEFERRED
+        ))
+        
+        targets = [s for s in submissions if s.id not in handled_ids]
+        target_ids = [s.id for s in targets]
+        batch_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        
+        # 已有待处理记录的直接转为等待中，保留原创建时间（排队先后）
+        promoted_ids = [sid for sid in target_ids if sid in deferred_ids]
+        for i in range(0, len(promoted_ids), 500):
+            db.session.execute(
+                update(AIGradingTask)
+                .where(
+                    AIGradingTask.assignment_id == assignment_id,
+                    AIGradingTask.submission_id.in_(promoted_ids[i:i + 500]),
+                    AIGradingTask.status == AIGradingTask.STATUS_DEFERRED
+                )
+                .values(status=AIGradingTask.STATUS_PENDING, batch_id=batch_id)
+                .execution_options(synchronize_session=False)
+            )
+        
+        AIGradingTask._bulk_insert([s for s in targets if s.id not in deferred_ids], batch_id)
+        
+        # 剩余待处理记录（被更新提交取代或已有任务）作废
+        superseded = db.session.execute(
+            AIGradingTask.__table__.delete().where(
+                AIGradingTask.assignment_id == assignment_id,
+                AIGradingTask.status == AIGradingTask.STATUS_DEFERRED
+            )
+        ).rowcount
+        
+        return batch_id, len(targets), superseded
+    
+    @staticmethod
+    def get_batch_progress(batch_id):
+        """
+        汇总批量作业进度（单条 GROUP BY 查询）
+        
+        返回: {'total', 'pending', 'processing', 'completed', 'failed', 'finished', 'progress', 'done'}
+        """
+        counts = dict(
+            db.session.query(AIGradingTask.status, db.func.count(AIGradingTask.id))
+            .filter(AIGradingTask.batch_id == batch_id)
+            .group_by(AIGradingTask.status)
+            .all()
+        )
+        total = sum(counts.values())
+        finished = counts.get(AIGradingTask.STATUS_COMPLETED, 0) + counts.get(AIGradingTask.STATUS_FAILED, 0)
+        return {
+            'total': total,
+            'pending': counts.get(AIGradingTask.STATUS_PENDING, 0),
+            'processing': counts.get(AIGradingTask.STATUS_PROCESSING, 0),
+            'completed': counts.get(AIGradingTask.STATUS_COMPLETED, 0),
+            'failed': counts.get(AIGradingTask.STATUS_FAILED, 0),
+            'finished': finished,
+            'progress': round(finished * 100 / total, 1) if total else 100.0,
+            'done': finished == total
+        }
+    
+    def set_conversation(self, log):
+        """保存对话记录（压缩后写入独立表）"""
+        if self.conversation is None:
+            self.conversation = AIGradingConversation()
+        self.conversation.set_log(log)
+        self.conversation.created_at = datetime.utcnow()
+    
+    def clear_conversation(self):
+        """清除对话记录"""
+        self.conversation = None
+        self.conversation_log = None
+    
+    def get_conversation_log(self):
+        """读取对话记录（格式化的 JSON 文本），仅在查看详情时调用"""
+        if self.conversation is not None:
+            return json.dumps(self.conversation.get_log(), ensure_ascii=False, indent=2)
+        return self.conversation_log
+    
+    @staticmethod
+    def delete_tasks(task_ids):
+        """批量删除任务及其对话记录"""
+        task_ids = list(task_ids)
+        for i in range(0, len(task_ids), 500):
+            chunk = task_ids[i:i + 500]
+            AIGradingConversation.query.filter(
+                AIGradingConversation.task_id.in_(chunk)
+            ).delete(synchronize_session=False)
+            AIGradingTask.query.filter(AIGradingTask.id.in_(chunk)).delete(synchronize_session=False)
+        return len(task_ids)
+    
+    def reset_lease(self):
+        """清除租约信息（重新入队时使用）"""
+        self.worker_id = None
+        self.lease_token = None
+        self.lease_expires_at = None
+        self.heartbeat_at = None
+        self.attempts = 0
+    
+    def requeue(self, bypass_cache=False, priority=None):
+        """清除上次结果并重新入队（重试/重新评分，不提交会话）"""
+        self.status = AIGradingTask.STATUS_PENDING
+        self.score = None
+        self.feedback = None
+        self.error_message = None
+        self.clear_conversation()
+        self.started_at = None
+        self.completed_at = None
+        self.bypass_cache = bool(bypass_cache)
+        self.priority = AIGradingTask.PRIORITY_HIGH if priority is None else priority
+        self.reset_lease()
+    
     def __repr__(self):
         return f'<AIGradingTask {self.id} - {self.status_text}>'
 
 
+class AIGradingConversation(db.Model):
+    """AI 批改对话记录（zlib 压缩的紧凑 JSON，与任务表分离，列表查询不受其体积影响）"""
+    __tablename__ = 'ai_grading_conversation'
+    
+    task_id = db.Column(db.Integer, db.ForeignKey('ai_grading_task.id'), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def set_log(self, log):
+        """压缩保存对话记录（dict）"""
+        self.data = zlib.compress(
+            json.dumps(log, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 6
+        )
+    
+    def get_log(self):
+        """解压读取对话记录（dict）"""
+        return json.loads(zlib.decompress(self.data).decode('utf-8'))
+
+
 class AIGradingConfig(db.Model):
     """AI 批改配置（单例模式）"""
     __tablename__ = 'ai_grading_config'
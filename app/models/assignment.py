@@ -39,6 +39,8 @@ class Assignment(db.Model):
     reference_answer_original_filename = db.Column(db.String(255))  # 参考答案原始文件名
     reference_answer_file_path = db.Column(db.String(500))  # 参考答案文件路径
     reference_answer_file_size = db.Column(db.Integer)  # 参考答案文件大小
+    reference_answer_extracted = db.Column(db.Text)  # 参考答案文件提取出的文本（上传后后台预提取，AI 批改任务读取后回填，替换文件时失效）
+    reference_answer_extracted_at = db.Column(db.DateTime)  # 参考答案文本提取时间
     
     # 关系
     teacher = db.relationship('User', backref='assignments')
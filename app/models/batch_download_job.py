@@ -0,0 +1,42 @@
+"""批量下载打包任务模型"""
+import json
+from datetime import datetime
+from app.extensions import db
+
+
+class BatchDownloadJob(db.Model):
+    """批量下载打包任务（后台打包到临时目录，完成后在有效期内可多次下载/断点续传）"""
+    __tablename__ = 'batch_download_job'
+    
+    # 任务状态
+    STATUS_PENDING = 0
+    STATUS_RUNNING = 1
+    STATUS_DONE = 2
+    STATUS_FAILED = 3
+    
+    # 占用用户并发名额的状态
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    status = db.Column(db.Integer, default=STATUS_PENDING, index=True)
+    assignment_ids = db.Column(db.Text, nullable=False)       # 创建时确定的作业ID列表（JSON）
+    download_name = db.Column(db.String(255), nullable=False)  # 下载时的文件名
+    artifact_path = db.Column(db.String(500))                  # 打包完成的文件路径
+    file_size = db.Column(db.BigInteger)
+    total_files = db.Column(db.Integer)
+    error_message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # 打包过程中定期更新，长时间未更新视为进程已退出
+    finished_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, index=True)
+    
+    def get_assignment_ids(self):
+        return json.loads(self.assignment_ids or '[]')
+    
+    def set_assignment_ids(self, ids):
+        self.assignment_ids = json.dumps(list(ids))
+    
+    def __repr__(self):
+        return f'<BatchDownloadJob {self.id} user={self.user_id} status={self.status}>'
@@ -0,0 +1,124 @@
+"""缓存统计模型"""
+import atexit
+import threading
+import time
+from datetime import datetime
+from flask import current_app, has_app_context
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+
+
+class CacheStat(db.Model):
+    """缓存命中统计（按缓存名称汇总，所有 worker 共享）"""
+    __tablename__ = 'cache_stat'
+    
+    name = db.Column(db.String(50), primary_key=True)  # 缓存名称，如 extraction
+    hits = db.Column(db.Integer, default=0)             # 命中次数
+    misses = db.Column(db.Integer, default=0)           # 未命中次数
+    evictions = db.Column(db.Integer, default=0)        # 淘汰条目数
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # 计数先累加在进程内存中，按间隔批量写入数据库，避免每次读写缓存都争用 SQLite 写锁
+    FLUSH_INTERVAL = 30
+    
+    _pending = {}
+    _pending_lock = threading.Lock()
+    _last_flush = time.monotonic()
+    _app = None
+    
+    @staticmethod
+    def record(name, hits=0, misses=0, evictions=0):
+        """
+        累加计数
+        
+        只记在进程内存中；距上次写入超过 FLUSH_INTERVAL 秒时顺带写入数据库，
+        持有调度器的进程另有定时任务写入，进程退出时写入剩余计数。
+        """
+        with CacheStat._pending_lock:
+            counts = CacheStat._pending.setdefault(name, [0, 0, 0])
+            counts[0] += hits
+            counts[1] += misses
+            counts[2] += evictions
+            if CacheStat._app is None and has_app_context():
+                CacheStat._app = current_app._get_current_object()
+                atexit.register(CacheStat._flush_at_exit)
+            due = time.monotonic() - CacheStat._last_flush >= CacheStat.FLUSH_INTERVAL
+        if due:
+            CacheStat.flush()
+    
+    @staticmethod
+    def flush():
+        """
+        把进程内累计的计数写入数据库
+        
+        使用独立连接执行，不会提交调用方会话中尚未提交的修改；写入失败的计数留到下次。
+        返回: 写入的缓存名称数
+        """
+        with CacheStat._pending_lock:
+            pending = CacheStat._pending
+            CacheStat._pending = {}
+            CacheStat._last_flush = time.monotonic()
+        
+        written = 0
+        for name, (hits, misses, evictions) in pending.items():
+            try:
+                CacheStat._write(name, hits, misses, evictions)
+            except Exception:
+                with CacheStat._pending_lock:
+                    counts = CacheStat._pending.setdefault(name, [0, 0, 0])
+                    counts[0] += hits
+                    counts[1] += misses
+                    counts[2] += evictions
+                continue
+            written += 1
+        return written
+    
+    @staticmethod
+    def _flush_at_exit():
+        try:
+            with CacheStat._app.app_context():
+                CacheStat.flush()
+        except Exception:
+            pass
+    
+    @staticmethod
+    def _write(name, hits, misses, evictions):
+        """原子累加一个缓存的计数"""
+        table = CacheStat.__table__
+        stmt = update(table).where(table.c.name == name).values(
+            hits=table.c.hits + hits,
+            misses=table.c.misses + misses,
+            evictions=table.c.evictions + evictions,
+            updated_at=datetime.utcnow()
+        )
+        try:
+            with db.engine.begin() as conn:
+                if conn.execute(stmt).rowcount == 0:
+                    conn.execute(table.insert().values(
+                        name=name, hits=hits, misses=misses, evictions=evictions,
+                        updated_at=datetime.utcnow()
+                    ))
+        except IntegrityError:
+            # 其他 worker 同时插入了该行，改为累加
+            with db.engine.begin() as conn:
+                conn.execute(stmt)
+    
+    @staticmethod
+    def get_stats(name):
+        """获取指定缓存的统计数据（含本进程尚未写入的计数）"""
+        stat = CacheStat.query.get(name)
+        with CacheStat._pending_lock:
+            pending_hits, pending_misses, pending_evictions = CacheStat._pending.get(name, (0, 0, 0))
+        hits = (stat.hits if stat else 0) + pending_hits
+        misses = (stat.misses if stat else 0) + pending_misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': (stat.evictions if stat else 0) + pending_evictions,
+            'hit_rate': round(hits / total * 100, 1) if total else 0
+        }
+    
+    def __repr__(self):
+        return f'<CacheStat {self.name}: {self.hits}/{self.misses}>'
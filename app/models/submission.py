@@ -1,4 +1,5 @@
 """提交相关模型"""
+import zlib
 from datetime import datetime
 from flask import url_for
 from app.extensions import db
@@ -46,3 +47,45 @@ class Submission(db.Model):
     
     def __repr__(self):
         return f'<Submission {self.student_name} - Assignment {self.assignment_id}>'
+
+
+class SubmissionText(db.Model):
+    """提交文件的预提取文本（上传后在后台提取，zlib 压缩保存，AI 批改等直接使用）"""
+    __tablename__ = 'submission_text'
+    
+    # 提交来源
+    KIND_ASSIGNMENT = 'assignment'  # 普通作业提交（Submission）
+    KIND_STAGE = 'stage'            # 大作业阶段提交（StageSubmission）
+    KIND_REFERENCE = 'reference'    # 作业参考答案文件（submission_id 为作业ID）
+    
+    # 提取状态
+    STATUS_PENDING = 0
+    STATUS_PROCESSING = 1
+    STATUS_DONE = 2
+    STATUS_FAILED = 3
+    
+    kind = db.Column(db.String(20), primary_key=True)
+    submission_id = db.Column(db.Integer, primary_key=True)
+    file_path = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.Integer, default=STATUS_PENDING, index=True)
+    data = db.deferred(db.Column(db.LargeBinary))  # zlib 压缩的 UTF-8 文本
+    char_count = db.Column(db.Integer)
+    error_message = db.Column(db.Text)
+    extract_ms = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    extracted_at = db.Column(db.DateTime)
+    
+    def set_text(self, text):
+        """压缩保存提取文本"""
+        self.data = zlib.compress(text.encode('utf-8'), 6)
+        self.char_count = len(text)
+    
+    def get_text(self):
+        """解压读取提取文本，未提取返回 None"""
+        if self.data is None:
+            return None
+        return zlib.decompress(self.data).decode('utf-8')
+    
+    def __repr__(self):
+        return f'<SubmissionText {self.kind} {self.submission_id} status={self.status}>'
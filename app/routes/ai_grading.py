@@ -1,15 +1,31 @@
 """AI 自动评分相关路由"""
+from datetime import datetime
+
 from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 
 from app.extensions import db
-from app.models import Assignment, Submission
+from app.models import Assignment, Submission, AIGradingTask
 from app.services.ai_grading_service import AIGradingService
+from app.services.ai_queue_service import AIQueueService
 from app.utils.decorators import require_teacher_or_admin
 
 bp = Blueprint('ai_grading', __name__, url_prefix='/api/ai-grading')
 
 
+def _can_grade_assignment(assignment):
+    """检查当前用户是否有权限为该作业评分（与 can_manage_assignment 规则一致）"""
+    if current_user.is_super_admin:
+        return True
+    # 教师可以为自己创建的作业评分
+    if assignment.teacher_id == current_user.id:
+        return True
+    # 教师可以为自己负责班级的作业评分
+    if assignment.class_id and assignment.class_info in current_user.teaching_classes:
+        return True
+    return False
+
+
 @bp.route('/check-status', methods=['GET'])
 @login_required
 @require_teacher_or_admin
@@ -19,7 +35,8 @@ def check_api_status():
     return jsonify({
         'success': True,
         'available': is_available,
-        'message': message
+        'message': message,
+        'client_stats': AIGradingService.get_client_stats()
     })
 
 
@@ -38,14 +55,11 @@ def grade_submission(submission_id):
     assignment = submission.assignment
     
     # 权限检查：只有该作业的管理教师或超级管理员可以评分
-    if not current_user.is_super_admin:
-        # 检查是否有权限管理该作业
-        if hasattr(assignment, 'class_obj') and assignment.class_obj:
-            if assignment.class_obj not in current_user.teaching_classes:
-                return jsonify({
-                    'success': False,
-                    'message': '您没有权限为该作业评分'
-                }), 403
+    if not _can_grade_assignment(assignment):
+        return jsonify({
+            'success': False,
+            'message': '您没有权限为该作业评分'
+        }), 403
     
     # 获取评分参数
     data = request.get_json() or {}
@@ -100,13 +114,11 @@ def apply_ai_grade(submission_id):
     assignment = submission.assignment
     
     # 权限检查
-    if not current_user.is_super_admin:
-        if hasattr(assignment, 'class_obj') and assignment.class_obj:
-            if assignment.class_obj not in current_user.teaching_classes:
-                return jsonify({
-                    'success': False,
-                    'message': '您没有权限为该作业评分'
-                }), 403
+    if not _can_grade_assignment(assignment):
+        return jsonify({
+            'success': False,
+            'message': '您没有权限为该作业评分'
+        }), 403
     
     data = request.get_json()
     if not data:
@@ -135,9 +147,10 @@ def apply_ai_grade(submission_id):
         })
     
     # 更新提交记录
-    submission.score = score
+    submission.grade = score
     submission.feedback = comment
     submission.graded_by = current_user.id
+    submission.graded_at = datetime.utcnow()
     
     db.session.commit()
     
@@ -152,92 +165,198 @@ def apply_ai_grade(submission_id):
     })
 
 
+@bp.route('/regrade/<int:submission_id>', methods=['POST'])
+@login_required
+@require_teacher_or_admin
+def regrade_submission(submission_id):
+    """
+    立即重新 AI 评分单个提交
+    
+    以高优先级入队并跳过评分结果缓存：已结束的任务重新入队，等待中的任务提到队首，
+    没有任务时新建任务。批改中的任务不重复入队。
+    """
+    submission = Submission.query.get_or_404(submission_id)
+    assignment = submission.assignment
+    
+    if not _can_grade_assignment(assignment):
+        return jsonify({
+            'success': False,
+            'message': '您没有权限为该作业评分'
+        }), 403
+    
+    if not submission.file_path or not submission.student_id:
+        return jsonify({
+            'success': False,
+            'message': '该提交没有上传文件或未关联学生账号'
+        }), 400
+    
+    if assignment.ai_grading_mode == 2 and not (assignment.reference_answer or assignment.reference_answer_file_path):
+        return jsonify({
+            'success': False,
+            'message': '请先上传参考答案'
+        }), 400
+    
+    task = AIGradingTask.query.filter_by(submission_id=submission_id).order_by(AIGradingTask.id.desc()).first()
+    if task and task.status == AIGradingTask.STATUS_PROCESSING:
+        return jsonify({
+            'success': False,
+            'message': '该提交正在批改中'
+        }), 409
+    
+    if task is None:
+        task = AIGradingTask(
+            submission_id=submission.id,
+            assignment_id=assignment.id,
+            student_id=submission.student_id,
+            status=AIGradingTask.STATUS_PENDING,
+            bypass_cache=True,
+            priority=AIGradingTask.PRIORITY_HIGH
+        )
+        db.session.add(task)
+    elif task.status == AIGradingTask.STATUS_PENDING:
+        task.bypass_cache = True
+        task.priority = AIGradingTask.PRIORITY_HIGH
+    else:
+        task.requeue(bypass_cache=True)
+    db.session.commit()
+    AIQueueService.notify()
+    
+    current_app.logger.info(
+        f"[AI队列] 提交ID={submission_id} 由 {current_user.username} 发起立即重新评分，任务ID={task.id}"
+    )
+    
+    return jsonify({
+        'success': True,
+        'message': '已加入批改队列并优先处理',
+        'data': {'task_id': task.id}
+    })
+
+
 @bp.route('/batch-grade/<int:assignment_id>', methods=['POST'])
 @login_required
 @require_teacher_or_admin
 def batch_grade_assignment(assignment_id):
     """
-    批量为作业的所有未评分提交进行 AI 评分
+    批量为作业的提交创建 AI 批改任务
+    
+    请求只负责入队并立即返回 batch_id，实际批改由后台队列完成，
+    进度和结果通过 /batch-status/<batch_id> 查询。
+    评分标准和满分统一使用作业设置，不接受 grading_criteria / max_score 参数。
     
-    注意：这只是生成 AI 评分建议，不会直接保存
+    请求参数（可选）：
+    - only_ungraded: 是否只批改未评分的提交（默认 True）
     """
     assignment = Assignment.query.get_or_404(assignment_id)
     
-    # 权限检查
-    if not current_user.is_super_admin:
-        if hasattr(assignment, 'class_obj') and assignment.class_obj:
-            if assignment.class_obj not in current_user.teaching_classes:
-                return jsonify({
-                    'success': False,
-                    'message': '您没有权限为该作业评分'
-                }), 403
+    if not _can_grade_assignment(assignment):
+        return jsonify({
+            'success': False,
+            'message': '您没有权限为该作业评分'
+        }), 403
+    
+    data = request.get_json(silent=True) or {}
+    # 队列任务按作业设置评分，无法逐批覆盖评分标准和满分
+    unsupported = [key for key in ('grading_criteria', 'max_score') if data.get(key) is not None]
+    if unsupported:
+        return jsonify({
+            'success': False,
+            'message': f'批量评分使用作业设置的评分标准和满分，不支持参数：{", ".join(unsupported)}'
+        }), 400
     
-    data = request.get_json() or {}
-    grading_criteria = data.get('grading_criteria') or getattr(assignment, 'grading_criteria', None)
-    max_score = data.get('max_score', 100)
     only_ungraded = data.get('only_ungraded', True)  # 默认只评未评分的
     
     # 获取需要评分的提交
     query = Submission.query.filter_by(assignment_id=assignment_id)
     if only_ungraded:
-        query = query.filter(Submission.score.is_(None))
+        query = query.filter(Submission.grade.is_(None))
     
     submissions = query.all()
+    # 没有文件或未关联学生账号的提交无法入队
+    gradable = [s for s in submissions if s.file_path and s.student_id]
+    invalid_count = len(submissions) - len(gradable)
     
-    if not submissions:
+    if not gradable:
         return jsonify({
             'success': True,
             'message': '没有需要评分的提交',
-            'data': {'results': []}
+            'data': {'batch_id': None, 'enqueued': 0, 'skipped': invalid_count}
         })
     
-    results = []
-    success_count = 0
-    error_count = 0
-    
-    for submission in submissions:
-        if not submission.file_path:
-            results.append({
-                'submission_id': submission.id,
-                'student_name': submission.student.real_name if submission.student else '未知',
-                'success': False,
-                'error': '没有上传文件'
-            })
-            error_count += 1
-            continue
-        
-        result = AIGradingService.grade_submission_by_file(
-            assignment_title=assignment.title,
-            assignment_description=assignment.description,
-            grading_criteria=grading_criteria,
-            file_path=submission.file_path,
-            max_score=max_score
-        )
-        
-        if not result.get('success'):
-            results.append({
-                'submission_id': submission.id,
-                'student_name': submission.student.real_name if submission.student else '未知',
-                'success': False,
-                'error': result.get('error', 'AI 评分失败')
-            })
-            error_count += 1
-        else:
-            results.append({
-                'submission_id': submission.id,
-                'student_name': submission.student.real_name if submission.student else '未知',
-                'success': True,
-                'ai_score': result.get('score'),
-                'ai_comment': result.get('comment')
-            })
-            success_count += 1
+    batch_id, enqueued, skipped = AIGradingTask.enqueue_batch(gradable)
+    skipped += invalid_count
+    if enqueued:
+        AIQueueService.notify()
+    
+    current_app.logger.info(
+        f"[AI队列] 作业ID={assignment_id} 批量入队 {enqueued} 个任务，跳过 {skipped} 个，batch_id={batch_id}"
+    )
     
     return jsonify({
         'success': True,
-        'message': f'批量评分完成：成功 {success_count} 个，失败 {error_count} 个',
+        'message': f'已加入批改队列：{enqueued} 个，跳过 {skipped} 个',
         'data': {
-            'results': results,
-            'success_count': success_count,
-            'error_count': error_count
+            'batch_id': batch_id if enqueued else None,
+            'enqueued': enqueued,
+            'skipped': skipped
         }
+    }), 202
+
+
+@bp.route('/batch-status/<batch_id>', methods=['GET'])
+@login_required
+@require_teacher_or_admin
+def batch_grade_status(batch_id):
+    """
+    查询批量批改进度和结果
+    
+    查询参数（可选）：
+    - results: 是否返回已结束任务的结果列表（默认 1）
+    """
+    first_task = AIGradingTask.query.filter_by(batch_id=batch_id).first()
+    if not first_task:
+        return jsonify({
+            'success': False,
+            'message': '批量任务不存在'
+        }), 404
+    
+    # 批次内每个任务所属的作业都必须有权限
+    assignment_ids = [row[0] for row in db.session.query(AIGradingTask.assignment_id).filter(
+        AIGradingTask.batch_id == batch_id
+    ).distinct()]
+    assignments = Assignment.query.filter(Assignment.id.in_(assignment_ids)).all()
+    if len(assignments) != len(assignment_ids) or not all(_can_grade_assignment(a) for a in assignments):
+        return jsonify({
+            'success': False,
+            'message': '您没有权限查看该作业的评分'
+        }), 403
+    
+    data = AIGradingTask.get_batch_progress(batch_id)
+    data['batch_id'] = batch_id
+    data['assignment_id'] = first_task.assignment_id
+    
+    if request.args.get('results', 1, type=int):
+        rows = db.session.query(
+            AIGradingTask.submission_id,
+            AIGradingTask.status,
+            AIGradingTask.score,
+            AIGradingTask.feedback,
+            AIGradingTask.error_message,
+            Submission.student_name
+        ).join(Submission, Submission.id == AIGradingTask.submission_id).filter(
+            AIGradingTask.batch_id == batch_id,
+            AIGradingTask.status.in_([AIGradingTask.STATUS_COMPLETED, AIGradingTask.STATUS_FAILED])
+        ).order_by(AIGradingTask.id.asc()).all()
+        
+        data['results'] = [{
+            'submission_id': row.submission_id,
+            'student_name': row.student_name,
+            'success': row.status == AIGradingTask.STATUS_COMPLETED,
+            'ai_score': row.score,
+            'ai_comment': row.feedback,
+            'error': row.error_message
+        } for row in rows]
+    
+    return jsonify({
+        'success': True,
+        'data': data
     })
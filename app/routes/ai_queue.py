@@ -2,7 +2,7 @@
 from flask import Blueprint, render_template, jsonify, request
 from flask_login import login_required, current_user
 from datetime import timedelta
-from app.models import AIGradingTask, AIGradingConfig
+from app.models import AIGradingTask, AIGradingConfig, CacheStat
 from app.extensions import db
 from app.utils.decorators import super_admin_required
 
@@ -34,16 +34,32 @@ def index():
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     tasks = pagination.items
     
-    # 获取统计数据
-    total_tasks = AIGradingTask.query.count()
-    pending_count = AIGradingTask.query.filter_by(status=AIGradingTask.STATUS_PENDING).count()
-    processing_count = AIGradingTask.query.filter_by(status=AIGradingTask.STATUS_PROCESSING).count()
-    completed_count = AIGradingTask.query.filter_by(status=AIGradingTask.STATUS_COMPLETED).count()
-    failed_count = AIGradingTask.query.filter_by(status=AIGradingTask.STATUS_FAILED).count()
+    # 获取统计数据（单条 GROUP BY 查询）
+    status_counts = dict(
+        db.session.query(AIGradingTask.status, db.func.count(AIGradingTask.id))
+        .group_by(AIGradingTask.status)
+        .all()
+    )
+    total_tasks = sum(status_counts.values())
+    pending_count = status_counts.get(AIGradingTask.STATUS_PENDING, 0)
+    processing_count = status_counts.get(AIGradingTask.STATUS_PROCESSING, 0)
+    completed_count = status_counts.get(AIGradingTask.STATUS_COMPLETED, 0)
+    failed_count = status_counts.get(AIGradingTask.STATUS_FAILED, 0)
     
     # 获取配置
     config = AIGradingConfig.get_config()
     
+    # 等待中任务的预计开始时间（按公平调度顺序估算）
+    pending_ids = [t.id for t in tasks if t.status == AIGradingTask.STATUS_PENDING]
+    estimated_starts = AIGradingTask.estimate_start_times(config.max_concurrent, pending_ids) if pending_ids else {}
+    
+    # 文件内容提取缓存统计
+    extraction_cache_stats = CacheStat.get_stats('extraction')
+    # 评分结果缓存统计
+    response_cache_stats = CacheStat.get_stats('llm_response')
+    # 图片 OCR 缓存统计
+    ocr_cache_stats = CacheStat.get_stats('ocr')
+    
     return render_template('ai_queue/index.html',
                           tasks=tasks,
                           pagination=pagination,
@@ -53,10 +69,31 @@ def index():
                           completed_count=completed_count,
                           failed_count=failed_count,
                           config=config,
+                          extraction_cache_stats=extraction_cache_stats,
+                          response_cache_stats=response_cache_stats,
+                          ocr_cache_stats=ocr_cache_stats,
+                          estimated_starts=estimated_starts,
                           status_filter=status_filter,
                           timedelta=timedelta)
 
 
+@ai_queue_bp.route('/metrics')
+@login_required
+@super_admin_required
+def metrics():
+    """
+    AI 批改分阶段耗时指标（JSON）
+    
+    查询参数：
+    - hours: 统计时间窗口（小时，默认24）
+    """
+    hours = min(max(request.args.get('hours', 24, type=int), 1), 24 * 30)
+    return jsonify({
+        'success': True,
+        'data': AIGradingTask.get_metrics(hours)
+    })
+
+
 @ai_queue_bp.route('/config', methods=['POST'])
 @login_required
 @super_admin_required
@@ -105,7 +142,7 @@ def task_detail(task_id):
             'score': task.score,
             'feedback': task.feedback,
             'error_message': task.error_message,
-            'conversation_log': task.conversation_log,
+            'conversation_log': task.get_conversation_log(),
             'created_at': (task.created_at + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S') if task.created_at else None,
             'started_at': (task.started_at + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S') if task.started_at else None,
             'completed_at': (task.completed_at + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S') if task.completed_at else None
@@ -117,8 +154,14 @@ def task_detail(task_id):
 @login_required
 @super_admin_required
 def retry_task(task_id):
-    """重试失败的任务或重新评分已完成的任务"""
+    """
+    重试失败的任务或重新评分已完成的任务
+    
+    请求参数（可选）：
+    - bypass_cache: 跳过评分结果缓存，强制重新调用 AI
+    """
     task = AIGradingTask.query.get_or_404(task_id)
+    data = request.get_json(silent=True) or {}
     
     if task.status not in [AIGradingTask.STATUS_FAILED, AIGradingTask.STATUS_COMPLETED]:
         return jsonify({
@@ -126,22 +169,41 @@ def retry_task(task_id):
             'message': '只能重试失败或已完成的任务'
         }), 400
     
-    # 重置任务状态
-    task.status = AIGradingTask.STATUS_PENDING
-    task.score = None
-    task.feedback = None
-    task.error_message = None
-    task.conversation_log = None
-    task.started_at = None
-    task.completed_at = None
+    # 重置任务状态，手动重试/重新评分的单个任务优先处理
+    task.requeue(bypass_cache=data.get('bypass_cache'))
     db.session.commit()
     
+    from app.services.ai_queue_service import AIQueueService
+    AIQueueService.notify()
+    
     return jsonify({
         'success': True,
         'message': '任务已重新加入队列'
     })
 
 
+@ai_queue_bp.route('/task/<int:task_id>/prioritize', methods=['POST'])
+@login_required
+@super_admin_required
+def prioritize_task(task_id):
+    """等待中的任务插队优先处理"""
+    task = AIGradingTask.query.get_or_404(task_id)
+    
+    if task.status != AIGradingTask.STATUS_PENDING:
+        return jsonify({
+            'success': False,
+            'message': '只能调整等待中任务的优先级'
+        }), 400
+    
+    task.priority = AIGradingTask.PRIORITY_HIGH
+    db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'message': '任务已设为优先处理'
+    })
+
+
 @ai_queue_bp.route('/task/<int:task_id>', methods=['DELETE'])
 @login_required
 @super_admin_required
@@ -163,7 +225,8 @@ def delete_task(task_id):
 @super_admin_required
 def clear_completed():
     """清除已完成的任务"""
-    deleted = AIGradingTask.query.filter_by(status=AIGradingTask.STATUS_COMPLETED).delete()
+    task_ids = [row[0] for row in db.session.query(AIGradingTask.id).filter_by(status=AIGradingTask.STATUS_COMPLETED)]
+    deleted = AIGradingTask.delete_tasks(task_ids)
     db.session.commit()
     
     return jsonify({
@@ -1,5 +1,5 @@
 """作业管理路由"""
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from collections import defaultdict
@@ -129,19 +129,6 @@ def create_assignment():
         grading_criteria = request.form.get('grading_criteria', '')
         reference_answer = request.form.get('reference_answer', '')
         
-        # 处理参考答案文件上传
-        ref_answer_filename = None
-        ref_answer_original_filename = None
-        ref_answer_file_path = None
-        ref_answer_file_size = None
-        
-        if ai_grading_mode in [1, 2] and 'reference_answer_file' in request.files:
-            ref_file = request.files['reference_answer_file']
-            if ref_file and ref_file.filename:
-                # 保存参考答案文件
-                ref_answer_filename, ref_answer_original_filename, ref_answer_file_path, ref_answer_file_size = \
-                    FileService.save_reference_answer(ref_file)
-        
         assignment = Assignment(
             title=title,
             description=description,
@@ -158,16 +145,23 @@ def create_assignment():
             # AI 自动改卷相关字段
             ai_grading_mode=ai_grading_mode,
             grading_criteria=grading_criteria if grading_criteria else None,
-            reference_answer=reference_answer if reference_answer else None,
-            reference_answer_filename=ref_answer_filename,
-            reference_answer_original_filename=ref_answer_original_filename,
-            reference_answer_file_path=ref_answer_file_path,
-            reference_answer_file_size=ref_answer_file_size
+            reference_answer=reference_answer if reference_answer else None
         )
         
+        # 处理参考答案文件上传（提交后登记后台预提取）
+        if ai_grading_mode in [1, 2] and 'reference_answer_file' in request.files:
+            ref_file = request.files['reference_answer_file']
+            if ref_file and ref_file.filename:
+                FileService.replace_reference_answer(assignment, ref_file)
+        
         db.session.add(assignment)
         db.session.commit()
         
+        if assignment.reference_answer_file_path:
+            from app.models import SubmissionText
+            from app.services.extraction_service import ExtractionService
+            ExtractionService.schedule(SubmissionText.KIND_REFERENCE, assignment.id, assignment.reference_answer_file_path)
+        
         # 记录创建作业日志
         class_name = Class.query.get(class_id).name if class_id else '公共'
         LogService.log_operation(
@@ -438,6 +432,14 @@ def edit_assignment(assignment_id):
                 assignment.attachment_file_path = attachment_file_path
                 assignment.attachment_file_size = attachment_file_size
         
+        # 处理参考答案文件替换（旧文件的提取文本随之失效；旧文件在保存成功后删除）
+        reference_uploaded = False
+        old_reference_path = None
+        if assignment.ai_grading_mode in [1, 2] and 'reference_answer_file' in request.files:
+            ref_file = request.files['reference_answer_file']
+            if ref_file and ref_file.filename:
+                reference_uploaded, old_reference_path = FileService.replace_reference_answer(assignment, ref_file)
+        
         # 检查是否需要删除附件
         if 'delete_attachment' in request.form and request.form['delete_attachment'] == 'on':
             if assignment.attachment_file_path:
@@ -531,6 +533,28 @@ def edit_assignment(assignment_id):
         
         db.session.commit()
         
+        if old_reference_path:
+            FileService.delete_file(old_reference_path)
+        
+        # 新参考答案文件在后台提取文本，不阻塞请求
+        if reference_uploaded:
+            from app.models import SubmissionText
+            from app.services.extraction_service import ExtractionService
+            ExtractionService.schedule(SubmissionText.KIND_REFERENCE, assignment.id, assignment.reference_answer_file_path)
+        
+        # 模式2：参考答案到位，待参考答案的提交统一入队
+        if reference_uploaded and assignment.ai_grading_mode == 2:
+            from app.models import AIGradingTask
+            latest_only = request.form.get('ai_latest_only') == 'on'
+            _, enqueued, superseded = AIGradingTask.release_deferred(assignment.id, latest_only=latest_only)
+            current_app.logger.info(
+                f"[AI队列] 作业ID={assignment.id} 参考答案已上传，批量入队 {enqueued} 个任务，作废 {superseded} 条待处理记录"
+            )
+            if enqueued:
+                from app.services.ai_queue_service import AIQueueService
+                AIQueueService.notify()
+                flash(f'参考答案已上传，{enqueued} 份提交已加入 AI 批改队列')
+        
         # 记录编辑作业日志
         LogService.log_operation(
             operation_type='update',
@@ -588,6 +612,10 @@ def delete_assignment(assignment_id):
     db.session.delete(assignment)
     db.session.commit()
     
+    # 删除作业压缩包缓存
+    from app.services.download_archive_service import DownloadArchiveService
+    DownloadArchiveService.invalidate_assignment_cache(assignment_id)
+    
     # 记录删除作业日志
     LogService.log_operation(
         operation_type='delete',
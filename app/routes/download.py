@@ -1,16 +1,15 @@
 """批量下载相关路由"""
 import os
-import time
-import zipfile
-from io import BytesIO
-from flask import Blueprint, request, redirect, url_for, flash, send_file, jsonify, session
+from flask import Blueprint, request, redirect, url_for, flash, send_file, jsonify, Response, stream_with_context, current_app
 from flask_login import login_required, current_user
 
 from app.extensions import db
 from app.models import Assignment, Submission, Class
-from app.utils import safe_chinese_filename, to_beijing_time
+from app.utils import safe_chinese_filename
 from app.utils.decorators import require_teacher_or_admin
 from app.utils.progress_tracker import progress_tracker  # 导入进度跟踪器
+from app.utils.zip_stream import iter_zip_stream, attachment_headers, CompressionPolicy
+from app.services.download_archive_service import DownloadArchiveService
 
 bp = Blueprint('download', __name__, url_prefix='/admin')
 
@@ -39,18 +38,58 @@ def can_manage_assignment(user, assignment):
 @require_teacher_or_admin
 def download_assignment_status(assignment_id):
     """获取下载进度"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
     # 使用进度跟踪器获取进度（支持多worker环境）
     progress_key = f'assignment_{assignment_id}'
     progress = progress_tracker.get_progress(current_user.id, progress_key)
-    
-    logger.warning(f"[单个作业下载] 查询进度: 作业ID={assignment_id}, 用户ID={current_user.id}, 进度={progress.get('progress')}%, 状态={progress.get('status')}")
-    
     return jsonify(progress)
 
 
+def send_archive_file(path, download_name):
+    """
+    发送已生成的压缩包文件
+    
+    由 WSGI 服务器零拷贝发送（sendfile），支持 Range 断点续传。
+    """
+    response = send_file(
+        path,
+        as_attachment=True,
+        download_name=download_name,
+        mimetype='application/zip',
+        conditional=True,
+        max_age=0
+    )
+    # werkzeug 只在范围请求的响应中声明，完整下载时也声明以便浏览器中断后续传
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def stream_zip_response(entries, zip_filename, on_entry=None, on_complete=None, on_error=None, chunks=None):
+    """
+    边压缩边发送的 ZIP 下载响应（内存占用与压缩包大小无关）
+    
+    entries: [(源文件路径, 压缩包内文件名), ...]
+    chunks: 可选，已准备好的压缩包内容生成器（如边发送边写缓存），指定时忽略 entries
+    开始发送后无法再重定向，出错时调用 on_error 并中断连接，浏览器会显示下载失败。
+    """
+    if chunks is None:
+        chunks = iter_zip_stream(entries, policy=CompressionPolicy.from_config(current_app.config), on_entry=on_entry)
+    
+    def generate():
+        try:
+            yield from chunks
+        except Exception as e:
+            if on_error:
+                on_error(e)
+            raise
+        if on_complete:
+            on_complete()
+    
+    headers = attachment_headers(zip_filename)
+    # 禁止反向代理缓冲，数据块到达即转发
+    headers['X-Accel-Buffering'] = 'no'
+    return Response(stream_with_context(generate()), mimetype='application/zip', headers=headers)
+
+
 @bp.route('/assignment/<int:assignment_id>/download')
 @login_required
 @require_teacher_or_admin
@@ -79,131 +118,91 @@ def download_assignment(assignment_id):
     logger.warning(f"[单个作业下载] 提交数: {len(submissions)}")
     
     # 进度跟踪键
+    user_id = current_user.id
     progress_key = f'assignment_{assignment_id}'
     
     # 初始化进度（使用进度跟踪器）
-    progress_tracker.set_progress(current_user.id, {
+    progress_tracker.set_progress(user_id, {
         'status': 'processing',
         'progress': 0,
         'message': '正在检查文件...',
         'total_files': len(submissions)
     }, progress_key)
     
-    # 创建内存ZIP文件
-    memory_file = BytesIO()
-    
-    try:
-        # 使用最高压缩级别
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
-            processed_files = 0
-            # 统计存在的文件数
-            existing_files = []
-            for s in submissions:
-                if os.path.isabs(s.file_path):
-                    # 已经是绝对路径，直接使用
-                    file_path = s.file_path
-                else:
-                    # 相对路径，需要转换为绝对路径
-                    # 检查是否已经包含storage前缀
-                    if s.file_path.startswith('storage/'):
-                        # 已包含storage前缀，直接加/app前缀
-                        file_path = os.path.join('/app', s.file_path)
-                    else:
-                        # 不包含storage前缀，加/app/storage前缀
-                        file_path = os.path.join('/app/storage', s.file_path)
-                
-                logger.warning(f"[单个作业下载] 检查文件: {s.student_name} - {s.original_filename}")
-                logger.warning(f"[单个作业下载] 原始路径: {s.file_path}")
-                logger.warning(f"[单个作业下载] 转换路径: {file_path}")
-                logger.warning(f"[单个作业下载] 文件存在: {os.path.exists(file_path)}")
-                
-                if os.path.exists(file_path):
-                    existing_files.append((s, file_path))
-                else:
-                    logger.warning(f"[单个作业下载] 文件不存在，跳过: {file_path}")
-            
-            total_files = len(existing_files)
-            logger.warning(f"[单个作业下载] 实际存在的文件数: {total_files}/{len(submissions)}")
-            
-            for i, (submission, file_path) in enumerate(existing_files):
-                    # 更新进度（使用进度跟踪器）
-                    progress_percent = int((processed_files / total_files) * 100) if total_files > 0 else 0
-                    progress_tracker.set_progress(current_user.id, {
-                        'status': 'processing',
-                        'progress': progress_percent,
-                        'message': f'正在压缩文件: {submission.original_filename}',
-                        'current_file': processed_files + 1,
-                        'total_files': total_files
-                    }, progress_key)
-                    
-                    logger.warning(f"[单个作业下载] 处理文件 {processed_files + 1}/{total_files}: {submission.original_filename}")
-                    
-                    # 创建文件在ZIP中的路径：学生姓名_学号_提交时间_原文件名
-                    beijing_time = to_beijing_time(submission.submitted_at)
-                    time_str = beijing_time.strftime('%Y%m%d_%H%M%S') if beijing_time else 'unknown'
-                    
-                    safe_student_name = safe_chinese_filename(submission.student_name)
-                    safe_original_name = safe_chinese_filename(submission.original_filename)
-                    
-                    zip_filename = f"{safe_student_name}_{submission.student_number}_{time_str}_{safe_original_name}"
-                    
-                    # 添加文件到ZIP（使用完整路径）
-                    zf.write(file_path, zip_filename)
-                    processed_files += 1
-                    
-                    # 模拟小延迟，让进度条更可见（仅在文件少时）
-                    if total_files < 10:
-                        time.sleep(0.1)
+    # 统计存在的文件数
+    existing_files = []
+    for s in submissions:
+        file_path = DownloadArchiveService.submission_path(s)
         
-        # 完成压缩
+        if os.path.exists(file_path):
+            existing_files.append((s.original_filename, file_path, DownloadArchiveService.submission_zip_name(s), s.id))
+        else:
+            logger.warning(f"[单个作业下载] 文件不存在，跳过: {file_path}")
+    
+    total_files = len(existing_files)
+    logger.warning(f"[单个作业下载] 实际存在的文件数: {total_files}/{len(submissions)}")
+    
+    # 生成ZIP文件名：班级-作业标题-作业创建时间.zip
+    zip_filename = f"{DownloadArchiveService.assignment_archive_name(assignment)}.zip"
+    
+    def on_entry(index, file_path, arcname):
+        # 更新进度（使用进度跟踪器）
+        original_filename = existing_files[index][0]
+        progress_tracker.set_progress(user_id, {
+            'status': 'processing',
+            'progress': int((index / total_files) * 100),
+            'message': f'正在压缩文件: {original_filename}',
+            'current_file': index + 1,
+            'total_files': total_files
+        }, progress_key)
+    
+    def on_complete():
+        # 不立即清理进度记录，让前端有时间读取到completed状态，由超时机制自动清理
         logger.warning(f"[单个作业下载] 压缩完成，共处理 {total_files} 个文件")
-        
-        progress_tracker.set_progress(current_user.id, {
+        progress_tracker.set_progress(user_id, {
             'status': 'completed',
             'progress': 100,
-            'message': '压缩完成，准备下载...',
+            'message': '压缩完成，文件已发送',
             'total_files': total_files
         }, progress_key)
-        
-        memory_file.seek(0)
-        
-        # 生成ZIP文件名：班级-作业标题-作业创建时间.zip
-        beijing_created = to_beijing_time(assignment.created_at)
-        created_time_str = beijing_created.strftime('%Y%m%d%H%M%S') if beijing_created else 'unknown'
-        
-        if assignment.class_info:
-            class_name = safe_chinese_filename(assignment.class_info.name)
-        else:
-            class_name = '公共作业'
-        
-        safe_title = safe_chinese_filename(assignment.title)
-        zip_filename = f"{class_name}-{safe_title}-{created_time_str}.zip"
-        
-        # 不立即清理进度记录，让前端有时间读取到completed状态
-        logger.warning(f"[单个作业下载] 开始下载文件: {zip_filename}")
-        # progress_tracker.clear_progress(current_user.id, progress_key)  # 不在这里清理，由超时机制自动清理
-        
-        return send_file(
-            memory_file,
-            as_attachment=True,
-            download_name=zip_filename,
-            mimetype='application/zip'
-        )
-        
-    except Exception as e:
-        # 错误处理
+    
+    def on_error(e):
         logger.error(f"[单个作业下载] 下载失败: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
-        
-        progress_tracker.set_progress(current_user.id, {
+        progress_tracker.set_progress(user_id, {
             'status': 'error',
             'progress': 0,
             'message': f'压缩失败: {str(e)}'
         }, progress_key)
-        
-        flash(f'下载失败: {str(e)}')
+    
+    # 提交未变化时直接发送缓存的压缩包（只有新提交时先追加到缓存）
+    try:
+        cache_path, chunks = DownloadArchiveService.cached_assignment_archive(
+            assignment_id,
+            [(submission_id, file_path, arcname) for _, file_path, arcname, submission_id in existing_files],
+            CompressionPolicy.from_config(current_app.config),
+            on_entry=on_entry
+        )
+    except Exception as e:
+        on_error(e)
+        flash(f'压缩失败: {str(e)}')
         return redirect(url_for('assignment.view_submissions', assignment_id=assignment_id))
+    
+    if cache_path:
+        logger.warning(f"[单个作业下载] 使用缓存的压缩包: {zip_filename}")
+        on_complete()
+        return send_archive_file(cache_path, zip_filename)
+    
+    logger.warning(f"[单个作业下载] 开始下载文件: {zip_filename}")
+    return stream_zip_response(
+        [(file_path, arcname) for _, file_path, arcname, _ in existing_files],
+        zip_filename,
+        on_entry=on_entry,
+        on_complete=on_complete,
+        on_error=on_error,
+        chunks=chunks
+    )
 
 
 @bp.route('/assignment/<int:assignment_id>/attachment')
@@ -321,14 +320,19 @@ def download_assignment_attachment(assignment_id):
 @require_teacher_or_admin
 def batch_download_status():
     """获取批量下载进度"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    # 使用进度跟踪器从文件系统读取进度
-    progress = progress_tracker.get_progress(current_user.id)
-    
-    logger.warning(f"[批量下载进度] 用户ID: {current_user.id}, 状态: {progress.get('status')}, 进度: {progress.get('progress')}%, 消息: {progress.get('message')}")
-    
+    from app.models import BatchDownloadJob
+    
+    # 任务仍在排队或打包（心跳未超时）时以任务状态为准，不按进度记录的更新时间判断超时
+    job = DownloadArchiveService.get_live_job(current_user.id)
+    progress = progress_tracker.get_progress(current_user.id, check_stale=job is None)
+    if job is not None and progress.get('status') not in ('pending', 'processing') and not progress.get('download_ready'):
+        pending = job.status == BatchDownloadJob.STATUS_PENDING
+        progress = {
+            'status': 'pending' if pending else 'processing',
+            'progress': 0 if pending else progress.get('progress', 0),
+            'message': '已加入打包队列，等待开始...' if pending else '正在打包...',
+            'job_id': job.id
+        }
     return jsonify(progress)
 
 
@@ -342,16 +346,12 @@ def clear_batch_download_progress():
     
     logger.warning(f"[批量下载] 用户 {current_user.id} 请求清理进度记录")
     
-    # 清理进度文件
-    progress_tracker.clear_progress(current_user.id)
+    # 仍有任务在打包时保留进度，页面可以继续显示
+    if DownloadArchiveService.has_active_job(current_user.id):
+        return jsonify({'success': True, 'message': '仍有批量下载正在打包，保留进度记录'})
     
-    # 同时清理ZIP数据（仍然存储在session中）
-    zip_key = f'batch_download_zip_{current_user.id}'
-    filename_key = f'batch_download_filename_{current_user.id}'
-    if zip_key in session:
-        session.pop(zip_key)
-    if filename_key in session:
-        session.pop(filename_key)
+    # 清理进度文件（打包好的压缩包保留到过期，可重复下载）
+    progress_tracker.clear_progress(current_user.id)
     
     return jsonify({'success': True, 'message': '进度记录已清理'})
 
@@ -360,37 +360,13 @@ def clear_batch_download_progress():
 @login_required
 @require_teacher_or_admin
 def download_batch_file():
-    """下载批量打包的ZIP文件"""
-    zip_key = f'batch_download_zip_{current_user.id}'
-    filename_key = f'batch_download_filename_{current_user.id}'
-    
-    if zip_key not in session or filename_key not in session:
+    """下载批量打包的ZIP文件（支持 Range 断点续传，有效期内可重复下载）"""
+    job = DownloadArchiveService.get_artifact(current_user.id, request.args.get('job_id', type=int))
+    if job is None:
         flash('批量下载文件不存在或已过期')
         return redirect(url_for('download.batch_download_assignments'))
     
-    # 从 session 中获取 ZIP 数据
-    import base64
-    zip_data_b64 = session[zip_key]
-    zip_filename = session[filename_key]
-    
-    # 解码
-    zip_data = base64.b64decode(zip_data_b64)
-    
-    # 创建 BytesIO 对象
-    from io import BytesIO
-    memory_file = BytesIO(zip_data)
-    memory_file.seek(0)
-    
-    # 清理 session 中的数据
-    session.pop(zip_key)
-    session.pop(filename_key)
-    
-    return send_file(
-        memory_file,
-        as_attachment=True,
-        download_name=zip_filename,
-        mimetype='application/zip'
-    )
+    return send_archive_file(job.artifact_path, job.download_name)
 
 
 @bp.route('/assignment/<int:assignment_id>/download_makeup_submissions')
@@ -423,87 +399,37 @@ def download_makeup_submissions(assignment_id):
     logger.warning(f"[补交下载] 作业ID: {assignment_id}, 作业标题: {assignment.title}")
     logger.warning(f"[补交下载] 补交提交数: {len(makeup_submissions)}")
     
-    # 创建内存ZIP文件
-    memory_file = BytesIO()
-    
-    try:
-        # 使用最高压缩级别
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
-            processed_files = 0
-            # 统计存在的文件数
-            existing_files = []
-            for s in makeup_submissions:
-                if os.path.isabs(s.file_path):
-                    file_path = s.file_path
-                else:
-                    if s.file_path.startswith('storage/'):
-                        file_path = os.path.join('/app', s.file_path)
-                    else:
-                        file_path = os.path.join('/app/storage', s.file_path)
-                
-                logger.warning(f"[补交下载] 检查文件: {s.student_name} - {s.original_filename}")
-                logger.warning(f"[补交下载] 原始路径: {s.file_path}")
-                logger.warning(f"[补交下载] 转换路径: {file_path}")
-                logger.warning(f"[补交下载] 文件存在: {os.path.exists(file_path)}")
-                
-                if os.path.exists(file_path):
-                    existing_files.append((s, file_path))
-                else:
-                    logger.warning(f"[补交下载] 文件不存在，跳过: {file_path}")
-            
-            total_files = len(existing_files)
-            logger.warning(f"[补交下载] 实际存在的文件数: {total_files}/{len(makeup_submissions)}")
-            
-            for i, (submission, file_path) in enumerate(existing_files):
-                logger.warning(f"[补交下载] 处理文件 {processed_files + 1}/{total_files}: {submission.original_filename}")
-                
-                # 创建文件在ZIP中的路径：学生姓名_学号_提交时间_原文件名
-                beijing_time = to_beijing_time(submission.submitted_at)
-                time_str = beijing_time.strftime('%Y%m%d_%H%M%S') if beijing_time else 'unknown'
-                
-                safe_student_name = safe_chinese_filename(submission.student_name)
-                safe_original_name = safe_chinese_filename(submission.original_filename)
-                
-                zip_filename = f"{safe_student_name}_{submission.student_number}_{time_str}_{safe_original_name}"
-                
-                # 添加文件到ZIP（使用完整路径）
-                zf.write(file_path, zip_filename)
-                processed_files += 1
-        
-        # 完成压缩
-        logger.warning(f"[补交下载] 压缩完成，共处理 {total_files} 个文件")
-        
-        memory_file.seek(0)
+    # 统计存在的文件数
+    existing_files = []
+    for s in makeup_submissions:
+        file_path = DownloadArchiveService.submission_path(s)
         
-        # 生成ZIP文件名：班级-作业标题-补交作业-时间.zip
-        beijing_created = to_beijing_time(assignment.created_at)
-        created_time_str = beijing_created.strftime('%Y%m%d%H%M%S') if beijing_created else 'unknown'
-        
-        if assignment.class_info:
-            class_name = safe_chinese_filename(assignment.class_info.name)
+        if os.path.exists(file_path):
+            existing_files.append((s.original_filename, file_path, DownloadArchiveService.submission_zip_name(s)))
         else:
-            class_name = '公共作业'
-        
-        safe_title = safe_chinese_filename(assignment.title)
-        zip_filename = f"{class_name}-{safe_title}-补交作业-{created_time_str}.zip"
-        
-        logger.warning(f"[补交下载] 开始下载文件: {zip_filename}")
-        
-        return send_file(
-            memory_file,
-            as_attachment=True,
-            download_name=zip_filename,
-            mimetype='application/zip'
-        )
-        
-    except Exception as e:
-        # 错误处理
+            logger.warning(f"[补交下载] 文件不存在，跳过: {file_path}")
+    
+    total_files = len(existing_files)
+    logger.warning(f"[补交下载] 实际存在的文件数: {total_files}/{len(makeup_submissions)}")
+    
+    # 生成ZIP文件名：班级-作业标题-补交作业-时间.zip
+    zip_filename = f"{DownloadArchiveService.assignment_archive_name(assignment, '补交作业')}.zip"
+    
+    def on_complete():
+        logger.warning(f"[补交下载] 压缩完成，共处理 {total_files} 个文件")
+    
+    def on_error(e):
         logger.error(f"[补交下载] 下载失败: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
-        
-        flash(f'下载失败: {str(e)}')
-        return redirect(url_for('assignment.makeup_grading', assignment_id=assignment_id))
+    
+    logger.warning(f"[补交下载] 开始下载文件: {zip_filename}")
+    return stream_zip_response(
+        [(file_path, arcname) for _, file_path, arcname in existing_files],
+        zip_filename,
+        on_complete=on_complete,
+        on_error=on_error
+    )
 
 
 @bp.route('/assignments/batch_download', methods=['GET', 'POST'])
@@ -542,17 +468,8 @@ def batch_download_assignments():
     logger.warning(f"[批量下载] ===== 开始批量下载 =====")
     logger.warning(f"[批量下载] 用户ID: {current_user.id}, 用户名: {current_user.username}")
     logger.warning(f"[批量下载] 下载类型: {download_type}")
-    
-    # 初始化进度（使用进度跟踪器）
-    logger.warning(f"[批量下载] 初始化进度为 10%")
-    progress_tracker.set_progress(current_user.id, {
-        'status': 'processing',
-        'progress': 10,
-        'message': '正在检查作业...',
-        'total_assignments': 0,
-        'current_assignment': 0
-    })
-    
+
+    # 并发名额由 create_batch_job 原子检查；登记成功前不写进度，避免覆盖进行中任务的进度
     if download_type == 'all':
         # 下载所有作业
         if current_user.is_super_admin:
@@ -596,132 +513,25 @@ def batch_download_assignments():
     
     if not assignments:
         logger.warning(f"[批量下载] 错误：没有找到任何作业")
-        progress_tracker.set_progress(current_user.id, {
-            'status': 'error',
-            'progress': 0,
-            'message': '没有找到任何作业'
-        })
         flash('没有找到任何作业')
         return redirect(url_for('download.batch_download_assignments'))
     
     logger.warning(f"[批量下载] 找到 {len(assignments)} 个作业")
     
-    # 创建内存ZIP文件
-    memory_file = BytesIO()
+    # 登记后台打包任务，不在请求中压缩
+    job, error = DownloadArchiveService.create_batch_job(current_user.id, [a.id for a in assignments], zip_filename)
+    if job is None:
+        logger.warning(f"[批量下载] 拒绝：{error}")
+        return jsonify({'success': False, 'message': error}), 429
     
-    try:
-        logger.warning(f"[批量下载] 开始创建ZIP文件")
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
-            for assignment_index, assignment in enumerate(assignments):
-                # 更新当前作业进度
-                assignment_progress = int((assignment_index / len(assignments)) * 100)
-                logger.warning(f"[批量下载] 处理作业 {assignment_index + 1}/{len(assignments)}: {assignment.title}, 进度: {assignment_progress}%")
-                
-                progress_tracker.set_progress(current_user.id, {
-                    'status': 'processing',
-                    'progress': assignment_progress,
-                    'message': f'正在处理作业: {assignment.title}',
-                    'current_assignment': assignment_index + 1,
-                    'total_assignments': len(assignments)
-                })
-                
-                submissions = Submission.query.filter_by(assignment_id=assignment.id).all()
-                logger.warning(f"[批量下载] 作业 '{assignment.title}' 有 {len(submissions)} 个提交")
-                
-                if submissions:
-                    # 为每个作业创建文件夹
-                    beijing_created = to_beijing_time(assignment.created_at)
-                    created_time_str = beijing_created.strftime('%Y%m%d%H%M%S') if beijing_created else 'unknown'
-                    
-                    if assignment.class_info:
-                        class_name = safe_chinese_filename(assignment.class_info.name)
-                    else:
-                        class_name = '公共作业'
-                    
-                    safe_title = safe_chinese_filename(assignment.title)
-                    assignment_folder = f"{class_name}-{safe_title}-{created_time_str}"
-                    
-                    for submission_index, submission in enumerate(submissions):
-                        # 构建完整的文件路径
-                        if os.path.isabs(submission.file_path):
-                            file_path = submission.file_path
-                        else:
-                            # 相对路径，需要拼接storage前缀
-                            file_path = os.path.join('/app/storage', submission.file_path)
-                        
-                        if os.path.exists(file_path):
-                            # 更新文件进度
-                            file_progress = int(((assignment_index + (submission_index / len(submissions))) / len(assignments)) * 100)
-                            
-                            if submission_index == 0:  # 只记录每个作业的第一个文件
-                                logger.warning(f"[批量下载] 开始压缩作业 '{assignment.title}' 的文件, 进度: {file_progress}%")
-                            
-                            progress_tracker.set_progress(current_user.id, {
-                                'status': 'processing',
-                                'progress': file_progress,
-                                'message': f'正在压缩: {submission.original_filename}',
-                                'current_assignment': assignment_index + 1,
-                                'total_assignments': len(assignments),
-                                'current_file': submission_index + 1,
-                                'total_files': len(submissions)
-                            })
-                            
-                            # 创建文件在ZIP中的路径
-                            beijing_time = to_beijing_time(submission.submitted_at)
-                            time_str = beijing_time.strftime('%Y%m%d_%H%M%S') if beijing_time else 'unknown'
-                            
-                            safe_student_name = safe_chinese_filename(submission.student_name)
-                            safe_original_name = safe_chinese_filename(submission.original_filename)
-                            
-                            zip_filename_in_folder = f"{assignment_folder}/{safe_student_name}_{submission.student_number}_{time_str}_{safe_original_name}"
-                            
-                            # 添加文件到ZIP（使用完整路径）
-                            zf.write(file_path, zip_filename_in_folder)
-                            
-                            # 小延迟，让进度更可见
-                            time.sleep(0.01)
-        
-        # 完成压缩
-        memory_file.seek(0)
-        zip_data = memory_file.read()
-        
-        logger.warning(f"[批量下载] ZIP文件创建完成，大小: {len(zip_data) / 1024 / 1024:.2f} MB")
-        
-        # 将ZIP数据保存到session中（用base64编码）
-        import base64
-        logger.warning(f"[批量下载] 将ZIP数据保存到session")
-        session[f'batch_download_zip_{current_user.id}'] = base64.b64encode(zip_data).decode('utf-8')
-        session[f'batch_download_filename_{current_user.id}'] = zip_filename
-        
-        logger.warning(f"[批量下载] 设置进度为完成状态 (100%)")
-        progress_tracker.set_progress(current_user.id, {
-            'status': 'completed',
-            'progress': 100,
-            'message': '所有作业压缩完成，准备下载...',
-            'total_assignments': len(assignments),
-            'download_ready': True
-        })
-        
-        logger.warning(f"[批量下载] ===== 批量下载处理完成 =====")
-        # 返回成功响应而不是文件
-        return jsonify({'success': True, 'message': '批量下载准备完成'})
-        
-    except Exception as e:
-        # 错误处理
-        import traceback
-        error_detail = traceback.format_exc()
-        
-        logger.error(f"[批量下载] ===== 发生错误 =====")
-        logger.error(f"[批量下载] 错误信息: {str(e)}")
-        logger.error(f"[批量下载] 详细堆栈:\n{error_detail}")
-        
-        progress_tracker.set_progress(current_user.id, {
-            'status': 'error',
-            'progress': 0,
-            'message': f'批量下载失败: {str(e)}'
-        })
-        flash(f'批量下载失败: {str(e)}')
-        # 记录详细错误到日志
-        import logging
-        logging.error(f"批量下载失败: {error_detail}")
-        return redirect(url_for('download.batch_download_assignments'))
+    progress_tracker.set_progress(current_user.id, {
+        'status': 'pending',
+        'progress': 0,
+        'message': '已加入打包队列，等待开始...',
+        'job_id': job.id,
+        'total_assignments': len(assignments),
+        'current_assignment': 0
+    })
+    
+    logger.warning(f"[批量下载] ===== 已登记打包任务 #{job.id} =====")
+    return jsonify({'success': True, 'message': '已开始后台打包', 'job_id': job.id})
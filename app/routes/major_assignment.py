@@ -1834,6 +1834,11 @@ def stage_submit(stage_id):
         )
         db.session.add(sub)
         db.session.commit()
+        
+        # 后台预提取文件文本（不等待提取完成）
+        from app.models import SubmissionText
+        from app.services.extraction_service import ExtractionService
+        ExtractionService.schedule(SubmissionText.KIND_STAGE, sub.id, file_path)
         flash('文件提交成功')
     elif mode == 'link':
         url_val = request.form.get('url', '').strip()
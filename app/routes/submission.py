@@ -297,23 +297,41 @@ def submit_assignment(assignment_id):
                 db.session.add(submission)
                 db.session.commit()
                 
+                # 后台预提取文件文本（不等待提取完成）
+                from app.models import SubmissionText
+                from app.services.extraction_service import ExtractionService
+                ExtractionService.schedule(SubmissionText.KIND_ASSIGNMENT, submission.id, file_path)
+                
                 # AI 自动改卷处理：加入队列
-                if assignment.ai_grading_mode in [1, 3]:  # 模式1：立刻改卷，模式3：无参考答案自动改卷
+                # 模式1：立刻改卷，模式3：无参考答案自动改卷
+                # 模式2：参考答案上传前先登记为待参考答案，上传后统一入队
+                if assignment.ai_grading_mode in [1, 2, 3]:
                     try:
                         from app.models import AIGradingTask
                         
+                        task_status = AIGradingTask.STATUS_PENDING
+                        if assignment.ai_grading_mode == 2 and not (
+                            assignment.reference_answer or assignment.reference_answer_file_path
+                        ):
+                            task_status = AIGradingTask.STATUS_DEFERRED
+                        
                         # 创建 AI 批改任务
                         ai_task = AIGradingTask(
                             submission_id=submission.id,
                             assignment_id=assignment.id,
                             student_id=student_user_id,
-                            status=AIGradingTask.STATUS_PENDING
+                            status=task_status
                         )
                         db.session.add(ai_task)
                         db.session.commit()
                         current_app.logger.info(
-                            f"[AI队列] 提交ID={submission.id} 已加入批改队列，任务ID={ai_task.id}"
+                            f"[AI队列] 提交ID={submission.id} 已加入批改队列，任务ID={ai_task.id}，状态={ai_task.status_text}"
                         )
+                        
+                        # 立即唤醒队列消费进程
+                        if task_status == AIGradingTask.STATUS_PENDING:
+                            from app.services.ai_queue_service import AIQueueService
+                            AIQueueService.notify()
                     except Exception as e:
                         current_app.logger.error(f"[AI队列] 创建任务失败: {str(e)}")
                         import traceback
@@ -702,6 +720,10 @@ def delete_submission(submission_id):
     db.session.delete(submission)
     db.session.commit()
     
+    # 作业压缩包缓存中包含该提交，删除缓存
+    from app.services.download_archive_service import DownloadArchiveService
+    DownloadArchiveService.invalidate_assignment_cache(assignment.id)
+    
     flash('提交记录已成功删除')
     return redirect(url_for('assignment.view_submissions', assignment_id=assignment.id))
 
@@ -1,187 +1,544 @@
 """AI 批改队列处理服务"""
 import json
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from flask import current_app
+from app.services.llm_guard import llm_guard
+from app.utils.stage_timer import recording, timed
 
 
 class AIQueueService:
     """AI 批改队列处理服务"""
     
+    # 工作线程池上限（与 /admin/ai-queue/config 允许的最大并发数一致）
+    MAX_WORKERS = 10
+    
     # 处理锁，防止并发问题
     _processing_lock = threading.Lock()
     _is_processing = False
+    _dispatch_requested = False
+    
+    # 工作线程池（懒加载，进程内共享）
+    _executor = None
+    _executor_lock = threading.Lock()
+    
+    # 本进程中正在处理的任务（任务ID -> 租约令牌）
+    _in_flight = {}
+    _in_flight_lock = threading.Lock()
+    
+    # 租约续约线程
+    _heartbeat_thread = None
+    
+    # 入队唤醒监听线程
+    _wakeup_thread = None
+    
+    @staticmethod
+    def _get_executor():
+        """获取工作线程池"""
+        if AIQueueService._executor is None:
+            with AIQueueService._executor_lock:
+                if AIQueueService._executor is None:
+                    AIQueueService._executor = ThreadPoolExecutor(
+                        max_workers=AIQueueService.MAX_WORKERS,
+                        thread_name_prefix='ai-grading'
+                    )
+        return AIQueueService._executor
+    
+    @staticmethod
+    def in_flight_count():
+        """本进程中正在处理的任务数"""
+        with AIQueueService._in_flight_lock:
+            return len(AIQueueService._in_flight)
     
     @staticmethod
     def process_queue():
-        """处理队列中的任务"""
-        from app.models import AIGradingTask, AIGradingConfig, Submission, Assignment
-        from app.services.ai_grading_service import AIGradingService
-        from app.extensions import db
-        
-        # 防止重复处理
-        if AIQueueService._is_processing:
-            return
+        """
+        调度队列中的任务到工作线程池
         
+        每次调度都会重新读取 max_concurrent，修改配置后无需重启即可生效。
+        本方法只负责领取任务并提交到线程池，不会阻塞等待批改完成。
+        """
+        # 防止重复处理：调度进行中时只记录一次补调度请求
         with AIQueueService._processing_lock:
             if AIQueueService._is_processing:
+                AIQueueService._dispatch_requested = True
                 return
             AIQueueService._is_processing = True
         
         try:
-            # 获取配置
-            config = AIGradingConfig.get_config()
-            max_concurrent = config.max_concurrent
-            
-            # 获取当前正在处理的任务数
-            processing_count = AIGradingTask.query.filter_by(
-                status=AIGradingTask.STATUS_PROCESSING
-            ).count()
-            
-            # 计算可以处理的任务数
-            available_slots = max_concurrent - processing_count
-            if available_slots <= 0:
-                return
-            
-            # 获取待处理的任务
-            pending_tasks = AIGradingTask.query.filter_by(
-                status=AIGradingTask.STATUS_PENDING
-            ).order_by(AIGradingTask.created_at.asc()).limit(available_slots).all()
-            
-            if not pending_tasks:
-                return
-            
-            print(f"📝 AI队列：发现 {len(pending_tasks)} 个待处理任务")
-            
-            for task in pending_tasks:
+            while True:
+                AIQueueService._dispatch_requested = False
+                AIQueueService._dispatch_pending_tasks()
+                with AIQueueService._processing_lock:
+                    if not AIQueueService._dispatch_requested:
+                        AIQueueService._is_processing = False
+                        break
+        except Exception:
+            with AIQueueService._processing_lock:
+                AIQueueService._is_processing = False
+            raise
+    
+    @staticmethod
+    def _dispatch_pending_tasks():
+        """领取待处理任务并提交到线程池"""
+        from app.models import AIGradingTask, AIGradingConfig
+        
+        app = current_app._get_current_object()
+        
+        # 获取配置
+        config = AIGradingConfig.get_config()
+        max_concurrent = min(config.max_concurrent or 1, AIQueueService.MAX_WORKERS)
+        
+        # 上游熔断期间暂停领取任务
+        if not llm_guard.circuit.allow_dispatch():
+            return
+        
+        # 被限流时自适应并发会收缩，领取数量随之减少
+        max_concurrent = min(max_concurrent, llm_guard.concurrency.current_limit)
+        # 熔断冷却结束后只领取一个任务作为试探请求
+        if not llm_guard.circuit.is_closed():
+            max_concurrent = min(max_concurrent, 1)
+        
+        # 获取当前持有有效租约的任务数（所有 worker 合计），租约过期的任务不再占用槽位
+        processing_count = AIGradingTask.count_active_leases()
+        
+        # 计算可以处理的任务数
+        available_slots = max_concurrent - max(processing_count, AIQueueService.in_flight_count())
+        if available_slots <= 0:
+            return
+        
+        # 原子领取待处理任务（含租约过期的任务）
+        lease_token, claimed_tasks = AIGradingTask.claim_batch(available_slots)
+        if not claimed_tasks:
+            return
+        
+        print(f"📝 AI队列：领取 {len(claimed_tasks)} 个待处理任务")
+        
+        task_ids = []
+        for task in claimed_tasks:
+            if (task.attempts or 0) > AIGradingTask.MAX_ATTEMPTS:
+                AIQueueService._fail_exhausted_task(task, lease_token)
+                continue
+            task_ids.append(task.id)
+        
+        AIQueueService._ensure_heartbeat(app)
+        
+        executor = AIQueueService._get_executor()
+        for task_id in task_ids:
+            with AIQueueService._in_flight_lock:
+                AIQueueService._in_flight[task_id] = lease_token
+            executor.submit(AIQueueService._run_task, app, task_id, lease_token)
+    
+    @staticmethod
+    def _fail_exhausted_task(task, lease_token):
+        """多次领取仍未完成（worker 反复中断）的任务直接标记为失败"""
+        from app.models import AIGradingTask
+        from app.extensions import db
+        
+        if not AIGradingTask.release_lease(task.id, lease_token, AIGradingTask.STATUS_FAILED):
+            return
+        task.status = AIGradingTask.STATUS_FAILED
+        task.error_message = f'任务处理多次中断（已领取 {task.attempts} 次），请检查提交文件后手动重试'
+        task.completed_at = datetime.utcnow()
+        db.session.commit()
+        print(f"❌ AI队列：任务 {task.id} 超过最大领取次数，已标记为失败")
+    
+    @staticmethod
+    def _ensure_heartbeat(app):
+        """启动租约续约线程（每个进程一个）"""
+        if AIQueueService._heartbeat_thread is not None:
+            return
+        with AIQueueService._executor_lock:
+            if AIQueueService._heartbeat_thread is None:
+                thread = threading.Thread(
+                    target=AIQueueService._heartbeat_loop, args=(app,),
+                    name='ai-grading-heartbeat', daemon=True
+                )
+                thread.start()
+                AIQueueService._heartbeat_thread = thread
+    
+    @staticmethod
+    def _heartbeat_loop(app):
+        """定期为本进程正在处理的任务续约"""
+        import time
+        from app.models import AIGradingTask
+        
+        while True:
+            time.sleep(AIGradingTask.HEARTBEAT_INTERVAL)
+            with AIQueueService._in_flight_lock:
+                leases = dict(AIQueueService._in_flight)
+            if not leases:
+                continue
+            try:
+                with app.app_context():
+                    AIGradingTask.renew_leases(leases.keys(), leases.values())
+            except Exception as e:
+                print(f"❌ AI队列：租约续约失败: {e}")
+    
+    @staticmethod
+    def notify():
+        """通知消费进程有新任务（入队后调用）"""
+        from app.services.queue_notifier import notify_queue
+        return notify_queue()
+    
+    @staticmethod
+    def start_wakeup_listener(app):
+        """
+        启动入队唤醒监听线程（在持有调度器的进程中调用）
+        
+        返回: 是否启动成功（不支持时只依赖定时轮询）
+        """
+        from app.services.queue_notifier import QueueListener, is_supported
+        
+        if not is_supported():
+            return False
+        if AIQueueService._wakeup_thread is not None and AIQueueService._wakeup_thread.is_alive():
+            return True
+        
+        try:
+            listener = QueueListener(app.config.get('AI_QUEUE_NOTIFY_DIR'))
+        except OSError as e:
+            print(f"⚠️ AI队列：唤醒监听启动失败，仅使用定时轮询: {e}")
+            return False
+        
+        thread = threading.Thread(
+            target=AIQueueService._wakeup_loop,
+            args=(app, listener),
+            name='ai-queue-wakeup',
+            daemon=True
+        )
+        AIQueueService._wakeup_thread = thread
+        thread.start()
+        return True
+    
+    @staticmethod
+    def _wakeup_loop(app, listener):
+        """收到入队通知后立即调度"""
+        while True:
+            try:
+                if not listener.wait(timeout=None):
+                    continue
+                # 上传预提取、批量下载打包与批改队列共用唤醒通道
+                from app.services.extraction_service import ExtractionService
+                from app.services.download_archive_service import DownloadArchiveService
+                ExtractionService.wake()
+                DownloadArchiveService.wake()
+                with app.app_context():
+                    AIQueueService.process_queue()
+            except Exception as e:
+                print(f"❌ AI队列：唤醒调度失败: {e}")
+    
+    @staticmethod
+    def _run_task(app, task_id, lease_token=None):
+        """工作线程入口：在独立的应用上下文（独立数据库会话）中处理单个任务"""
+        from app.models import AIGradingTask
+        
+        try:
+            with app.app_context():
+                task = AIGradingTask.query.get(task_id)
+                if task is None:
+                    return
                 try:
-                    AIQueueService._process_single_task(task)
+                    AIQueueService._process_single_task(task, lease_token)
                 except Exception as e:
-                    print(f"❌ AI队列：任务 {task.id} 处理失败: {e}")
+                    print(f"❌ AI队列：任务 {task_id} 处理失败: {e}")
                     import traceback
                     traceback.print_exc()
-        
         finally:
-            AIQueueService._is_processing = False
+            with AIQueueService._in_flight_lock:
+                AIQueueService._in_flight.pop(task_id, None)
+        
+        # 空出槽位后立即补充下一个任务，无需等待下一次定时调度
+        try:
+            with app.app_context():
+                AIQueueService.process_queue()
+        except Exception as e:
+            print(f"❌ AI队列：补充调度失败: {e}")
     
     @staticmethod
-    def _process_single_task(task):
-        """处理单个任务"""
-        from app.models import AIGradingTask, Submission, Assignment
-        from app.services.ai_grading_service import AIGradingService
+    def _commit_result(task, lease_token, final_status):
+        """
+        提交任务结果
+        
+        持有租约时先以租约持有者身份结束任务；若租约已被其他 worker 回收则丢弃本次结果。
+        返回: 是否已提交
+        """
+        from app.models import AIGradingTask
         from app.extensions import db
         
-        # 标记为处理中
-        task.status = AIGradingTask.STATUS_PROCESSING
-        task.started_at = datetime.utcnow()
+        if lease_token and not AIGradingTask.release_lease(task.id, lease_token, final_status):
+            db.session.rollback()
+            print(f"⚠️ AI队列：任务 {task.id} 的租约已失效（已被其他 worker 回收），丢弃本次结果")
+            return False
         db.session.commit()
+        return True
+    
+    @staticmethod
+    def drain(timeout=None):
+        """
+        持续调度直到队列中没有等待和处理中的任务（用于脚本和基准测试）
         
-        print(f"🔄 AI队列：开始处理任务 {task.id}")
+        返回: 是否在超时前处理完成
+        """
+        import time
+        from app.models import AIGradingTask
+        from app.extensions import db
         
-        try:
-            # 获取提交和作业信息
-            submission = Submission.query.get(task.submission_id)
-            assignment = Assignment.query.get(task.assignment_id)
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            AIQueueService.process_queue()
+            db.session.expire_all()
+            remaining = AIGradingTask.query.filter(
+                AIGradingTask.status.in_([AIGradingTask.STATUS_PENDING, AIGradingTask.STATUS_PROCESSING])
+            ).count()
+            if remaining == 0 and AIQueueService.in_flight_count() == 0:
+                return True
+            if deadline and time.time() > deadline:
+                return False
+            time.sleep(0.05)
+    
+    @staticmethod
+    def _requeue_task(task, lease_token, reason):
+        """把任务放回等待队列（上游暂不可用时使用）"""
+        from app.models import AIGradingTask
+        
+        task.status = AIGradingTask.STATUS_PENDING
+        task.started_at = None
+        task.attempts = max((task.attempts or 1) - 1, 0)
+        if AIQueueService._commit_result(task, lease_token, AIGradingTask.STATUS_PENDING):
+            print(f"⏸️ AI队列：任务 {task.id} 已重新排队: {reason}")
+    
+    @staticmethod
+    def archive_old_tasks(retention_days=None, archive_dir=None, batch_size=500):
+        """
+        归档并清理过期的已完成任务
+        
+        完成时间早于保留天数的任务连同对话记录追加写入按月分文件的 gzip JSONL 归档，
+        然后从数据库删除；提交记录上的 AI 评分和评语不受影响。
+        
+        返回: 归档的任务数
+        """
+        import gzip
+        import os
+        from datetime import timedelta
+        from app.models import AIGradingTask
+        from app.extensions import db
+        
+        retention_days = current_app.config.get('AI_TASK_RETENTION_DAYS', 0) if retention_days is None else retention_days
+        if not retention_days:
+            return 0
+        archive_dir = archive_dir or current_app.config['AI_TASK_ARCHIVE_DIR']
+        os.makedirs(archive_dir, exist_ok=True)
+        
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        columns = [c.name for c in AIGradingTask.__table__.columns if c.name != 'conversation_log']
+        archive_path = os.path.join(archive_dir, f"ai_grading_tasks_{datetime.utcnow().strftime('%Y%m')}.jsonl.gz")
+        
+        archived = 0
+        while True:
+            tasks = AIGradingTask.query.filter(
+                AIGradingTask.status == AIGradingTask.STATUS_COMPLETED,
+                AIGradingTask.completed_at < cutoff
+            ).order_by(AIGradingTask.id.asc()).limit(batch_size).all()
+            if not tasks:
+                break
             
-            if not submission or not assignment:
-                raise ValueError("提交或作业不存在")
+            # gzip 追加写入会生成多成员文件，gzip.open 可以连续读取
+            with gzip.open(archive_path, 'at', encoding='utf-8') as f:
+                for task in tasks:
+                    record = {}
+                    for name in columns:
+                        value = getattr(task, name)
+                        record[name] = value.isoformat() if isinstance(value, datetime) else value
+                    log = task.get_conversation_log()
+                    record['conversation'] = json.loads(log) if log else None
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
             
-            # 获取参考答案
-            reference_content = None
-            if assignment.ai_grading_mode == 1:  # 有参考答案模式
-                if assignment.reference_answer:
-                    reference_content = assignment.reference_answer
-                elif assignment.reference_answer_file_path:
-                    result = AIGradingService.extract_file_content(
-                        assignment.reference_answer_file_path
+            AIGradingTask.delete_tasks([task.id for task in tasks])
+            db.session.commit()
+            archived += len(tasks)
+        
+        if archived:
+            print(f"🗄️ AI队列：已归档 {archived} 个过期任务到 {archive_path}")
+        return archived
+    
+    @staticmethod
+    def _get_reference_content(assignment):
+        """
+        获取参考答案文本
+        
+        优先使用文本参考答案，其次使用缓存的文件提取文本；尚未回填时读取上传时登记的后台预提取结果
+        （提取仍在进行时等待其完成，同一批次的任务不会各自重复 OCR），再回填到作业记录供后续任务复用。
+        """
+        from app.models import Assignment, SubmissionText
+        from app.services.extraction_service import ExtractionService
+        from app.extensions import db
+        
+        if assignment.reference_answer:
+            return assignment.reference_answer
+        if assignment.reference_answer_extracted:
+            return assignment.reference_answer_extracted
+        file_path = assignment.reference_answer_file_path
+        if not file_path:
+            return None
+        
+        content, _ = ExtractionService.get_content(SubmissionText.KIND_REFERENCE, assignment.id, file_path)
+        if content:
+            # 条件更新：提取期间参考答案已被替换时不回填旧文件的文本
+            Assignment.query.filter(
+                Assignment.id == assignment.id,
+                Assignment.reference_answer_file_path == file_path
+            ).update({
+                'reference_answer_extracted': content,
+                'reference_answer_extracted_at': datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+        return content
+    
+    @staticmethod
+    def _apply_metrics(task, recorder):
+        """把本次处理的分阶段耗时和 token 用量写入任务"""
+        if task.created_at and task.started_at:
+            task.wait_ms = max(int((task.started_at - task.created_at).total_seconds() * 1000), 0)
+        
+        # 提取耗时包含其中的 OCR，分开记录
+        extract_ms = recorder.get_ms('extract')
+        ocr_ms = recorder.get_ms('ocr')
+        if extract_ms is not None and ocr_ms is not None:
+            extract_ms = max(extract_ms - ocr_ms, 0)
+        
+        task.extract_ms = extract_ms
+        task.ocr_ms = ocr_ms
+        task.prompt_ms = recorder.get_ms('prompt')
+        task.llm_ms = recorder.get_ms('llm')
+        task.validate_ms = recorder.get_ms('validate')
+        task.prompt_tokens = recorder.values.get('prompt_tokens')
+        task.completion_tokens = recorder.values.get('completion_tokens')
+        task.prompt_cache_hit_tokens = recorder.values.get('prompt_cache_hit_tokens')
+        task.ocr_saved_ms = recorder.values.get('ocr_saved_ms')
+    
+    @staticmethod
+    def _process_single_task(task, lease_token=None):
+        """处理单个任务（任务已由调度线程领取并标记为处理中）"""
+        from app.models import AIGradingTask, Submission, SubmissionText, Assignment
+        from app.services.ai_grading_service import AIGradingService
+        from app.services.extraction_service import ExtractionService
+        from app.extensions import db
+        
+        print(f"🔄 AI队列：开始处理任务 {task.id}")
+        
+        with recording() as recorder:
+            try:
+                # 获取提交和作业信息
+                submission = Submission.query.get(task.submission_id)
+                assignment = Assignment.query.get(task.assignment_id)
+                
+                if not submission or not assignment:
+                    raise ValueError("提交或作业不存在")
+                
+                # 获取参考答案
+                reference_content = None
+                if assignment.ai_grading_mode in [1, 2]:  # 有参考答案模式（模式2为后补参考答案）
+                    with timed('extract'):
+                        reference_content = AIQueueService._get_reference_content(assignment)
+                
+                # 获取学生提交内容（优先使用上传时的预提取结果）
+                with timed('extract'):
+                    result = ExtractionService.get_content(
+                        SubmissionText.KIND_ASSIGNMENT, submission.id, submission.file_path
                     )
-                    if isinstance(result, tuple):
-                        reference_content = result[0]
-                    else:
-                        reference_content = result
-            
-            # 获取学生提交内容
-            result = AIGradingService.extract_file_content(submission.file_path)
-            if isinstance(result, tuple):
-                student_content = result[0]
-                extract_error = result[1]
-            else:
-                student_content = result
-                extract_error = None
-            
-            if not student_content:
-                raise ValueError(f"无法提取学生提交内容: {extract_error or '未知错误'}")
-            
-            # 构建请求参数（用于记录对话）
-            request_params = {
-                'assignment_title': assignment.title,
-                'assignment_description': assignment.description or '',
-                'grading_criteria': assignment.grading_criteria or '',
-                'student_content_preview': student_content[:500] + '...' if len(student_content) > 500 else student_content,
-                'reference_answer_preview': (reference_content[:500] + '...' if reference_content and len(reference_content) > 500 else reference_content) if reference_content else None,
-                'max_score': 100
-            }
-            
-            # 调用 AI 评分
-            ai_result = AIGradingService.grade_submission(
-                assignment_title=assignment.title,
-                assignment_description=assignment.description or '',
-                grading_criteria=assignment.grading_criteria or '',
-                student_content=student_content,
-                reference_answer=reference_content,
-                max_score=100
-            )
-            
-            # 记录对话日志
-            conversation_log = {
-                'request': request_params,
-                'response': ai_result,
-                'timestamp': datetime.utcnow().isoformat()
-            }
-            task.conversation_log = json.dumps(conversation_log, ensure_ascii=False, indent=2)
-            
-            if ai_result.get('success'):
-                # 成功
-                task.status = AIGradingTask.STATUS_COMPLETED
-                task.score = ai_result.get('score')
-                task.feedback = ai_result.get('comment')
-                task.completed_at = datetime.utcnow()
+                if isinstance(result, tuple):
+                    student_content = result[0]
+                    extract_error = result[1]
+                else:
+                    student_content = result
+                    extract_error = None
+                
+                if not student_content:
+                    raise ValueError(f"无法提取学生提交内容: {extract_error or '未知错误'}")
+                
+                # 构建请求参数（用于记录对话）
+                request_params = {
+                    'assignment_title': assignment.title,
+                    'assignment_description': assignment.description or '',
+                    'grading_criteria': assignment.grading_criteria or '',
+                    'student_content_preview': student_content[:500] + '...' if len(student_content) > 500 else student_content,
+                    'reference_answer_preview': (reference_content[:500] + '...' if reference_content and len(reference_content) > 500 else reference_content) if reference_content else None,
+                    'max_score': 100
+                }
+                
+                # 调用 AI 评分
+                ai_result = AIGradingService.grade_submission(
+                    assignment_title=assignment.title,
+                    assignment_description=assignment.description or '',
+                    grading_criteria=assignment.grading_criteria or '',
+                    student_content=student_content,
+                    reference_answer=reference_content,
+                    max_score=100,
+                    use_cache=not task.bypass_cache
+                )
+                
+                # 上游暂时不可用（熔断/重试耗尽）：任务重新排队，不计入领取次数
+                if not ai_result.get('success') and ai_result.get('retryable'):
+                    AIQueueService._requeue_task(task, lease_token, ai_result.get('error'))
+                    return
                 
-                # 更新提交记录（AI 评分字段）
-                submission.ai_score = ai_result.get('score')
-                submission.ai_feedback = ai_result.get('comment')
+                # 记录对话日志
+                conversation_log = {
+                    'request': request_params,
+                    'response': ai_result,
+                    'cache_hit': bool(ai_result.get('cache_hit')),
+                    'timestamp': datetime.utcnow().isoformat()
+                }
+                task.set_conversation(conversation_log)
                 
-                # 同步到正式评分字段（如果还没有教师评分）
-                if submission.grade is None:
-                    submission.grade = ai_result.get('score')
-                    submission.feedback = ai_result.get('comment')
-                    submission.graded_at = datetime.utcnow()
+                if ai_result.get('success'):
+                    # 成功
+                    task.status = AIGradingTask.STATUS_COMPLETED
+                    task.score = ai_result.get('score')
+                    task.feedback = ai_result.get('comment')
+                    task.completed_at = datetime.utcnow()
+                    
+                    # 更新提交记录（AI 评分字段）
+                    submission.ai_score = ai_result.get('score')
+                    submission.ai_feedback = ai_result.get('comment')
+                    
+                    # 同步到正式评分字段（如果还没有教师评分）
+                    if submission.grade is None:
+                        submission.grade = ai_result.get('score')
+                        submission.feedback = ai_result.get('comment')
+                        submission.graded_at = datetime.utcnow()
+                    
+                    print(f"✅ AI队列：任务 {task.id} 完成，评分: {task.score}{'（缓存命中）' if ai_result.get('cache_hit') else ''}")
+                else:
+                    # 失败
+                    task.status = AIGradingTask.STATUS_FAILED
+                    task.error_message = ai_result.get('error', 'AI 评分失败')
+                    task.completed_at = datetime.utcnow()
+                    
+                    print(f"⚠️ AI队列：任务 {task.id} 失败: {task.error_message}")
                 
-                print(f"✅ AI队列：任务 {task.id} 完成，评分: {task.score}")
-            else:
-                # 失败
+                AIQueueService._apply_metrics(task, recorder)
+                AIQueueService._commit_result(task, lease_token, task.status)
+                
+            except Exception as e:
+                # 异常处理：先回滚，数据库错误（如 database is locked）后会话处于失效状态，
+                # 不回滚则失败记录也无法写入，任务会一直停留在批改中直到租约过期
+                db.session.rollback()
                 task.status = AIGradingTask.STATUS_FAILED
-                task.error_message = ai_result.get('error', 'AI 评分失败')
+                task.error_message = str(e)
                 task.completed_at = datetime.utcnow()
                 
-                print(f"⚠️ AI队列：任务 {task.id} 失败: {task.error_message}")
-            
-            db.session.commit()
-            
-        except Exception as e:
-            # 异常处理
-            task.status = AIGradingTask.STATUS_FAILED
-            task.error_message = str(e)
-            task.completed_at = datetime.utcnow()
-            
-            # 记录错误日志
-            error_log = {
-                'error': str(e),
-                'timestamp': datetime.utcnow().isoformat()
-            }
-            task.conversation_log = json.dumps(error_log, ensure_ascii=False, indent=2)
-            
-            db.session.commit()
-            
-            print(f"❌ AI队列：任务 {task.id} 异常: {e}")
-            raise
+                # 记录错误日志
+                error_log = {
+                    'error': str(e),
+                    'timestamp': datetime.utcnow().isoformat()
+                }
+                task.set_conversation(error_log)
+                
+                AIQueueService._apply_metrics(task, recorder)
+                AIQueueService._commit_result(task, lease_token, AIGradingTask.STATUS_FAILED)
+                
+                print(f"❌ AI队列：任务 {task.id} 异常: {e}")
+                raise
@@ -0,0 +1,358 @@
+"""压缩包（ZIP/7z）提交的流式文本提取
+
+不把压缩包整体解压到磁盘：逐个成员流式读取，纯文本成员直接在内存中解码，PDF/Word 成员写入临时文件后
+交给线程池并行提取（提取完立即删除），同时存在的临时文件数量有上限。
+
+防护（防止压缩炸弹）：
+- 解压前按文件头检查成员数量、总解压大小和压缩比
+- 读取时按实际解压出的字节数检查单个成员和总大小（不完全信任文件头）
+- 加密成员、嵌套压缩包和不支持的文件类型跳过，在结果中列出
+"""
+import io
+import os
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ArchiveLimitError(Exception):
+    """压缩包超出安全限制"""
+
+
+# 读取块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 压缩比检查只针对解压后超过该大小的成员（小文件压缩比高很正常）
+RATIO_CHECK_MIN_BYTES = 1024 * 1024
+
+# 忽略的系统/编辑器生成文件
+IGNORED_PREFIXES = ('__MACOSX/',)
+IGNORED_BASENAME_PREFIXES = ('.', '~$')
+
+DEFAULT_LIMITS = {
+    'max_entries': 2000,
+    'max_entry_bytes': 50 * 1024 * 1024,
+    'max_total_bytes': 200 * 1024 * 1024,
+    'max_ratio': 100,
+}
+
+
+def decode_zip_name(info):
+    """ZIP 成员名解码：未设置 UTF-8 标志的按 GBK 解码（Windows 中文系统压缩的文件）"""
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('gbk')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+def decode_text(data):
+    """解码文本成员：优先 UTF-8，失败时按 GB18030（兼容 GBK）"""
+    for encoding in ('utf-8-sig', 'gb18030'):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode('utf-8', errors='ignore')
+
+
+def is_ignored(name):
+    """是否为应忽略的系统文件"""
+    basename = name.rstrip('/').rsplit('/', 1)[-1]
+    return name.startswith(IGNORED_PREFIXES) or basename.startswith(IGNORED_BASENAME_PREFIXES)
+
+
+def check_headers(entries, limits, archive_size=None):
+    """
+    按文件头检查成员数量、总大小和压缩比
+    
+    entries: [(name, 解压大小, 压缩大小或 None), ...]
+    """
+    if len(entries) > limits['max_entries']:
+        raise ArchiveLimitError(f"压缩包文件数 {len(entries)} 超过上限 {limits['max_entries']}")
+    
+    total = sum(size for _, size, _ in entries)
+    if total > limits['max_total_bytes']:
+        raise ArchiveLimitError(
+            f"压缩包解压后 {total // 1024 // 1024}MB 超过上限 {limits['max_total_bytes'] // 1024 // 1024}MB"
+        )
+    
+    for name, size, compressed in entries:
+        if compressed and size > RATIO_CHECK_MIN_BYTES and size / compressed > limits['max_ratio']:
+            raise ArchiveLimitError(f"{name} 压缩比异常（{size // compressed}:1），疑似压缩炸弹")
+    
+    # 固实压缩（7z）没有单个成员的压缩大小，按整个压缩包检查
+    if archive_size and total > RATIO_CHECK_MIN_BYTES and total / archive_size > limits['max_ratio']:
+        raise ArchiveLimitError(f"压缩包整体压缩比异常（{total // archive_size}:1），疑似压缩炸弹")
+
+
+class _MemberCollector:
+    """
+    收集成员内容并调度提取
+    
+    文本成员解码后直接保存；文件成员（PDF/Word）写入临时文件后提交到线程池，
+    未完成的提取任务超过 window 个时等待最早的完成，限制临时文件数量。
+    """
+    
+    def __init__(self, temp_dir, extract_file, text_extensions, file_extensions, limits, executor, window):
+        self.temp_dir = temp_dir
+        self.extract_file = extract_file
+        self.text_extensions = text_extensions
+        self.file_extensions = file_extensions
+        self.limits = limits
+        self.executor = executor
+        self.window = window
+        self.results = {}      # 成员名 -> (content, error)
+        self.skipped = []      # (成员名, 原因)
+        self.pending = deque()
+        self.total_bytes = 0
+        self._counter = 0
+        self._lock = threading.Lock()
+    
+    def member_kind(self, name):
+        """'text'、'file' 或 None（不支持）"""
+        ext = os.path.splitext(name)[1].lower()
+        if ext in self.text_extensions:
+            return 'text'
+        if ext in self.file_extensions:
+            return 'file'
+        return None
+    
+    def open_member(self, name):
+        """开始写入一个成员，返回写入器"""
+        kind = self.member_kind(name)
+        if kind == 'file':
+            with self._lock:
+                self._counter += 1
+                path = os.path.join(self.temp_dir, f'{self._counter:05d}{os.path.splitext(name)[1].lower()}')
+            return _MemberWriter(self, name, kind, open(path, 'wb'), path)
+        return _MemberWriter(self, name, kind, io.BytesIO(), None)
+    
+    def add_bytes(self, count):
+        """累计实际解压字节数，超过总量上限时中止"""
+        self.total_bytes += count
+        if self.total_bytes > self.limits['max_total_bytes']:
+            raise ArchiveLimitError(
+                f"压缩包解压后超过上限 {self.limits['max_total_bytes'] // 1024 // 1024}MB，疑似压缩炸弹"
+            )
+    
+    def finish_member(self, writer):
+        """成员写入完成：文本直接解码，文件提交提取"""
+        if writer.oversized:
+            self.skipped.append((writer.name, '超过单个文件大小上限'))
+            if writer.path:
+                os.remove(writer.path)
+            return
+        if writer.kind == 'text':
+            self.results[writer.name] = (decode_text(writer.buffer.getvalue()), None)
+            return
+        
+        while len(self.pending) >= self.window:
+            self._collect(*self.pending.popleft())
+        self.pending.append((writer.name, self.executor.submit(self._extract_and_remove, writer.path)))
+    
+    def _extract_and_remove(self, path):
+        try:
+            return self.extract_file(path)
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def _collect(self, name, future):
+        try:
+            self.results[name] = future.result()
+        except Exception as e:
+            self.results[name] = (None, str(e))
+    
+    def wait_all(self):
+        while self.pending:
+            self._collect(*self.pending.popleft())
+
+
+class _MemberWriter:
+    """单个成员的写入器（超过单个文件上限后丢弃后续内容，但继续计入总量）"""
+    
+    def __init__(self, collector, name, kind, buffer, path):
+        self.collector = collector
+        self.name = name
+        self.kind = kind
+        self.buffer = buffer
+        self.path = path
+        self.size = 0
+        self.oversized = False
+    
+    def write(self, data):
+        self.collector.add_bytes(len(data))
+        self.size += len(data)
+        if self.size > self.collector.limits['max_entry_bytes']:
+            self.oversized = True
+        if not self.oversized:
+            self.buffer.write(data)
+        return len(data)
+    
+    def close(self):
+        """写入完成，交给收集器"""
+        if self.path:
+            self.buffer.close()
+        self.collector.finish_member(self)
+    
+    def discard(self):
+        """读取出错，丢弃已写入的部分"""
+        self.buffer.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def _walk_zip(file_path, collector):
+    with zipfile.ZipFile(file_path) as archive:
+        infos = [info for info in archive.infolist() if not info.is_dir()]
+        check_headers([(info.filename, info.file_size, info.compress_size) for info in infos], collector.limits)
+        
+        for info in infos:
+            name = decode_zip_name(info)
+            if is_ignored(name):
+                continue
+            if info.flag_bits & 0x1:
+                collector.skipped.append((name, '已加密'))
+                continue
+            if collector.member_kind(name) is None:
+                collector.skipped.append((name, '不支持的文件类型'))
+                continue
+            if info.file_size > collector.limits['max_entry_bytes']:
+                collector.skipped.append((name, '超过单个文件大小上限'))
+                continue
+            
+            writer = collector.open_member(name)
+            try:
+                with archive.open(info) as source:
+                    for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                        writer.write(chunk)
+                        if writer.oversized:
+                            break
+            except Exception:
+                writer.discard()
+                raise
+            writer.close()
+
+
+def _walk_7z(file_path, collector):
+    try:
+        import py7zr
+        from py7zr.io import Py7zIO, WriterFactory
+    except ImportError:
+        raise ArchiveLimitError("未安装 py7zr，无法解析 7z 压缩包")
+    
+    class Writer(Py7zIO):
+        """py7zr 写入接口适配（py7zr 按文件头中的大小解压，写入量不会超过文件头声明）"""
+        
+        def __init__(self, member_writer):
+            self.member_writer = member_writer
+        
+        def write(self, data):
+            return self.member_writer.write(data)
+        
+        def read(self, size=None):
+            return b''
+        
+        def seek(self, offset, whence=0):
+            return 0
+        
+        def flush(self):
+            pass
+        
+        def size(self):
+            return self.member_writer.size
+    
+    class Factory(WriterFactory):
+        """新成员开始写入时，上一个成员已经写完，立即提交提取"""
+        
+        def __init__(self):
+            self.current = None
+        
+        def create(self, filename):
+            self.finish()
+            self.current = collector.open_member(filename)
+            return Writer(self.current)
+        
+        def finish(self):
+            if self.current is not None:
+                current, self.current = self.current, None
+                current.close()
+        
+        def discard(self):
+            if self.current is not None:
+                current, self.current = self.current, None
+                current.discard()
+    
+    with py7zr.SevenZipFile(file_path, mode='r') as archive:
+        if archive.needs_password():
+            raise ArchiveLimitError("7z 压缩包已加密")
+        infos = [info for info in archive.list() if not info.is_directory]
+        check_headers(
+            [(info.filename, info.uncompressed, info.compressed) for info in infos],
+            collector.limits,
+            archive_size=os.path.getsize(file_path)
+        )
+        
+        targets = []
+        for info in infos:
+            if is_ignored(info.filename):
+                continue
+            if collector.member_kind(info.filename) is None:
+                collector.skipped.append((info.filename, '不支持的文件类型'))
+            elif info.uncompressed > collector.limits['max_entry_bytes']:
+                collector.skipped.append((info.filename, '超过单个文件大小上限'))
+            else:
+                targets.append(info.filename)
+        if not targets:
+            return
+        
+        factory = Factory()
+        try:
+            archive.extract(targets=targets, factory=factory)
+        except Exception:
+            factory.discard()
+            raise
+        factory.finish()
+
+
+def extract_archive(file_path, extract_file, text_extensions, file_extensions, limits=None, workers=1):
+    """
+    流式提取压缩包中各文件的文本
+    
+    参数:
+        extract_file: 提取单个 PDF/Word 文件的函数 path -> (content, error)，在线程池中调用
+        text_extensions / file_extensions: 作为纯文本解码 / 交给 extract_file 的扩展名
+        limits: 安全限制，见 DEFAULT_LIMITS
+        workers: 并行提取 PDF/Word 的线程数
+    
+    返回: ([(成员名, content, error), ...] 按成员名排序, [(成员名, 跳过原因), ...] 按成员名排序)
+    异常: ArchiveLimitError（超出安全限制）、zipfile.BadZipFile 等格式错误
+    """
+    limits = dict(DEFAULT_LIMITS, **(limits or {}))
+    ext = os.path.splitext(file_path)[1].lower()
+    walk = {'.zip': _walk_zip, '.7z': _walk_7z}.get(ext)
+    if walk is None:
+        raise ValueError(f"不支持的压缩格式: {ext}")
+    
+    workers = max(workers, 1)
+    with tempfile.TemporaryDirectory(prefix='tg_edu_archive_') as temp_dir, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix='archive-extract') as executor:
+        collector = _MemberCollector(
+            temp_dir, extract_file, text_extensions, file_extensions, limits, executor, window=workers * 2
+        )
+        try:
+            walk(file_path, collector)
+        finally:
+            collector.wait_all()
+    
+    members = sorted((name, content, error) for name, (content, error) in collector.results.items())
+    return members, sorted(collector.skipped)
@@ -0,0 +1,202 @@
+"""AI 评分内容的 token 预算控制
+
+学生提交（尤其是扫描件 OCR 结果和大段代码）可能远超模型上下文。超出预算时按以下顺序逐级压缩，
+每一级之后重新估算，满足预算即停止：
+
+1. 规整空白：去掉行尾空白、压缩连续空格和空行
+2. 清理 OCR 噪声：去掉只有符号的碎片行和连续重复行
+3. 折叠重复代码块：与前文完全相同的多行片段替换为占位说明
+4. （可选）分段摘要：中间部分分段调用 AI 摘要
+5. 首尾保留截断：保留开头和结尾，中间省略
+"""
+import hashlib
+import re
+
+from flask import current_app
+
+from app.utils.token_counter import estimate_tokens
+
+
+class ContentBudgetService:
+    """内容 token 预算服务"""
+
+    # 为 Prompt 估算误差预留的 token
+    SAFETY_MARGIN = 500
+
+    # 参考答案最多占用的预算比例（与学生内容无关，保证同一作业的共享前缀一致）
+    REFERENCE_SHARE = 1 / 3
+
+    # 重复代码块检测的窗口行数
+    REPEAT_WINDOW = 4
+
+    # 截断时保留开头的比例
+    HEAD_RATIO = 0.7
+
+    # 分段摘要：每段 token 数与每段摘要的最大输出 token
+    SUMMARY_CHUNK_TOKENS = 4000
+    SUMMARY_MAX_TOKENS = 400
+
+    _PAGE_MARKER = re.compile(r'^--- 第\d+页 ---$')
+    _MEANINGFUL = re.compile(r'[0-9A-Za-z㐀-鿿]')
+
+    @staticmethod
+    def compute_budget(fixed_prompt_tokens, max_output_tokens):
+        """可供学生内容和参考答案使用的 token 数"""
+        context_tokens = current_app.config.get('DEEPSEEK_CONTEXT_TOKENS', 64000)
+        return context_tokens - max_output_tokens - fixed_prompt_tokens - ContentBudgetService.SAFETY_MARGIN
+
+    @staticmethod
+    def fair_shares(sizes, budget):
+        """
+        按最大最小公平分配预算：小于平均份额的全额保留，剩余预算在较大的各项之间平分
+        
+        返回: 与 sizes 等长的份额列表
+        """
+        shares = [0] * len(sizes)
+        remaining = budget
+        order = sorted(range(len(sizes)), key=lambda i: sizes[i])
+        for position, index in enumerate(order):
+            share = min(sizes[index], remaining // (len(order) - position))
+            shares[index] = share
+            remaining -= share
+        return shares
+    
+    @staticmethod
+    def normalize_whitespace(text):
+        """去掉行尾空白，行内连续空白压缩为一个空格（保留缩进），连续空行压缩为一行"""
+        lines = []
+        for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+            stripped = line.rstrip()
+            indent = len(stripped) - len(stripped.lstrip())
+            lines.append(stripped[:indent] + re.sub(r'[ \t　]{2,}', ' ', stripped[indent:]))
+        return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+    @staticmethod
+    def remove_ocr_noise(text):
+        """去掉没有文字和数字的碎片行（OCR 噪声）和连续重复行，保留分页标记"""
+        result = []
+        previous = None
+        for line in text.split('\n'):
+            stripped = line.strip()
+            if stripped and not ContentBudgetService._PAGE_MARKER.match(stripped):
+                if not ContentBudgetService._MEANINGFUL.search(stripped) and len(stripped) <= 3:
+                    continue
+                if stripped == previous:
+                    continue
+            result.append(line)
+            previous = stripped or previous
+        return '\n'.join(result)
+
+    @staticmethod
+    def collapse_repeated_blocks(text):
+        """与前文完全相同的连续多行片段（复制粘贴的代码等）替换为占位说明"""
+        window = ContentBudgetService.REPEAT_WINDOW
+        lines = text.split('\n')
+        if len(lines) < window * 2:
+            return text
+
+        def block_key(start):
+            block = '\n'.join(line.strip() for line in lines[start:start + window])
+            return hashlib.md5(block.encode('utf-8')).hexdigest()
+
+        seen = set()
+        result = []
+        i = 0
+        while i < len(lines):
+            if i + window <= len(lines) and any(line.strip() for line in lines[i:i + window]):
+                key = block_key(i)
+                if key in seen:
+                    # 向后延伸，直到片段不再与前文重复
+                    skipped = window
+                    while i + skipped + window <= len(lines) and block_key(i + skipped) in seen:
+                        skipped += window
+                    result.append(f'[此处 {skipped} 行与前文重复，已省略]')
+                    i += skipped
+                    continue
+                seen.add(key)
+            result.append(lines[i])
+            i += 1
+        return '\n'.join(result)
+
+    @staticmethod
+    def truncate_middle(text, budget, counter=estimate_tokens):
+        """按 token 预算保留开头和结尾，省略中间部分"""
+        tokens = counter(text)
+        if tokens <= budget or not text:
+            return text
+        chars_per_token = len(text) / tokens
+        keep_chars = max(int(budget * chars_per_token) - 50, 0)
+        head_chars = int(keep_chars * ContentBudgetService.HEAD_RATIO)
+        tail_chars = keep_chars - head_chars
+        omitted = len(text) - head_chars - tail_chars
+        tail = text[-tail_chars:] if tail_chars > 0 else ''
+        return f'{text[:head_chars]}\n\n[内容过长，中间约 {omitted} 字已省略]\n\n{tail}'
+
+    @staticmethod
+    def summarize_middle(text, budget, summarize_func):
+        """
+        保留开头和结尾，中间部分分段摘要
+
+        summarize_func(chunk, max_tokens) -> 摘要文本
+        """
+        tokens = estimate_tokens(text)
+        chars_per_token = len(text) / tokens
+        edge_chars = int(budget * chars_per_token * 0.25)
+        head, middle, tail = text[:edge_chars], text[edge_chars:len(text) - edge_chars], text[len(text) - edge_chars:]
+
+        chunk_chars = int(ContentBudgetService.SUMMARY_CHUNK_TOKENS * chars_per_token)
+        summaries = []
+        for start in range(0, len(middle), chunk_chars):
+            summary = summarize_func(middle[start:start + chunk_chars], ContentBudgetService.SUMMARY_MAX_TOKENS)
+            if summary:
+                summaries.append(summary.strip())
+        return f"{head}\n\n[以下为中间部分的分段摘要]\n" + '\n'.join(
+            f'[摘要 {i}] {summary}' for i, summary in enumerate(summaries, 1)
+        ) + f"\n[摘要结束]\n\n{tail}"
+
+    @staticmethod
+    def fit(text, budget, summarize_func=None, counter=estimate_tokens):
+        """
+        把内容压缩到预算以内
+
+        counter: token 计数函数（需要结果只取决于文本本身时传入未校准的估算）
+
+        返回: (压缩后的文本, 信息 dict {original_tokens, final_tokens, budget, stages})
+        """
+        info = {
+            'original_tokens': counter(text),
+            'final_tokens': None,
+            'budget': budget,
+            'stages': []
+        }
+        if not text or info['original_tokens'] <= budget:
+            info['final_tokens'] = info['original_tokens']
+            return text, info
+
+        stages = [
+            ('whitespace', ContentBudgetService.normalize_whitespace),
+            ('ocr_noise', ContentBudgetService.remove_ocr_noise),
+            ('repeated_blocks', ContentBudgetService.collapse_repeated_blocks),
+        ]
+        for name, func in stages:
+            compressed = func(text)
+            if compressed != text:
+                text = compressed
+                info['stages'].append(name)
+            if counter(text) <= budget:
+                info['final_tokens'] = counter(text)
+                return text, info
+
+        if summarize_func is not None and budget > ContentBudgetService.SUMMARY_MAX_TOKENS * 4:
+            try:
+                text = ContentBudgetService.summarize_middle(text, budget, summarize_func)
+                info['stages'].append('summary')
+            except Exception as e:
+                current_app.logger.warning(f"分段摘要失败，改为截断: {e}")
+
+        if counter(text) > budget:
+            text = ContentBudgetService.truncate_middle(text, budget, counter)
+            info['stages'].append('truncate')
+
+        info['final_tokens'] = counter(text)
+        return text, info
@@ -0,0 +1,624 @@
+"""作业打包下载服务
+
+单个作业的压缩包按提交指纹缓存：未变化时直接发送缓存文件，只有新提交时在缓存副本上追加，
+有提交删除或文件变化时边压缩边发送、同时重建缓存（见 app.utils.zip_stream）。批量下载涉及的作业多、耗时长，改为后台任务：
+请求只登记任务并唤醒持有调度器的进程，后台线程把压缩包写入临时目录并更新进度；完成后浏览器按普通文件
+下载（支持 Range 断点续传，有效期内可重复下载），过期的压缩包由定时任务删除。
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.extensions import db
+from app.utils import safe_chinese_filename, to_beijing_time
+
+
+class DownloadArchiveService:
+    """作业打包下载服务"""
+    
+    # 打包中超过该时间没有心跳视为进程已退出，重新打包
+    STALE_MINUTES = 10
+    
+    # 心跳最小间隔（秒）
+    HEARTBEAT_INTERVAL = 30
+    
+    _thread = None
+    _thread_lock = threading.Lock()
+    _wake_event = threading.Event()
+    
+    @staticmethod
+    def submission_path(submission):
+        """提交文件的绝对路径（兼容旧数据中的相对路径）"""
+        if os.path.isabs(submission.file_path):
+            # 已经是绝对路径，直接使用
+            return submission.file_path
+        # 相对路径，需要转换为绝对路径
+        # 检查是否已经包含storage前缀
+        if submission.file_path.startswith('storage/'):
+            # 已包含storage前缀，直接加/app前缀
+            return os.path.join('/app', submission.file_path)
+        # 不包含storage前缀，加/app/storage前缀
+        return os.path.join('/app/storage', submission.file_path)
+    
+    @staticmethod
+    def submission_zip_name(submission):
+        """提交文件在压缩包中的文件名：学生姓名_学号_提交时间_原文件名"""
+        beijing_time = to_beijing_time(submission.submitted_at)
+        time_str = beijing_time.strftime('%Y%m%d_%H%M%S') if beijing_time else 'unknown'
+        
+        safe_student_name = safe_chinese_filename(submission.student_name)
+        safe_original_name = safe_chinese_filename(submission.original_filename)
+        
+        return f"{safe_student_name}_{submission.student_number}_{time_str}_{safe_original_name}"
+    
+    @staticmethod
+    def assignment_archive_name(assignment, suffix=None):
+        """作业压缩包/文件夹名：班级-作业标题[-后缀]-作业创建时间"""
+        if assignment.class_info:
+            class_name = safe_chinese_filename(assignment.class_info.name)
+        else:
+            class_name = '公共作业'
+        safe_title = safe_chinese_filename(assignment.title)
+        
+        beijing_created = to_beijing_time(assignment.created_at)
+        created_time_str = beijing_created.strftime('%Y%m%d%H%M%S') if beijing_created else 'unknown'
+        
+        parts = [class_name, safe_title] + ([suffix] if suffix else []) + [created_time_str]
+        return '-'.join(parts)
+    
+    # ==================== 单个作业压缩包缓存 ====================
+    
+    @staticmethod
+    def _cache_paths(assignment_id):
+        """缓存压缩包、清单和锁文件路径"""
+        base = os.path.join(current_app.config['ASSIGNMENT_ZIP_CACHE_DIR'], f'assignment_{assignment_id}')
+        return base + '.zip', base + '.json', base + '.lock'
+    
+    @staticmethod
+    def _cache_fingerprint(entries, policy):
+        """
+        按提交ID、压缩包内文件名、文件大小和修改时间（以及压缩策略）生成指纹
+        
+        返回: (指纹, 清单成员 [[submission_id, 压缩包内文件名, 大小, 修改时间ns], ...] 按提交ID排序)
+        """
+        members = []
+        for submission_id, file_path, arcname in entries:
+            stat = os.stat(file_path)
+            members.append([submission_id, arcname, stat.st_size, stat.st_mtime_ns])
+        members.sort()
+        payload = json.dumps([policy.level, sorted(policy.stored_extensions), members], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest(), members
+    
+    @staticmethod
+    def _load_manifest(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def _save_manifest(manifest_path, fingerprint, members, policy):
+        temp_path = manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'fingerprint': fingerprint,
+                'policy': [policy.level, sorted(policy.stored_extensions)],
+                'members': members
+            }, f, ensure_ascii=False)
+        os.replace(temp_path, manifest_path)
+    
+    @staticmethod
+    def _try_lock(lock_path):
+        """非阻塞获取缓存更新锁（跨进程），已被占用返回 None"""
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+    
+    @staticmethod
+    def _unlock(lock_file):
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+    
+    @staticmethod
+    def cached_assignment_archive(assignment_id, entries, policy, on_entry=None):
+        """
+        获取单个作业的压缩包（优先使用缓存）
+        
+        参数:
+            entries: [(submission_id, 源文件路径, 压缩包内文件名), ...]
+            on_entry: 压缩成员前的回调 on_entry(entries 中的序号, 源文件路径, 压缩包内文件名)
+        
+        返回: (缓存文件路径, None)：缓存是最新的（命中，或刚追加了新提交），可直接发送文件；
+              (None, 生成器)：需要重建，生成器边压缩边产出内容，同时写入缓存
+        """
+        from app.models import CacheStat
+        from app.utils.zip_stream import append_to_zip
+        
+        if not current_app.config.get('ASSIGNMENT_ZIP_CACHE', True):
+            return None, DownloadArchiveService._build_assignment_cache(None, entries, policy, on_entry)
+        
+        zip_path, manifest_path, lock_path = DownloadArchiveService._cache_paths(assignment_id)
+        fingerprint, members = DownloadArchiveService._cache_fingerprint(entries, policy)
+        
+        manifest = DownloadArchiveService._load_manifest(manifest_path)
+        if manifest and manifest.get('fingerprint') == fingerprint and os.path.exists(zip_path):
+            # 记录最近使用时间，供过期清理
+            try:
+                os.utime(manifest_path)
+            except OSError:
+                pass
+            CacheStat.record('assignment_zip', hits=1)
+            return zip_path, None
+        
+        CacheStat.record('assignment_zip', misses=1)
+        os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+        lock_file = DownloadArchiveService._try_lock(lock_path)
+        if lock_file is None:
+            # 其他请求正在更新缓存，本次直接边压缩边发送
+            return None, DownloadArchiveService._build_assignment_cache(None, entries, policy, on_entry)
+        
+        try:
+            manifest = DownloadArchiveService._load_manifest(manifest_path)
+            if manifest and manifest.get('fingerprint') == fingerprint and os.path.exists(zip_path):
+                return zip_path, None
+            
+            # 已缓存的成员全部未变化时只追加新提交；有提交删除或文件变化时需要重建
+            cached = manifest.get('members') if manifest and os.path.exists(zip_path) else None
+            current = {member[0]: member for member in members}
+            if cached and manifest.get('policy') == [policy.level, sorted(policy.stored_extensions)] \
+                    and all(current.get(member[0]) == member for member in cached):
+                cached_ids = {member[0] for member in cached}
+                indexes = [i for i, entry in enumerate(entries) if entry[0] not in cached_ids]
+                
+                # 在副本上追加后替换：正在发送旧缓存的请求不受影响（复制在内核中完成，不经过用户态）
+                temp_path = zip_path + '.tmp'
+                shutil.copyfile(zip_path, temp_path)
+                try:
+                    append_to_zip(
+                        temp_path,
+                        [(entries[i][1], entries[i][2]) for i in indexes],
+                        policy,
+                        on_entry=(lambda index, file_path, arcname: on_entry(indexes[index], file_path, arcname))
+                        if on_entry else None
+                    )
+                    os.replace(temp_path, zip_path)
+                except Exception:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
+                DownloadArchiveService._save_manifest(manifest_path, fingerprint, members, policy)
+                print(f"📦 作业压缩包缓存：作业 #{assignment_id} 追加 {len(indexes)} 个新提交")
+                return zip_path, None
+        finally:
+            DownloadArchiveService._unlock(lock_file)
+        
+        return None, DownloadArchiveService._build_assignment_cache(assignment_id, entries, policy, on_entry)
+    
+    @staticmethod
+    def _build_assignment_cache(assignment_id, entries, policy, on_entry):
+        """
+        边压缩边产出压缩包内容；assignment_id 不为 None 时同时写入缓存
+        
+        开始生成时才获取更新锁（被占用则只发送不缓存），客户端中断或出错时丢弃未完成的缓存。
+        """
+        from app.utils.zip_stream import iter_zip_stream
+        
+        chunks = iter_zip_stream([(file_path, arcname) for _, file_path, arcname in entries], policy=policy, on_entry=on_entry)
+        lock_file = None
+        if assignment_id is not None:
+            zip_path, manifest_path, lock_path = DownloadArchiveService._cache_paths(assignment_id)
+            lock_file = DownloadArchiveService._try_lock(lock_path)
+        if lock_file is None:
+            yield from chunks
+            return
+        
+        part_path = zip_path + '.part'
+        completed = False
+        try:
+            with open(part_path, 'wb') as part:
+                for chunk in chunks:
+                    part.write(chunk)
+                    yield chunk
+            os.replace(part_path, zip_path)
+            fingerprint, members = DownloadArchiveService._cache_fingerprint(entries, policy)
+            DownloadArchiveService._save_manifest(manifest_path, fingerprint, members, policy)
+            completed = True
+        finally:
+            if not completed and os.path.exists(part_path):
+                os.remove(part_path)
+            DownloadArchiveService._unlock(lock_file)
+    
+    @staticmethod
+    def invalidate_assignment_cache(assignment_id):
+        """删除作业压缩包缓存（删除提交或作业后调用，指纹也能发现变化，这里只是及时释放磁盘）"""
+        zip_path, manifest_path, _ = DownloadArchiveService._cache_paths(assignment_id)
+        for path in (manifest_path, zip_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    @staticmethod
+    def purge_assignment_cache():
+        """
+        删除超过有效期未下载的作业压缩包缓存，以及作业已删除的缓存
+        
+        返回: 删除的缓存数
+        """
+        from app.models import Assignment
+        
+        cache_dir = current_app.config['ASSIGNMENT_ZIP_CACHE_DIR']
+        if not os.path.isdir(cache_dir):
+            return 0
+        
+        now = time.time()
+        ttl = current_app.config.get('ASSIGNMENT_ZIP_CACHE_TTL', 7 * 86400)
+        existing = {assignment_id for (assignment_id,) in db.session.query(Assignment.id)}
+        deleted = 0
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            base, ext = os.path.splitext(name)
+            try:
+                if ext == '.json':
+                    assignment_id = int(base.rsplit('_', 1)[-1])
+                    if assignment_id not in existing or now - os.path.getmtime(path) > ttl:
+                        DownloadArchiveService.invalidate_assignment_cache(assignment_id)
+                        deleted += 1
+                elif now - os.path.getmtime(path) > DownloadArchiveService.STALE_MINUTES * 60 and (
+                        ext in ('.part', '.tmp') or
+                        (ext == '.zip' and not os.path.exists(os.path.join(cache_dir, base + '.json')))):
+                    # 进程退出留下的未完成文件或没有清单的压缩包
+                    os.remove(path)
+            except (OSError, ValueError):
+                pass
+        return deleted
+    
+    # ==================== 批量下载任务 ====================
+    
+    @staticmethod
+    def create_batch_job(user_id, assignment_ids, download_name):
+        """
+        登记批量打包任务并唤醒后台线程
+        
+        并发名额检查和插入在同一条 INSERT ... SELECT 中完成，同一用户同时发起的多个请求不会都通过检查。
+        返回: (job, error)，用户进行中的任务数达到上限时 job 为 None
+        """
+        from sqlalchemy import select, insert, literal
+        from app.models import BatchDownloadJob
+        
+        limit = current_app.config.get('BATCH_DOWNLOAD_MAX_ACTIVE_PER_USER', 1)
+        values = {
+            'user_id': user_id,
+            'download_name': download_name,
+            'assignment_ids': json.dumps(list(assignment_ids)),
+            'status': BatchDownloadJob.STATUS_PENDING,
+            'created_at': datetime.utcnow()
+        }
+        
+        if limit:
+            active = select(db.func.count(BatchDownloadJob.id)).where(
+                BatchDownloadJob.user_id == user_id,
+                BatchDownloadJob.status.in_(BatchDownloadJob.ACTIVE_STATUSES)
+            ).scalar_subquery()
+            statement = insert(BatchDownloadJob).from_select(
+                list(values),
+                select(*[literal(value) for value in values.values()]).where(active < limit)
+            )
+        else:
+            statement = insert(BatchDownloadJob).values(**values)
+        
+        result = db.session.execute(statement)
+        db.session.commit()
+        if result.rowcount == 0:
+            return None, '已有批量下载正在打包，请等待完成后再试'
+        job = db.session.get(BatchDownloadJob, result.lastrowid)
+        
+        # 与 AI 批改队列共用唤醒通道，持有调度器的进程收到后唤醒打包线程
+        from app.services.ai_queue_service import AIQueueService
+        AIQueueService.notify()
+        return job, None
+    
+    @staticmethod
+    def has_active_job(user_id):
+        """用户是否有排队或打包中的任务"""
+        from app.models import BatchDownloadJob
+        
+        return BatchDownloadJob.query.filter(
+            BatchDownloadJob.user_id == user_id,
+            BatchDownloadJob.status.in_(BatchDownloadJob.ACTIVE_STATUSES)
+        ).first() is not None
+    
+    @staticmethod
+    def get_live_job(user_id):
+        """
+        用户仍在进行的任务：排队中，或打包中且心跳未超时
+        
+        排队中的任务可能在其他用户的任务后面等待很久，进度记录长时间不更新，不能据此判断为已结束。
+        返回: BatchDownloadJob 或 None
+        """
+        from sqlalchemy import or_, and_
+        from app.models import BatchDownloadJob
+        
+        stale_before = datetime.utcnow() - timedelta(minutes=DownloadArchiveService.STALE_MINUTES)
+        return BatchDownloadJob.query.filter(
+            BatchDownloadJob.user_id == user_id,
+            or_(
+                BatchDownloadJob.status == BatchDownloadJob.STATUS_PENDING,
+                and_(BatchDownloadJob.status == BatchDownloadJob.STATUS_RUNNING, BatchDownloadJob.heartbeat_at >= stale_before)
+            )
+        ).order_by(BatchDownloadJob.created_at.desc()).first()
+    
+    @staticmethod
+    def get_artifact(user_id, job_id=None):
+        """
+        获取用户可下载的压缩包（未指定任务时取最近完成的一个）
+        
+        返回: BatchDownloadJob，不存在、已过期或文件已删除时返回 None
+        """
+        from app.models import BatchDownloadJob
+        
+        query = BatchDownloadJob.query.filter_by(user_id=user_id, status=BatchDownloadJob.STATUS_DONE)
+        if job_id:
+            job = query.filter_by(id=job_id).first()
+        else:
+            job = query.order_by(BatchDownloadJob.finished_at.desc()).first()
+        
+        if job is None or not job.artifact_path or not os.path.exists(job.artifact_path):
+            return None
+        if job.expires_at and job.expires_at < datetime.utcnow():
+            return None
+        return job
+    
+    @staticmethod
+    def _claim_next():
+        """原子领取一个待打包任务（含心跳超时的任务），返回任务ID或 None"""
+        from sqlalchemy import or_, and_
+        from app.models import BatchDownloadJob
+        
+        now = datetime.utcnow()
+        stale_before = now - timedelta(minutes=DownloadArchiveService.STALE_MINUTES)
+        candidates = db.session.query(
+            BatchDownloadJob.id, BatchDownloadJob.status, BatchDownloadJob.heartbeat_at
+        ).filter(or_(
+            BatchDownloadJob.status == BatchDownloadJob.STATUS_PENDING,
+            and_(BatchDownloadJob.status == BatchDownloadJob.STATUS_RUNNING, BatchDownloadJob.heartbeat_at < stale_before)
+        )).order_by(BatchDownloadJob.created_at).limit(5).all()
+        
+        for job_id, status, heartbeat_at in candidates:
+            # 条件更新：状态和心跳时间都未变才算领取成功，多个进程同时领取时只有一个成功
+            updated = BatchDownloadJob.query.filter(
+                BatchDownloadJob.id == job_id,
+                BatchDownloadJob.status == status,
+                BatchDownloadJob.heartbeat_at.is_(None) if heartbeat_at is None else BatchDownloadJob.heartbeat_at == heartbeat_at
+            ).update({
+                'status': BatchDownloadJob.STATUS_RUNNING,
+                'started_at': now,
+                'heartbeat_at': now
+            }, synchronize_session=False)
+            db.session.commit()
+            if updated:
+                return job_id
+        return None
+    
+    @staticmethod
+    def _collect_entries(assignment_ids):
+        """
+        列出批量压缩包的成员（每个作业一个文件夹，跳过已不存在的文件）
+        
+        返回: [(源文件路径, 压缩包内路径, 作业序号, 作业标题, 作业内序号, 作业文件数, 原文件名), ...], 作业数
+        """
+        from app.models import Assignment, Submission
+        
+        assignments = {a.id: a for a in Assignment.query.filter(Assignment.id.in_(assignment_ids)).all()}
+        ordered = [assignments[i] for i in assignment_ids if i in assignments]
+        
+        entries = []
+        for assignment_index, assignment in enumerate(ordered):
+            submissions = Submission.query.filter_by(assignment_id=assignment.id).all()
+            folder = DownloadArchiveService.assignment_archive_name(assignment)
+            for submission_index, submission in enumerate(submissions):
+                file_path = DownloadArchiveService.submission_path(submission)
+                if not os.path.exists(file_path):
+                    continue
+                entries.append((
+                    file_path,
+                    f"{folder}/{DownloadArchiveService.submission_zip_name(submission)}",
+                    assignment_index, assignment.title,
+                    submission_index, len(submissions),
+                    submission.original_filename
+                ))
+        return entries, len(ordered)
+    
+    @staticmethod
+    def _run_job(job_id):
+        """打包一个批量下载任务，压缩包先写入 .part 文件，完成后改名"""
+        from app.models import BatchDownloadJob
+        from app.utils.progress_tracker import progress_tracker
+        from app.utils.zip_stream import iter_zip_stream, CompressionPolicy
+        
+        job = db.session.get(BatchDownloadJob, job_id)
+        user_id = job.user_id
+        artifact_dir = current_app.config['BATCH_DOWNLOAD_DIR']
+        os.makedirs(artifact_dir, exist_ok=True)
+        artifact_path = os.path.join(artifact_dir, f'batch_{job_id}.zip')
+        part_path = artifact_path + '.part'
+        start = time.perf_counter()
+        
+        try:
+            entries, total_assignments = DownloadArchiveService._collect_entries(job.get_assignment_ids())
+            last_heartbeat = [time.monotonic()]
+            policy = CompressionPolicy.from_config(current_app.config)
+            
+            def on_entry(index, file_path, arcname):
+                _, _, assignment_index, title, submission_index, submission_count, original_filename = entries[index]
+                progress_tracker.set_progress(user_id, {
+                    'status': 'processing',
+                    'progress': int(((assignment_index + submission_index / submission_count) / total_assignments) * 100),
+                    'message': f'正在压缩: {original_filename}',
+                    'job_id': job_id,
+                    'current_assignment': assignment_index + 1,
+                    'current_assignment_title': title,
+                    'total_assignments': total_assignments,
+                    'current_file': submission_index + 1,
+                    'total_files': submission_count
+                })
+                if time.monotonic() - last_heartbeat[0] >= DownloadArchiveService.HEARTBEAT_INTERVAL:
+                    last_heartbeat[0] = time.monotonic()
+                    BatchDownloadJob.query.filter_by(id=job_id).update(
+                        {'heartbeat_at': datetime.utcnow()}, synchronize_session=False
+                    )
+                    db.session.commit()
+            
+            with open(part_path, 'wb') as f:
+                for chunk in iter_zip_stream([(entry[0], entry[1]) for entry in entries], policy=policy, on_entry=on_entry):
+                    f.write(chunk)
+            os.replace(part_path, artifact_path)
+        except Exception as e:
+            db.session.rollback()
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            job = db.session.get(BatchDownloadJob, job_id)
+            job.status = BatchDownloadJob.STATUS_FAILED
+            job.error_message = str(e)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            progress_tracker.set_progress(user_id, {
+                'status': 'error',
+                'progress': 0,
+                'message': f'批量下载失败: {str(e)}',
+                'job_id': job_id
+            })
+            print(f"❌ 批量下载：任务 #{job_id} 打包失败: {e}")
+            return
+        
+        now = datetime.utcnow()
+        job = db.session.get(BatchDownloadJob, job_id)
+        job.status = BatchDownloadJob.STATUS_DONE
+        job.artifact_path = artifact_path
+        job.file_size = os.path.getsize(artifact_path)
+        job.total_files = len(entries)
+        job.finished_at = now
+        job.expires_at = now + timedelta(seconds=current_app.config.get('BATCH_DOWNLOAD_TTL', 86400))
+        db.session.commit()
+        
+        progress_tracker.set_progress(user_id, {
+            'status': 'completed',
+            'progress': 100,
+            'message': '所有作业压缩完成，准备下载...',
+            'job_id': job_id,
+            'total_assignments': total_assignments,
+            'download_ready': True
+        })
+        print(f"📦 批量下载：任务 #{job_id} 完成，{len(entries)} 个文件，"
+              f"{job.file_size / 1024 / 1024:.1f}MB，耗时 {time.perf_counter() - start:.1f}s")
+    
+    @staticmethod
+    def process_pending():
+        """
+        打包一个待处理任务
+        
+        返回: 是否处理了任务
+        """
+        job_id = DownloadArchiveService._claim_next()
+        if job_id is None:
+            return False
+        DownloadArchiveService._run_job(job_id)
+        return True
+    
+    @staticmethod
+    def wake():
+        """唤醒后台打包线程"""
+        DownloadArchiveService._wake_event.set()
+    
+    @staticmethod
+    def start_background(app):
+        """启动后台打包线程（在持有调度器的进程中调用，任务逐个打包）"""
+        with DownloadArchiveService._thread_lock:
+            if DownloadArchiveService._thread is not None and DownloadArchiveService._thread.is_alive():
+                return
+            thread = threading.Thread(
+                target=DownloadArchiveService._background_loop, args=(app,),
+                name='batch-download-archive', daemon=True
+            )
+            DownloadArchiveService._thread = thread
+            thread.start()
+        # 启动时处理积压的任务
+        DownloadArchiveService.wake()
+    
+    @staticmethod
+    def _background_loop(app):
+        """收到唤醒（或兜底轮询到期）后处理完所有待打包任务"""
+        interval = app.config.get('BATCH_DOWNLOAD_POLL_INTERVAL', 60)
+        while True:
+            DownloadArchiveService._wake_event.wait(timeout=interval)
+            DownloadArchiveService._wake_event.clear()
+            try:
+                with app.app_context():
+                    while DownloadArchiveService.process_pending():
+                        pass
+            except Exception as e:
+                print(f"❌ 批量下载打包失败: {e}")
+    
+    @staticmethod
+    def purge_expired():
+        """
+        删除过期的压缩包和任务记录，以及没有对应任务的残留文件
+        
+        返回: 删除的任务数
+        """
+        from sqlalchemy import or_, and_
+        from app.models import BatchDownloadJob
+        
+        now = datetime.utcnow()
+        ttl = timedelta(seconds=current_app.config.get('BATCH_DOWNLOAD_TTL', 86400))
+        expired = BatchDownloadJob.query.filter(or_(
+            and_(BatchDownloadJob.status == BatchDownloadJob.STATUS_DONE, BatchDownloadJob.expires_at < now),
+            and_(BatchDownloadJob.status == BatchDownloadJob.STATUS_FAILED, BatchDownloadJob.finished_at < now - ttl)
+        )).all()
+        for job in expired:
+            if job.artifact_path:
+                try:
+                    os.remove(job.artifact_path)
+                except OSError:
+                    pass
+            db.session.delete(job)
+        db.session.commit()
+        
+        # 残留文件：任务记录已删除，或进程退出留下的 .part（任务不在打包中）；
+        # 最近修改过的文件可能属于刚完成的任务，留到下次清理
+        artifact_dir = current_app.config['BATCH_DOWNLOAD_DIR']
+        if os.path.isdir(artifact_dir):
+            keep = {
+                os.path.basename(path) for (path,) in db.session.query(BatchDownloadJob.artifact_path).filter(
+                    BatchDownloadJob.status == BatchDownloadJob.STATUS_DONE
+                )
+                if path
+            }
+            keep.update(
+                f'batch_{job_id}.zip.part' for (job_id,) in db.session.query(BatchDownloadJob.id).filter(
+                    BatchDownloadJob.status.in_(BatchDownloadJob.ACTIVE_STATUSES)
+                )
+            )
+            recent = time.time() - DownloadArchiveService.STALE_MINUTES * 60
+            for name in os.listdir(artifact_dir):
+                path = os.path.join(artifact_dir, name)
+                try:
+                    if name not in keep and os.path.getmtime(path) < recent:
+                        os.remove(path)
+                except OSError:
+                    pass
+        return len(expired)
@@ -0,0 +1,256 @@
+"""提交文件文本预提取服务（作业参考答案文件同样在上传后登记预提取）
+
+上传保存文件后只登记一条待提取记录并唤醒后台线程，不等待提取；后台线程（运行在持有调度器的进程中）
+提取文本（PDF/Word 解析、图片 OCR）后压缩保存到 submission_text 表。AI 批改等需要提交文本的地方
+优先使用预提取结果，提取仍在进行时等待其完成，没有记录或提取失败时再当场提取。
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.extensions import db
+
+
+class ExtractionService:
+    """提交文本预提取服务"""
+    
+    # 每次查询的候选记录数（逐条领取：OCR 可能耗时数分钟，批量领取时排在后面的记录会因开始时间过早被判定超时）
+    CANDIDATE_LIMIT = 10
+    
+    # 处理中超过该时间未完成视为进程已退出，重新提取
+    STALE_MINUTES = 10
+    
+    # 等待提取中记录时的轮询间隔（秒）
+    WAIT_POLL_SECONDS = 1
+    
+    _thread = None
+    _thread_lock = threading.Lock()
+    _wake_event = threading.Event()
+    
+    @staticmethod
+    def schedule(kind, submission_id, file_path):
+        """
+        登记后台提取（保存上传文件并提交数据库后调用）
+        
+        只写入一条记录并发送唤醒通知，不等待提取。不支持提取的文件类型直接跳过。
+        返回: 是否已登记
+        """
+        from app.models import SubmissionText
+        from app.services.ai_grading_service import AIGradingService
+        
+        if not current_app.config.get('SUBMISSION_PREEXTRACT', True) or not AIGradingService.is_extractable(file_path):
+            return False
+        
+        try:
+            db.session.merge(SubmissionText(
+                kind=kind,
+                submission_id=submission_id,
+                file_path=file_path,
+                status=SubmissionText.STATUS_PENDING,
+                created_at=datetime.utcnow()
+            ))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"登记预提取失败 {kind}#{submission_id}: {e}")
+            return False
+        
+        # 与 AI 批改队列共用唤醒通道，持有调度器的进程收到后唤醒提取线程
+        from app.services.ai_queue_service import AIQueueService
+        AIQueueService.notify()
+        return True
+    
+    @staticmethod
+    def get_content(kind, submission_id, file_path):
+        """
+        获取提交文件的文本内容
+        
+        已预提取完成直接返回保存的文本；上传时登记的提取仍在进行时等待其完成（最多 SUBMISSION_PREEXTRACT_WAIT 秒），
+        不重复提取/OCR 同一文件。没有记录、提取失败或等待超时时当场提取，并把成功的结果保存下来供后续使用。
+        返回: (content, error)
+        """
+        from app.models import SubmissionText
+        from app.services.ai_grading_service import AIGradingService
+        
+        record = db.session.get(SubmissionText, (kind, submission_id))
+        if record and record.file_path == file_path:
+            record = ExtractionService._wait_in_progress(record)
+            if record.status == SubmissionText.STATUS_DONE:
+                content = record.get_text()
+                if content:
+                    return content, None
+        
+        start = time.perf_counter()
+        content, error = AIGradingService.extract_file_content(file_path)
+        if content:
+            try:
+                ExtractionService._save_result(kind, submission_id, file_path, content, None, start)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.warning(f"保存提取结果失败 {kind}#{submission_id}: {e}")
+        return content, error
+    
+    @staticmethod
+    def _wait_in_progress(record):
+        """
+        等待排队中或提取中（未超时）的记录结束，返回刷新后的记录
+        
+        记录被领取后超过 STALE_MINUTES 未完成视为进程已退出，不再等待。
+        """
+        from app.models import SubmissionText
+        
+        deadline = time.monotonic() + current_app.config.get('SUBMISSION_PREEXTRACT_WAIT', 180)
+        notified = False
+        while record.status in (SubmissionText.STATUS_PENDING, SubmissionText.STATUS_PROCESSING):
+            stale_before = datetime.utcnow() - timedelta(minutes=ExtractionService.STALE_MINUTES)
+            if record.status == SubmissionText.STATUS_PROCESSING and record.started_at and record.started_at < stale_before:
+                break
+            if time.monotonic() >= deadline:
+                current_app.logger.warning(
+                    f"等待预提取超时 {record.kind}#{record.submission_id}，改为当场提取"
+                )
+                break
+            if not notified and record.status == SubmissionText.STATUS_PENDING:
+                # 排队中的记录可能错过了唤醒，再通知一次提取线程
+                from app.services.ai_queue_service import AIQueueService
+                AIQueueService.notify()
+                notified = True
+            time.sleep(ExtractionService.WAIT_POLL_SECONDS)
+            db.session.refresh(record)
+        return record
+    
+    @staticmethod
+    def _save_result(kind, submission_id, file_path, content, error, start):
+        """保存提取结果（成功或失败）"""
+        from app.models import SubmissionText
+        
+        record = db.session.get(SubmissionText, (kind, submission_id))
+        if record is None:
+            record = SubmissionText(kind=kind, submission_id=submission_id, file_path=file_path)
+            db.session.add(record)
+        elif record.file_path != file_path:
+            # 提取期间文件已被替换，结果作废（新文件有自己的待提取记录）
+            return
+        
+        if content:
+            record.set_text(content)
+            record.status = SubmissionText.STATUS_DONE
+            record.error_message = None
+        else:
+            record.status = SubmissionText.STATUS_FAILED
+            record.error_message = error or '未知错误'
+        record.extract_ms = int((time.perf_counter() - start) * 1000)
+        record.extracted_at = datetime.utcnow()
+        db.session.commit()
+    
+    @staticmethod
+    def _claim_next():
+        """原子领取一条待提取记录（含超时未完成的记录），返回 (kind, submission_id, file_path) 或 None"""
+        from sqlalchemy import or_, and_
+        from app.models import SubmissionText
+        
+        now = datetime.utcnow()
+        stale_before = now - timedelta(minutes=ExtractionService.STALE_MINUTES)
+        candidates = db.session.query(
+            SubmissionText.kind, SubmissionText.submission_id, SubmissionText.file_path,
+            SubmissionText.status, SubmissionText.started_at
+        ).filter(or_(
+            SubmissionText.status == SubmissionText.STATUS_PENDING,
+            and_(SubmissionText.status == SubmissionText.STATUS_PROCESSING, SubmissionText.started_at < stale_before)
+        )).order_by(SubmissionText.created_at).limit(ExtractionService.CANDIDATE_LIMIT).all()
+        
+        for kind, submission_id, file_path, status, started_at in candidates:
+            # 条件更新：状态和开始时间都未变才算领取成功，多个进程同时领取时只有一个成功
+            updated = SubmissionText.query.filter(
+                SubmissionText.kind == kind,
+                SubmissionText.submission_id == submission_id,
+                SubmissionText.status == status,
+                SubmissionText.started_at.is_(None) if started_at is None else SubmissionText.started_at == started_at
+            ).update({'status': SubmissionText.STATUS_PROCESSING, 'started_at': now}, synchronize_session=False)
+            db.session.commit()
+            if updated:
+                return kind, submission_id, file_path
+        return None
+    
+    @staticmethod
+    def process_pending():
+        """
+        提取一条待提取记录（领取后立即提取，开始时间准确反映提取进度）
+        
+        返回: 处理的记录数（0 或 1）
+        """
+        from app.services.ai_grading_service import AIGradingService
+        
+        claimed = ExtractionService._claim_next()
+        if claimed is None:
+            return 0
+        
+        kind, submission_id, file_path = claimed
+        start = time.perf_counter()
+        try:
+            content, error = AIGradingService.extract_file_content(file_path)
+        except Exception as e:
+            content, error = None, str(e)
+        try:
+            ExtractionService._save_result(kind, submission_id, file_path, content, error, start)
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ 预提取：保存 {kind}#{submission_id} 失败: {e}")
+            return 1
+        if content:
+            print(f"📄 预提取：{kind}#{submission_id} 完成，{len(content)} 字，耗时 {time.perf_counter() - start:.1f}s")
+        else:
+            print(f"⚠️ 预提取：{kind}#{submission_id} 失败: {error}")
+        return 1
+    
+    @staticmethod
+    def wake():
+        """唤醒后台提取线程"""
+        ExtractionService._wake_event.set()
+    
+    @staticmethod
+    def start_background(app):
+        """启动后台提取线程（在持有调度器的进程中调用，每个进程一个）"""
+        with ExtractionService._thread_lock:
+            if ExtractionService._thread is not None and ExtractionService._thread.is_alive():
+                return
+            thread = threading.Thread(
+                target=ExtractionService._background_loop, args=(app,),
+                name='submission-preextract', daemon=True
+            )
+            ExtractionService._thread = thread
+            thread.start()
+        # 启动时处理积压的记录
+        ExtractionService.wake()
+    
+    @staticmethod
+    def _background_loop(app):
+        """收到唤醒（或兜底轮询到期）后处理完所有待提取记录"""
+        interval = app.config.get('SUBMISSION_PREEXTRACT_POLL_INTERVAL', 60)
+        while True:
+            ExtractionService._wake_event.wait(timeout=interval)
+            ExtractionService._wake_event.clear()
+            try:
+                with app.app_context():
+                    while ExtractionService.process_pending():
+                        pass
+            except Exception as e:
+                print(f"❌ 预提取处理失败: {e}")
+    
+    @staticmethod
+    def purge_orphans():
+        """删除提交（或参考答案所属作业）已被删除的提取记录，返回删除数量"""
+        from app.models import Assignment, Submission, SubmissionText
+        from app.models.team import StageSubmission
+        
+        deleted = 0
+        for kind, model in ((SubmissionText.KIND_ASSIGNMENT, Submission), (SubmissionText.KIND_STAGE, StageSubmission),
+                            (SubmissionText.KIND_REFERENCE, Assignment)):
+            deleted += SubmissionText.query.filter(
+                SubmissionText.kind == kind,
+                ~SubmissionText.submission_id.in_(db.session.query(model.id))
+            ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
@@ -63,6 +63,35 @@ class FileService:
             current_app.logger.error(f"保存参考答案文件失败: {e}")
             return None, None, None, None
     
+    @staticmethod
+    def replace_reference_answer(assignment, ref_file):
+        """
+        保存（或替换）作业的参考答案文件
+        
+        只保存文件并清空旧的提取文本，不在请求中解析/OCR。调用方负责提交数据库会话，提交成功后
+        删除返回的旧文件并登记后台预提取（ExtractionService），AI 批改任务读取一次后回填到作业记录。
+        
+        返回: (是否保存成功, 旧参考答案文件路径)
+        """
+        filename, original_filename, file_path, file_size = FileService.save_reference_answer(ref_file)
+        if not file_path:
+            return False, None
+        
+        old_file_path = assignment.reference_answer_file_path
+        
+        assignment.reference_answer_filename = filename
+        assignment.reference_answer_original_filename = original_filename
+        assignment.reference_answer_file_path = file_path
+        assignment.reference_answer_file_size = file_size
+        
+        # 旧文件的提取结果失效
+        assignment.reference_answer_extracted = None
+        assignment.reference_answer_extracted_at = None
+        
+        if old_file_path == file_path:
+            old_file_path = None
+        return True, old_file_path
+    
     @staticmethod
     def delete_file(file_path):
         """删除文件"""
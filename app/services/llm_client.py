@@ -0,0 +1,132 @@
+"""进程级共享的 LLM 客户端（连接池 + keep-alive + 请求耗时统计）"""
+import logging
+import threading
+import time
+from collections import deque
+
+import httpx
+from openai import OpenAI
+
+
+logger = logging.getLogger(__name__)
+
+
+class LLMClientStats:
+    """LLM 请求统计（进程内，线程安全）"""
+    
+    # 保留最近多少次请求的耗时用于计算分位数
+    LATENCY_WINDOW = 500
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+            self.new_connections = 0
+            self.reused_connections = 0
+            self.latencies = deque(maxlen=self.LATENCY_WINDOW)
+    
+    def record(self, latency, new_connection, status_code):
+        with self.lock:
+            self.requests += 1
+            if new_connection:
+                self.new_connections += 1
+            else:
+                self.reused_connections += 1
+            if status_code >= 400:
+                self.errors += 1
+            self.latencies.append(latency)
+    
+    def snapshot(self):
+        """获取统计快照"""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            requests = self.requests
+            data = {
+                'requests': requests,
+                'errors': self.errors,
+                'new_connections': self.new_connections,
+                'reused_connections': self.reused_connections,
+                'reuse_rate': round(self.reused_connections / requests * 100, 1) if requests else 0
+            }
+        
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3)
+        
+        data['latency_p50'] = percentile(0.5)
+        data['latency_p95'] = percentile(0.95)
+        data['latency_max'] = round(latencies[-1], 3) if latencies else None
+        return data
+
+
+stats = LLMClientStats()
+
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+
+
+def _on_request(request):
+    """请求钩子：记录开始时间，并通过 httpcore trace 检测是否新建了连接"""
+    state = {'start': time.perf_counter(), 'new_connection': False}
+    
+    def trace(event_name, info):
+        if event_name.startswith('connection.connect_tcp.started'):
+            state['new_connection'] = True
+    
+    request.extensions['trace'] = trace
+    request.extensions['tg_edu_state'] = state
+
+
+def _on_response(response):
+    """响应钩子：记录耗时（到收到响应头为止）和连接复用情况"""
+    state = response.request.extensions.get('tg_edu_state')
+    if not state:
+        return
+    latency = time.perf_counter() - state['start']
+    stats.record(latency, state['new_connection'], response.status_code)
+    logger.debug(
+        f"LLM 请求 {response.request.method} {response.request.url.path} -> {response.status_code}, "
+        f"耗时 {latency:.3f}s, {'新建连接' if state['new_connection'] else '复用连接'}"
+    )
+
+
+def get_llm_client(api_key, base_url, connect_timeout=10.0, read_timeout=300.0,
+                   max_connections=20, max_keepalive=10, keepalive_expiry=60.0, max_retries=0):
+    """
+    获取进程级共享的 OpenAI 兼容客户端
+    
+    同一进程内所有评分调用复用同一个 httpx 连接池（keep-alive），避免每次调用重新握手；
+    配置变化时重建客户端。重试默认关闭，由 llm_guard 统一负责退避重试。
+    """
+    global _client, _client_key
+    
+    key = (api_key, base_url, connect_timeout, read_timeout, max_connections, max_keepalive, keepalive_expiry, max_retries)
+    with _client_lock:
+        if _client is not None and _client_key == key:
+            return _client
+        
+        old_client = _client
+        http_client = httpx.Client(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry
+            ),
+            event_hooks={'request': [_on_request], 'response': [_on_response]}
+        )
+        _client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=max_retries)
+        _client_key = key
+    
+    if old_client is not None:
+        try:
+            old_client.close()
+        except Exception:
+            pass
+    return _client
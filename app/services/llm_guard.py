@@ -0,0 +1,329 @@
+"""LLM 调用保护：令牌桶限流、自适应并发、带抖动的指数退避重试和熔断器"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import openai
+
+
+class LLMUnavailableError(Exception):
+    """上游服务暂时不可用（熔断或重试耗尽），调用方应稍后重新排队而不是判定失败"""
+    pass
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """熔断器打开，上游服务暂不可用"""
+    pass
+
+
+class TokenBucket:
+    """令牌桶（按分钟速率补充，rate 为 0 表示不限制）"""
+    
+    def __init__(self, rate_per_minute=0):
+        self.lock = threading.Lock()
+        self.rate_per_minute = 0
+        self.tokens = 0.0
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0  # Retry-After：在此时间前暂停发放
+        self.configure(rate_per_minute)
+    
+    def configure(self, rate_per_minute):
+        with self.lock:
+            if rate_per_minute != self.rate_per_minute:
+                self.rate_per_minute = rate_per_minute
+                self.tokens = float(rate_per_minute)
+                self.updated_at = time.monotonic()
+    
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.tokens = min(float(self.rate_per_minute), self.tokens + elapsed * self.rate_per_minute / 60.0)
+    
+    def acquire(self, amount=1, timeout=None):
+        """
+        取出 amount 个令牌，不足时等待
+        
+        单次请求超过桶容量时，等桶满后放行（避免永远等待）。
+        返回: 是否在超时前取得令牌
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.rate_per_minute <= 0 and now >= self.blocked_until:
+                    return True
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    self._refill(now)
+                    needed = min(float(amount), float(self.rate_per_minute))
+                    if self.tokens >= needed:
+                        self.tokens -= amount
+                        return True
+                    wait = (needed - self.tokens) * 60.0 / self.rate_per_minute
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+    
+    def adjust(self, delta):
+        """按实际用量修正（delta 为正表示退还）"""
+        with self.lock:
+            if self.rate_per_minute > 0:
+                self.tokens = min(float(self.rate_per_minute), self.tokens + delta)
+    
+    def block_for(self, seconds):
+        """暂停发放令牌（遵循上游 Retry-After）"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class AdaptiveConcurrency:
+    """自适应并发限制（AIMD：被限流时减半，成功时缓慢增加）"""
+    
+    def __init__(self, max_limit=10):
+        self.condition = threading.Condition()
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self.in_use = 0
+    
+    def configure(self, max_limit):
+        with self.condition:
+            if max_limit != self.max_limit:
+                self.max_limit = max_limit
+                self.limit = min(self.limit, float(max_limit))
+                self.condition.notify_all()
+    
+    @property
+    def current_limit(self):
+        return max(1, int(self.limit))
+    
+    def acquire(self):
+        with self.condition:
+            while self.in_use >= self.current_limit:
+                self.condition.wait()
+            self.in_use += 1
+    
+    def release(self, throttled=False, success=False):
+        with self.condition:
+            self.in_use -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            elif success:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / max(self.limit, 1.0))
+            self.condition.notify_all()
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却后放行一个试探请求"""
+    
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold=5, cooldown=60):
+        self.lock = threading.Lock()
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+    
+    def configure(self, failure_threshold, cooldown):
+        with self.lock:
+            self.failure_threshold = failure_threshold
+            self.cooldown = cooldown
+    
+    def allow_dispatch(self):
+        """
+        队列是否应继续领取任务（不占用试探名额）
+        
+        试探请求进行中（半开）时暂停领取：除试探请求外的调用都会被拒绝，
+        领取到的任务只会立即重新排队，形成领取-失败-重新排队的空转。
+        """
+        with self.lock:
+            if self.state == self.STATE_OPEN:
+                return time.monotonic() - self.opened_at >= self.cooldown
+            return self.state == self.STATE_CLOSED
+    
+    def is_closed(self):
+        with self.lock:
+            return self.state == self.STATE_CLOSED
+    
+    def allow_request(self):
+        """是否放行本次请求"""
+        with self.lock:
+            if self.state == self.STATE_CLOSED:
+                return True
+            if self.state == self.STATE_OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.STATE_HALF_OPEN
+                return True
+            return False
+    
+    def record_success(self):
+        with self.lock:
+            self.state = self.STATE_CLOSED
+            self.failures = 0
+    
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.STATE_OPEN:
+                    self.trips += 1
+                self.state = self.STATE_OPEN
+                self.opened_at = time.monotonic()
+    
+    def remaining_cooldown(self):
+        with self.lock:
+            if self.state != self.STATE_OPEN:
+                return 0
+            return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+
+class LLMGuard:
+    """LLM 调用保护（进程内共享）"""
+    
+    def __init__(self):
+        self.request_bucket = TokenBucket()
+        self.token_bucket = TokenBucket()
+        self.concurrency = AdaptiveConcurrency()
+        self.circuit = CircuitBreaker()
+        self.max_retries = 4
+        self.backoff_base = 1.0
+        self.backoff_max = 60.0
+        self.stats_lock = threading.Lock()
+        self.retries = 0
+        self.throttled = 0
+    
+    def configure(self, config):
+        """从应用配置更新参数（每次调用前执行，修改配置无需重启）"""
+        self.request_bucket.configure(config.get('DEEPSEEK_RPM_LIMIT', 0))
+        self.token_bucket.configure(config.get('DEEPSEEK_TPM_LIMIT', 0))
+        self.concurrency.configure(config.get('DEEPSEEK_MAX_CONCURRENCY', 10))
+        self.circuit.configure(
+            config.get('DEEPSEEK_CIRCUIT_FAILURE_THRESHOLD', 5),
+            config.get('DEEPSEEK_CIRCUIT_COOLDOWN', 60)
+        )
+        self.max_retries = config.get('DEEPSEEK_MAX_RETRIES', 4)
+        self.backoff_base = config.get('DEEPSEEK_BACKOFF_BASE', 1.0)
+        self.backoff_max = config.get('DEEPSEEK_BACKOFF_MAX', 60.0)
+    
+    @staticmethod
+    def _is_retryable(error):
+        """429、5xx、连接错误和超时可以重试"""
+        if isinstance(error, (openai.RateLimitError, openai.InternalServerError,
+                              openai.APIConnectionError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+    
+    @staticmethod
+    def _get_retry_after(error):
+        """解析 Retry-After（秒数或 HTTP 日期），没有时返回 None"""
+        response = getattr(error, 'response', None)
+        if response is None:
+            return None
+        headers = response.headers
+        try:
+            if headers.get('retry-after-ms'):
+                return float(headers['retry-after-ms']) / 1000
+            value = headers.get('retry-after')
+            if not value:
+                return None
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    
+    def _backoff(self, attempt):
+        """带完全抖动的指数退避"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    def call(self, func, estimated_tokens=0):
+        """
+        在限流、并发控制、重试和熔断保护下执行 LLM 调用
+        
+        func: 无参调用，返回 OpenAI 响应对象
+        返回: 响应对象；熔断时抛出 CircuitOpenError，429/5xx/连接错误重试耗尽时抛出 LLMUnavailableError，
+              其他错误抛出原异常
+        """
+        attempt = 0
+        while True:
+            if not self.circuit.allow_request():
+                raise CircuitOpenError(
+                    f"AI 服务暂不可用（熔断中，{self.circuit.remaining_cooldown():.0f} 秒后重试）"
+                )
+            
+            self.request_bucket.acquire(1)
+            if estimated_tokens:
+                self.token_bucket.acquire(estimated_tokens)
+            
+            self.concurrency.acquire()
+            throttled = False
+            try:
+                response = func()
+            except Exception as e:
+                throttled = isinstance(e, openai.RateLimitError)
+                retryable = self._is_retryable(e)
+                self.concurrency.release(throttled=throttled)
+                
+                if throttled or not retryable:
+                    # 上游有响应（限流或请求错误），说明服务可达
+                    self.circuit.record_success()
+                else:
+                    # 5xx / 连接错误计入熔断
+                    self.circuit.record_failure()
+                
+                if not retryable:
+                    raise
+                
+                if throttled:
+                    with self.stats_lock:
+                        self.throttled += 1
+                
+                if attempt >= self.max_retries:
+                    # 暂时性错误：交给调用方稍后重新排队
+                    raise LLMUnavailableError(
+                        f"AI 服务暂时不可用（重试 {attempt} 次后仍失败）: {e}"
+                    ) from e
+                
+                delay = self._backoff(attempt)
+                retry_after = self._get_retry_after(e)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                    self.request_bucket.block_for(retry_after)
+                
+                with self.stats_lock:
+                    self.retries += 1
+                attempt += 1
+                time.sleep(delay)
+                continue
+            
+            self.concurrency.release(success=True)
+            self.circuit.record_success()
+            
+            # 按实际 token 用量修正令牌桶
+            usage = getattr(response, 'usage', None)
+            if estimated_tokens and usage is not None and getattr(usage, 'total_tokens', None):
+                self.token_bucket.adjust(estimated_tokens - usage.total_tokens)
+            
+            return response
+    
+    def snapshot(self):
+        """获取当前状态"""
+        with self.stats_lock:
+            retries = self.retries
+            throttled = self.throttled
+        return {
+            'circuit_state': self.circuit.state,
+            'circuit_trips': self.circuit.trips,
+            'circuit_cooldown_remaining': round(self.circuit.remaining_cooldown(), 1),
+            'concurrency_limit': self.concurrency.current_limit,
+            'retries': retries,
+            'throttled': throttled
+        }
+
+
+llm_guard = LLMGuard()
@@ -0,0 +1,123 @@
+"""Tesseract OCR 引擎（摊薄语言模型加载开销）
+
+pytesseract 每识别一张图片都启动一个 tesseract 进程并重新加载 chi_sim+eng 语言模型，
+文档中小图片较多时，模型加载时间远超识别本身。这里提供两种摊薄方式：
+
+- TesserocrEngine：通过 tesserocr（libtesseract 的 Python 绑定，可选依赖）在进程内常驻引擎，
+  每个线程一个实例，语言模型只加载一次
+- TesseractBatchEngine：把一批图片写入临时目录，用图片列表文件作为输入调用一次 tesseract 命令，
+  一批图片只加载一次模型，输出按页分隔符切分回每张图片的文本
+
+OCR_ENGINE=auto 时优先使用 tesserocr，未安装则使用批量命令行。
+"""
+import os
+import subprocess
+import tempfile
+import threading
+
+
+class TesserocrEngine:
+    """进程内常驻的 tesserocr 引擎（每个线程一个实例）"""
+    
+    name = 'tesserocr'
+    
+    def __init__(self):
+        import tesserocr  # noqa: F401 仅检查是否可用
+        self._local = threading.local()
+    
+    def _get_api(self, lang):
+        import tesserocr
+        api = getattr(self._local, 'api', None)
+        if api is None or self._local.lang != lang:
+            if api is not None:
+                api.End()
+            api = tesserocr.PyTessBaseAPI(lang=lang)
+            self._local.api = api
+            self._local.lang = lang
+        return api
+    
+    def recognize(self, images, lang):
+        """识别一批 PIL 图片，返回等长的文本列表"""
+        api = self._get_api(lang)
+        texts = []
+        for image in images:
+            api.SetImage(image)
+            texts.append(api.GetUTF8Text().strip())
+        return texts
+
+
+class TesseractBatchEngine:
+    """一次 tesseract 命令识别一批图片"""
+    
+    name = 'tesseract_batch'
+    
+    # 页分隔符：tesseract 在每张图片的识别结果之后输出
+    PAGE_SEPARATOR = '\n<<<TG_EDU_OCR_PAGE_END>>>\n'
+    
+    def __init__(self, tesseract_cmd='tesseract', timeout_per_image=30):
+        self.tesseract_cmd = tesseract_cmd
+        self.timeout_per_image = timeout_per_image
+    
+    def _run(self, input_path, lang, timeout):
+        result = subprocess.run(
+            [self.tesseract_cmd, input_path, 'stdout', '-l', lang,
+             '-c', f'page_separator={self.PAGE_SEPARATOR}'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+            check=True
+        )
+        return result.stdout.decode('utf-8', errors='ignore')
+    
+    def recognize(self, images, lang):
+        """识别一批 PIL 图片，返回等长的文本列表"""
+        if not images:
+            return []
+        
+        with tempfile.TemporaryDirectory(prefix='tg_edu_ocr_') as temp_dir:
+            paths = []
+            for i, image in enumerate(images):
+                path = os.path.join(temp_dir, f'{i:05d}.png')
+                image.save(path, format='PNG')
+                paths.append(path)
+            
+            list_path = os.path.join(temp_dir, 'images.txt')
+            with open(list_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(paths) + '\n')
+            output = self._run(list_path, lang, self.timeout_per_image * len(paths))
+            
+            parts = output.split(self.PAGE_SEPARATOR)
+            if len(parts) == len(paths) + 1 and not parts[-1].strip():
+                parts = parts[:-1]
+            if len(parts) == len(paths):
+                return [part.strip() for part in parts]
+            
+            # 输出无法按图片切分（tesseract 版本不支持页分隔符等），逐张识别
+            return [
+                self._run(path, lang, self.timeout_per_image).replace(self.PAGE_SEPARATOR, '').strip()
+                for path in paths
+            ]
+
+
+_engine = None
+_engine_key = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(engine_name='auto', tesseract_cmd='tesseract'):
+    """获取进程内共享的 OCR 引擎（配置变化时重建）"""
+    global _engine, _engine_key
+    key = (engine_name, tesseract_cmd)
+    with _engine_lock:
+        if _engine is None or _engine_key != key:
+            engine = None
+            if engine_name in ('auto', 'tesserocr'):
+                try:
+                    engine = TesserocrEngine()
+                except ImportError:
+                    if engine_name == 'tesserocr':
+                        raise
+            if engine is None:
+                engine = TesseractBatchEngine(tesseract_cmd)
+            _engine, _engine_key = engine, key
+        return _engine
@@ -0,0 +1,100 @@
+"""扫描件 PDF 并行 OCR（按页流式处理，内存占用与页数无关）"""
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+# 进程池（懒加载，进程内共享；使用 spawn 避免在多线程/gevent 进程中 fork）
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def ocr_pdf_page(file_path, page_num, dpi=200, lang='chi_sim+eng', max_side=None, binarize=False):
+    """
+    栅格化 PDF 的单页并 OCR（在子进程中执行）
+    
+    每次只转换一页，页面图片用完即释放。指定 max_side 或 binarize 时先做灰度预处理。
+    """
+    from pdf2image import convert_from_path
+    import pytesseract
+    
+    images = []
+    try:
+        images = convert_from_path(file_path, dpi=dpi, first_page=page_num, last_page=page_num)
+        if not images:
+            return ''
+        image = images[0]
+        if max_side or binarize:
+            from app.utils.ocr_preprocess import preprocess
+            image = preprocess(image, max_side=max_side or max(image.size), binarize=binarize)
+        return pytesseract.image_to_string(image, lang=lang).strip()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"PDF 第{page_num}页 OCR 失败: {e}")
+        return ''
+    finally:
+        for image in images:
+            image.close()
+
+
+def _get_pool(workers):
+    """获取进程池，并行度变化时重建"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_pool():
+    """子进程异常退出后丢弃进程池，下次使用时重建"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+        _pool_workers = 0
+
+
+def iter_pdf_page_texts(file_path, page_count, dpi=200, workers=1, lang='chi_sim+eng', window=None,
+                       max_side=None, binarize=False):
+    """
+    按页码顺序逐页返回 OCR 文本
+    
+    最多同时提交 window 页（默认 workers * 2），已完成的页按顺序取出后才提交新页，
+    因此无论 PDF 有多少页，同时存在的页面图片数量都是有界的。
+    
+    返回: 生成器，依次产出 (page_num, text)
+    """
+    if workers <= 1:
+        for page_num in range(1, page_count + 1):
+            yield page_num, ocr_pdf_page(file_path, page_num, dpi, lang, max_side, binarize)
+        return
+    
+    window = window or workers * 2
+    pool = _get_pool(workers)
+    pending = deque()
+    next_page = 1
+    
+    try:
+        while next_page <= page_count or pending:
+            while next_page <= page_count and len(pending) < window:
+                pending.append((next_page, pool.submit(ocr_pdf_page, file_path, next_page, dpi, lang, max_side, binarize)))
+                next_page += 1
+            page_num, future = pending.popleft()
+            yield page_num, future.result()
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+    finally:
+        for _, future in pending:
+            future.cancel()
@@ -0,0 +1,105 @@
+"""AI 批改队列唤醒通知
+
+入队的 Web 进程与消费队列的进程（持有调度器的 gunicorn worker、独立 worker）通常不是同一个进程。
+每个消费进程在通知目录下绑定一个 Unix 数据报套接字（<pid>.sock），入队时向目录下所有套接字
+发送一个字节即可立即唤醒它们；通知丢失时由较长间隔的兜底轮询补上。
+"""
+import glob
+import os
+import socket
+
+DEFAULT_NOTIFY_DIR = '/tmp/tg_edu_ai_queue_notify'
+
+
+def _get_notify_dir():
+    """通知目录（应用上下文外使用默认目录）"""
+    try:
+        from flask import current_app
+        return current_app.config.get('AI_QUEUE_NOTIFY_DIR', DEFAULT_NOTIFY_DIR)
+    except RuntimeError:
+        return DEFAULT_NOTIFY_DIR
+
+
+def is_supported():
+    """当前平台是否支持 Unix 数据报套接字"""
+    return hasattr(socket, 'AF_UNIX')
+
+
+class QueueListener:
+    """队列唤醒监听器（每个消费进程一个）"""
+
+    def __init__(self, notify_dir=None):
+        self.notify_dir = notify_dir or _get_notify_dir()
+        os.makedirs(self.notify_dir, exist_ok=True)
+        self.path = os.path.join(self.notify_dir, f'{os.getpid()}.sock')
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+
+    def wait(self, timeout=None):
+        """
+        等待唤醒通知
+
+        返回: True 表示收到通知，False 表示超时
+        """
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.recv(64)
+        except socket.timeout:
+            return False
+
+        # 合并积压的通知，一次调度即可处理
+        self.sock.setblocking(False)
+        try:
+            while True:
+                self.sock.recv(64)
+        except (BlockingIOError, OSError):
+            pass
+        return True
+
+    def close(self):
+        """关闭并移除套接字文件"""
+        try:
+            self.sock.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def notify_queue(notify_dir=None):
+    """
+    唤醒所有监听中的队列消费进程（失败不抛异常）
+
+    返回: 成功通知的进程数
+    """
+    if not is_supported():
+        return 0
+
+    notify_dir = notify_dir or _get_notify_dir()
+    notified = 0
+    sock = None
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        for path in glob.glob(os.path.join(notify_dir, '*.sock')):
+            try:
+                sock.sendto(b'1', path)
+                notified += 1
+            except BlockingIOError:
+                # 接收缓冲区已满，说明已有未处理的通知
+                notified += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # 进程已退出留下的套接字文件
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except OSError:
+                continue
+    except OSError:
+        pass
+    finally:
+        if sock is not None:
+            sock.close()
+    return notified
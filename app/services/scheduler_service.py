@@ -17,8 +17,8 @@ def init_scheduler(app):
     
     # 检查是否是迁移脚本或工具脚本（不启动调度器）
     script_name = os.path.basename(sys.argv[0] if sys.argv else '')
-    # 迁移脚本和工具脚本都可能在 migrations/ 或 scripts/ 目录下
-    if script_name.startswith('migrate_') or script_name in ['init_db.py', 'update_stage_status.py', 'enable_wal_mode.py']:
+    # 迁移脚本和工具脚本都可能在 migrations/ 或 scripts/ 目录下（基准测试脚本自行驱动队列）
+    if script_name.startswith(('migrate_', 'bench_')) or script_name in ['init_db.py', 'update_stage_status.py', 'enable_wal_mode.py', 'ai_queue_worker.py']:
         return
     
     # 检查是否已有其他worker启动了调度器
@@ -65,10 +65,22 @@ def init_scheduler(app):
                 import traceback
                 traceback.print_exc()
     
-    # 添加定时任务：每10秒处理一次AI批改队列
-    @scheduler.task('interval', id='process_ai_queue', seconds=10, misfire_grace_time=60)
+    # 添加定时任务：每分钟把本进程累计的缓存命中统计写入数据库
+    @scheduler.task('interval', id='flush_cache_stats', minutes=1, misfire_grace_time=60)
+    def scheduled_cache_stat_flush():
+        """写入缓存命中统计"""
+        with app.app_context():
+            try:
+                from app.models import CacheStat
+                CacheStat.flush()
+            except Exception as e:
+                print(f"❌ 缓存统计写入失败: {str(e)}")
+    
+    # 添加定时任务：兜底轮询AI批改队列（入队时会通过唤醒通知立即调度）
+    @scheduler.task('interval', id='process_ai_queue', seconds=app.config.get('AI_QUEUE_POLL_INTERVAL', 60),
+                    misfire_grace_time=60)
     def scheduled_ai_queue_process():
-        """定时处理AI批改队列"""
+        """定时处理AI批改队列（兜底）"""
         with app.app_context():
             try:
                 from app.services.ai_queue_service import AIQueueService
@@ -78,6 +90,64 @@ def init_scheduler(app):
                 import traceback
                 traceback.print_exc()
     
+    # 添加定时任务：每天凌晨归档过期的AI批改任务
+    @scheduler.task('cron', id='archive_ai_tasks', hour=3, minute=30, misfire_grace_time=3600)
+    def scheduled_ai_task_archive():
+        """归档过期的AI批改任务"""
+        with app.app_context():
+            try:
+                from app.services.ai_queue_service import AIQueueService
+                AIQueueService.archive_old_tasks()
+            except Exception as e:
+                print(f"❌ AI批改任务归档失败: {str(e)}")
+                import traceback
+                traceback.print_exc()
+    
+    # 添加定时任务：每天清理已删除提交的预提取文本
+    @scheduler.task('cron', id='purge_submission_texts', hour=3, minute=45, misfire_grace_time=3600)
+    def scheduled_submission_text_purge():
+        """清理已删除提交的预提取文本"""
+        with app.app_context():
+            try:
+                from app.services.extraction_service import ExtractionService
+                deleted = ExtractionService.purge_orphans()
+                print(f"✅ 定时任务：已清理 {deleted} 条预提取文本")
+            except Exception as e:
+                print(f"❌ 预提取文本清理失败: {str(e)}")
+                import traceback
+                traceback.print_exc()
+    
+    # 添加定时任务：每30分钟删除过期的批量下载压缩包和作业压缩包缓存
+    @scheduler.task('interval', id='purge_batch_downloads', minutes=30, misfire_grace_time=900)
+    def scheduled_batch_download_purge():
+        """删除过期的批量下载压缩包和作业压缩包缓存"""
+        with app.app_context():
+            try:
+                from app.services.download_archive_service import DownloadArchiveService
+                deleted = DownloadArchiveService.purge_expired()
+                if deleted:
+                    print(f"✅ 定时任务：已删除 {deleted} 个过期的批量下载")
+                deleted = DownloadArchiveService.purge_assignment_cache()
+                if deleted:
+                    print(f"✅ 定时任务：已删除 {deleted} 个过期的作业压缩包缓存")
+            except Exception as e:
+                print(f"❌ 批量下载清理失败: {str(e)}")
+                import traceback
+                traceback.print_exc()
+    
     # 启动调度器
     scheduler.start()
+    
+    # 启动AI批改队列唤醒监听
+    from app.services.ai_queue_service import AIQueueService
+    if AIQueueService.start_wakeup_listener(app):
+        print(f"🔔 Worker {current_pid}: AI批改队列唤醒监听已启动")
+    
+    # 启动上传文件后台预提取线程
+    from app.services.extraction_service import ExtractionService
+    ExtractionService.start_background(app)
+    
+    # 启动批量下载后台打包线程
+    from app.services.download_archive_service import DownloadArchiveService
+    DownloadArchiveService.start_background(app)
     print(f"🚀 Worker {current_pid}: 定时任务调度器已启动")
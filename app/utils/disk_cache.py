@@ -0,0 +1,165 @@
+"""基于文件系统的内容寻址缓存，支持多worker环境"""
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class DiskCache:
+    """
+    磁盘缓存（gzip 压缩的 JSON 文件）
+    
+    - 写入先落临时文件再原子替换，多个 gunicorn worker 可安全共享同一目录
+    - 命中时刷新文件 mtime，超过容量上限时按 mtime 淘汰最久未使用的条目（LRU）
+    - 命中/未命中/淘汰次数记录到 CacheStat（进程内累计、定期批量写入），所有 worker 汇总
+    - 指定 ttl（秒）时条目带过期时间，过期条目视为未命中并删除
+    """
+    
+    # 每写入多少次检查一次容量（扫描目录有开销，不必每次写入都检查）
+    EVICT_CHECK_INTERVAL = 20
+    
+    def __init__(self, name, cache_dir, max_bytes, ttl=None):
+        self.name = name
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._writes_since_check = self.EVICT_CHECK_INTERVAL  # 首次写入即检查
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def _get_path(self, key):
+        """按 key 前两位分目录，避免单目录文件过多"""
+        return os.path.join(self.cache_dir, key[:2], f'{key}.json.gz')
+    
+    def _record(self, hits=0, misses=0, evictions=0):
+        """记录统计（失败不影响缓存本身）"""
+        try:
+            from app.models.cache_stat import CacheStat
+            CacheStat.record(self.name, hits=hits, misses=misses, evictions=evictions)
+        except Exception:
+            pass
+    
+    def get(self, key):
+        """读取缓存，未命中返回 None"""
+        path = self._get_path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                value = json.load(f)
+        except (FileNotFoundError, OSError, ValueError):
+            self._record(misses=1)
+            return None
+        
+        if self.ttl:
+            if not isinstance(value, dict) or value.get('expires_at', 0) < time.time():
+                self.delete(key)
+                self._record(misses=1)
+                return None
+            value = value.get('value')
+        
+        try:
+            os.utime(path, None)  # LRU：刷新最近使用时间
+        except OSError:
+            pass
+        self._record(hits=1)
+        return value
+    
+    def set(self, key, value):
+        """写入缓存"""
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        if self.ttl:
+            value = {'expires_at': time.time() + self.ttl, 'value': value}
+        
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        
+        with self.lock:
+            self._writes_since_check += 1
+            should_check = self._writes_since_check >= self.EVICT_CHECK_INTERVAL
+            if should_check:
+                self._writes_since_check = 0
+        if should_check:
+            self.evict()
+    
+    def delete(self, key):
+        """删除条目"""
+        try:
+            os.remove(self._get_path(key))
+            return True
+        except OSError:
+            return False
+    
+    def evict(self):
+        """容量超限时淘汰最久未使用的条目，直到降到上限的 90%"""
+        entries = []
+        total_size = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if not filename.endswith('.json.gz'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total_size += st.st_size
+        
+        if total_size <= self.max_bytes:
+            return 0
+        
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total_size <= target:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+                evicted += 1
+            except OSError:
+                continue
+        
+        if evicted:
+            self._record(evictions=evicted)
+        return evicted
+    
+    def get_size(self):
+        """当前缓存占用字节数与条目数"""
+        total_size = 0
+        count = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if filename.endswith('.json.gz'):
+                    try:
+                        total_size += os.path.getsize(os.path.join(root, filename))
+                        count += 1
+                    except OSError:
+                        continue
+        return total_size, count
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_disk_cache(name, cache_dir, max_bytes, ttl=None):
+    """获取进程内共享的缓存实例"""
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None or cache.cache_dir != cache_dir or bool(cache.ttl) != bool(ttl):
+            cache = DiskCache(name, cache_dir, max_bytes, ttl=ttl)
+            _caches[name] = cache
+        cache.max_bytes = max_bytes
+        cache.ttl = ttl
+        return cache
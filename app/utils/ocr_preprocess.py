@@ -0,0 +1,74 @@
+"""OCR 前的图片预处理
+
+- 过滤：尺寸过小（图标、项目符号）或几乎纯色（分隔线、底纹）的装饰性图片不做 OCR
+- 缩放：超大图片按最长边缩小，Tesseract 耗时与像素数近似成正比
+- 灰度 + 二值化：去掉彩色背景和水印的干扰（阈值用 Otsu 法按图片直方图自动确定）
+"""
+from PIL import Image, ImageOps
+
+
+def _flatten(image):
+    """透明背景铺白底（否则转灰度后透明区域变黑，整张图被当成黑底）"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGBA', rgba.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, rgba).convert('RGB')
+    return image
+
+
+def is_decorative(image, min_side=40, min_pixels=20000, min_contrast=32):
+    """
+    判断是否为不需要 OCR 的装饰性图片
+    
+    返回: 跳过原因字符串，需要 OCR 时返回 None
+    """
+    width, height = image.size
+    if min(width, height) < min_side or width * height < min_pixels:
+        return 'too_small'
+    # 缩略图上最亮与最暗像素的差距过小（纯色、底纹），不可能包含文字
+    thumbnail = _flatten(image).convert('L')
+    thumbnail.thumbnail((256, 256))
+    darkest, brightest = thumbnail.getextrema()
+    if brightest - darkest < min_contrast:
+        return 'blank'
+    return None
+
+
+def otsu_threshold(histogram):
+    """Otsu 法：选取使前景/背景类间方差最大的灰度阈值"""
+    total = sum(histogram)
+    if not total:
+        return 128
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_background = 0
+    weight_background = 0
+    best_threshold, best_variance = 128, -1.0
+    for threshold, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += threshold * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = threshold, variance
+    return best_threshold
+
+
+def preprocess(image, max_side=2500, binarize=True):
+    """
+    OCR 前预处理：铺白底、转灰度、缩小超大图片、二值化
+    
+    返回: 新的 PIL Image（不修改传入的图片）
+    """
+    image = _flatten(ImageOps.exif_transpose(image)).convert('L')
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if binarize:
+        threshold = otsu_threshold(image.histogram())
+        image = image.point(lambda p: 255 if p > threshold else 0)
+    return image
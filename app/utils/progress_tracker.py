@@ -1,106 +1,185 @@
-"""批量下载进度跟踪工具"""
+"""下载进度跟踪工具
+
+进度保存在独立的 SQLite 数据库（WAL 模式）中，同一台机器上的所有 gunicorn worker 共享：
+每次更新只改写一行，读取不会被写入阻塞。同一任务的处理中进度按时间间隔和百分比步长节流，
+状态变化（开始、完成、出错）总是立即写入。每条记录带过期时间，过期后视为不存在并在写入时顺带删除。
+"""
 import os
 import json
 import time
+import sqlite3
+import logging
 from threading import Lock
 
+logger = logging.getLogger(__name__)
+
+# 未在应用上下文中使用时的默认设置（与 config.py 中的默认值一致）
+DEFAULT_DB_PATH = '/app/storage/data/progress.db'
+DEFAULT_MIN_INTERVAL = 0.5
+DEFAULT_MIN_STEP = 5
+DEFAULT_TTL = 3600
+
+# 两次清理过期记录的最小间隔（秒）
+PURGE_INTERVAL = 60
+
+# 处理中的进度超过该时间（秒）未更新视为已结束
+STALE_SECONDS = 300
+
+
 class ProgressTracker:
-    """基于文件系统的进度跟踪器，支持多worker环境"""
+    """基于 SQLite 的进度跟踪器，支持多worker环境"""
     
-    def __init__(self, storage_dir='/app/storage/data'):
-        self.storage_dir = storage_dir
+    def __init__(self, db_path=None, min_interval=None, min_step=None, ttl=None):
+        """
+        参数（未指定时从应用配置读取）:
+            db_path: 进度数据库文件路径
+            min_interval: 处理中进度两次写入的最小间隔（秒）
+            min_step: 进度前进达到该百分比时不受时间间隔限制
+            ttl: 记录的有效期（秒）
+        """
+        self.db_path = db_path
+        self.min_interval = min_interval
+        self.min_step = min_step
+        self.ttl = ttl
         self.lock = Lock()
-        os.makedirs(storage_dir, exist_ok=True)
-    
-    def _get_progress_file(self, user_id, extra_key=None):
-        """获取进度文件路径"""
-        if extra_key:
-            return os.path.join(self.storage_dir, f'download_progress_{user_id}_{extra_key}.json')
-        return os.path.join(self.storage_dir, f'batch_download_progress_{user_id}.json')
+        self._conn = None
+        self._pid = None
+        self._last_purge = 0
+        # 本进程最近一次写入的 {(user_id, key): (时间, 状态, 进度)}，用于节流
+        self._last_write = {}
     
-    def set_progress(self, user_id, progress_data, extra_key=None):
-        """设置进度数据"""
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        progress_file = self._get_progress_file(user_id, extra_key)
+    def _load_settings(self):
+        """首次使用时从应用配置补全未指定的设置"""
+        from flask import current_app, has_app_context
         
-        # 添加时间戳
-        progress_data['updated_at'] = time.time()
+        config = current_app.config if has_app_context() else {}
+        if self.db_path is None:
+            self.db_path = config.get('PROGRESS_DB_PATH', DEFAULT_DB_PATH)
+        if self.min_interval is None:
+            self.min_interval = config.get('PROGRESS_MIN_INTERVAL', DEFAULT_MIN_INTERVAL)
+        if self.min_step is None:
+            self.min_step = config.get('PROGRESS_MIN_STEP', DEFAULT_MIN_STEP)
+        if self.ttl is None:
+            self.ttl = config.get('PROGRESS_TTL', DEFAULT_TTL)
+    
+    def _connection(self):
+        """进程内共享的数据库连接（调用方持有 self.lock）；fork 出的 worker 重新连接"""
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
         
-        logger.warning(f"[进度跟踪器] 写入进度: 用户{user_id}, key={extra_key or 'batch'}, 状态={progress_data.get('status')}, 进度={progress_data.get('progress')}%")
+        self._load_settings()
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # 进度数据丢失无关紧要，不需要每次提交都刷盘
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS progress ('
+            'user_id INTEGER NOT NULL, '
+            'key TEXT NOT NULL, '
+            'data TEXT NOT NULL, '
+            'updated_at REAL NOT NULL, '
+            'expires_at REAL NOT NULL, '
+            'PRIMARY KEY (user_id, key)'
+            ') WITHOUT ROWID'
+        )
+        self._conn = conn
+        self._pid = os.getpid()
+        self._last_write = {}
+        return conn
+    
+    def _should_write(self, record_key, status, progress, now):
+        """处理中的进度在间隔和步长都未达到时跳过；状态变化总是写入"""
+        last = self._last_write.get(record_key)
+        if last is None or status != 'processing' or last[1] != status:
+            return True
+        last_time, _, last_progress = last
+        if now - last_time >= self.min_interval:
+            return True
+        try:
+            return progress - last_progress >= self.min_step
+        except TypeError:
+            return True
+    
+    def set_progress(self, user_id, progress_data, extra_key=None):
+        """设置进度数据（可能被节流跳过）"""
+        key = extra_key or 'batch'
+        record_key = (user_id, key)
+        status = progress_data.get('status')
+        progress = progress_data.get('progress', 0)
+        now = time.time()
         
         with self.lock:
             try:
-                with open(progress_file, 'w', encoding='utf-8') as f:
-                    json.dump(progress_data, f, ensure_ascii=False)
-                logger.warning(f"[进度跟踪器] 进度文件写入成功: {progress_file}")
-            except Exception as e:
-                logger.error(f'[进度跟踪器] 写入进度文件失败: {e}')
-                import traceback
-                logger.error(traceback.format_exc())
+                conn = self._connection()
+                if not self._should_write(record_key, status, progress, now):
+                    return
+                
+                progress_data['updated_at'] = now
+                conn.execute(
+                    'INSERT OR REPLACE INTO progress (user_id, key, data, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)',
+                    (user_id, key, json.dumps(progress_data, ensure_ascii=False), now, now + self.ttl)
+                )
+                if status == 'processing':
+                    self._last_write[record_key] = (now, status, progress)
+                else:
+                    self._last_write.pop(record_key, None)
+                
+                if now - self._last_purge >= PURGE_INTERVAL:
+                    self._last_purge = now
+                    conn.execute('DELETE FROM progress WHERE expires_at <= ?', (now,))
+            except sqlite3.Error as e:
+                logger.error(f'[进度跟踪器] 写入进度失败: 用户{user_id}, key={key}: {e}')
     
-    def get_progress(self, user_id, extra_key=None):
-        """获取进度数据"""
-        import logging
-        logger = logging.getLogger(__name__)
+    def get_progress(self, user_id, extra_key=None, check_stale=True):
+        """获取进度数据（check_stale=False 时调用方自行判断任务是否仍在进行，不做超时改写）"""
+        key = extra_key or 'batch'
         
-        progress_file = self._get_progress_file(user_id, extra_key)
+        with self.lock:
+            try:
+                row = self._connection().execute(
+                    'SELECT data FROM progress WHERE user_id = ? AND key = ? AND expires_at > ?',
+                    (user_id, key, time.time())
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f'[进度跟踪器] 读取进度失败: 用户{user_id}, key={key}: {e}')
+                return {
+                    'status': 'error',
+                    'progress': 0,
+                    'message': f'读取进度失败: {str(e)}'
+                }
         
-        if not os.path.exists(progress_file):
-            logger.warning(f"[进度跟踪器] 进度文件不存在: {progress_file}, 返回completed状态（可能已完成）")
-            # 返回completed状态，而不是pending，因为文件不存在通常意味着任务已完成
+        if row is None:
+            # 返回completed状态，而不是pending，因为没有记录通常意味着任务已完成
             return {
                 'status': 'completed',
                 'progress': 100,
                 'message': '下载已完成'
             }
         
-        try:
-            with open(progress_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            logger.warning(f"[进度跟踪器] 读取进度: 用户{user_id}, key={extra_key or 'batch'}, 状态={data.get('status')}, 进度={data.get('progress')}%")
-                
-            # 检查是否超时（5分钟）
-            if 'updated_at' in data:
-                elapsed = time.time() - data['updated_at']
-                if elapsed > 300 and data.get('status') not in ['completed', 'error']:
-                    logger.warning(f"[进度跟踪器] 检测到超时 ({elapsed:.1f}秒), 标记为完成")
-                    data['status'] = 'completed'
-                    data['progress'] = 100
-                    data['message'] = '下载已完成（检测到超时）'
-                    data['timeout'] = True
-            
-            return data
-        except Exception as e:
-            logger.error(f'[进度跟踪器] 读取进度文件失败: {e}')
-            import traceback
-            logger.error(traceback.format_exc())
-            return {
-                'status': 'error',
-                'progress': 0,
-                'message': f'读取进度失败: {str(e)}'
-            }
+        data = json.loads(row[0])
+        
+        # 检查是否超时（5分钟）
+        if check_stale and 'updated_at' in data:
+            elapsed = time.time() - data['updated_at']
+            if elapsed > STALE_SECONDS and data.get('status') not in ['completed', 'error']:
+                data['status'] = 'completed'
+                data['progress'] = 100
+                data['message'] = '下载已完成（检测到超时）'
+                data['timeout'] = True
+        
+        return data
     
     def clear_progress(self, user_id, extra_key=None):
         """清理进度数据"""
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        progress_file = self._get_progress_file(user_id, extra_key)
-        
-        logger.warning(f"[进度跟踪器] 清理进度文件: {progress_file}")
+        key = extra_key or 'batch'
         
         with self.lock:
+            self._last_write.pop((user_id, key), None)
             try:
-                if os.path.exists(progress_file):
-                    os.remove(progress_file)
-                    logger.warning(f"[进度跟踪器] 进度文件删除成功")
-                else:
-                    logger.warning(f"[进度跟踪器] 进度文件不存在，无需删除")
-            except Exception as e:
-                logger.error(f'[进度跟踪器] 删除进度文件失败: {e}')
+                self._connection().execute('DELETE FROM progress WHERE user_id = ? AND key = ?', (user_id, key))
+            except sqlite3.Error as e:
+                logger.error(f'[进度跟踪器] 删除进度失败: 用户{user_id}, key={key}: {e}')
 
 
 # 全局实例
@@ -0,0 +1,66 @@
+"""分阶段计时工具
+
+在 recording() 范围内，当前线程中所有 timed(stage) 代码块的耗时会累加到同一个记录器，
+调用链上的各层（队列、文件提取、OCR、AI 调用）无需层层传参即可上报各阶段耗时。
+不在 recording() 范围内时 timed() 不做任何事。
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class StageRecorder:
+    """阶段耗时与计数记录"""
+
+    def __init__(self):
+        self.durations = {}  # 阶段 -> 累计秒数
+        self.values = {}     # 名称 -> 累计数值（如 token 数）
+
+    def add_duration(self, stage, seconds):
+        self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    def add_value(self, name, value):
+        if value is None:
+            return
+        self.values[name] = self.values.get(name, 0) + value
+
+    def get_ms(self, stage):
+        """阶段耗时（毫秒），未记录返回 None"""
+        if stage not in self.durations:
+            return None
+        return int(round(self.durations[stage] * 1000))
+
+
+@contextmanager
+def recording():
+    """在当前线程开启一次记录"""
+    previous = getattr(_local, 'recorder', None)
+    recorder = StageRecorder()
+    _local.recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _local.recorder = previous
+
+
+@contextmanager
+def timed(stage):
+    """记录代码块耗时到当前记录器"""
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add_duration(stage, time.perf_counter() - start)
+
+
+def record_value(name, value):
+    """累加数值到当前记录器"""
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is not None:
+        recorder.add_value(name, value)
@@ -0,0 +1,62 @@
+"""LLM token 数估算"""
+import re
+import threading
+
+
+# DeepSeek 官方换算：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token
+CJK_TOKEN_RATIO = 0.6
+OTHER_TOKEN_RATIO = 0.3
+
+_CJK_PATTERN = re.compile(r'[　-〿㐀-䶿一-鿿豈-﫿＀-￯]')
+
+# 校准系数：根据接口返回的实际 prompt_tokens 修正估算偏差（指数平滑，限制在合理范围内）
+_calibration = {'factor': 1.0}
+_calibration_lock = threading.Lock()
+CALIBRATION_ALPHA = 0.2
+CALIBRATION_MIN = 0.5
+CALIBRATION_MAX = 2.0
+
+
+def _raw_estimate(text):
+    """按字符比例估算（未校准）"""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count * CJK_TOKEN_RATIO + other_count * OTHER_TOKEN_RATIO
+
+
+def estimate_tokens(text):
+    """估算文本的 token 数"""
+    if not text:
+        return 0
+    return int(_raw_estimate(text) * _calibration['factor']) + 1
+
+
+def estimate_tokens_uncalibrated(text):
+    """估算文本的 token 数（不受校准影响，结果只取决于文本本身）"""
+    if not text:
+        return 0
+    return int(_raw_estimate(text)) + 1
+
+
+def calibrate(texts, actual_tokens):
+    """
+    用一次请求的实际 token 数校准估算系数
+
+    参数:
+        texts: 本次请求发送的文本列表
+        actual_tokens: 接口返回的 prompt_tokens
+    """
+    raw = sum(_raw_estimate(text) for text in texts)
+    if not raw or not actual_tokens:
+        return
+    ratio = min(max(actual_tokens / raw, CALIBRATION_MIN), CALIBRATION_MAX)
+    with _calibration_lock:
+        factor = _calibration['factor']
+        _calibration['factor'] = factor + CALIBRATION_ALPHA * (ratio - factor)
+
+
+def get_calibration_factor():
+    """当前校准系数"""
+    return round(_calibration['factor'], 3)
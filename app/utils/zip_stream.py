@@ -0,0 +1,250 @@
+"""流式 ZIP 生成
+
+边压缩边输出：zipfile 写入一个只缓存最近输出的接收器，每压缩完一个数据块就把缓存的字节交给调用方，
+内存占用与压缩包大小无关。输出流不可回退，zipfile 会为每个成员写数据描述符；
+超过 4GB 的成员和压缩包自动使用 ZIP64 扩展。
+
+压缩策略按文件类型选择：PDF、Office 文档、压缩包、图片、音视频本身已经压缩，直接存储；
+其余文件按配置的级别 deflate，大文件分块在线程池中并行压缩。
+"""
+import os
+import threading
+import zipfile
+import zlib
+from collections import deque
+
+# 读取源文件的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 超过该大小的成员预先声明 ZIP64（与 zipfile 判断一致，留出压缩后膨胀的余量）
+ZIP64_THRESHOLD = int(zipfile.ZIP64_LIMIT / 1.05)
+
+# 本身已压缩的格式：再 deflate 体积几乎不变，只消耗 CPU
+STORED_EXTENSIONS = frozenset({
+    '.pdf',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.epub',
+    '.zip', '.7z', '.rar', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.jar', '.apk', '.whl',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.mp3', '.m4a', '.aac', '.ogg', '.mp4', '.mov', '.avi', '.mkv', '.webm',
+})
+
+# deflate 的回溯窗口，并行压缩时每块以前一块末尾的窗口作为预置字典
+DEFLATE_WINDOW = 32 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    """并行压缩线程池（懒加载，进程内共享）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                try:
+                    from gevent import monkey
+                    patched = monkey.is_module_patched('threading')
+                except ImportError:
+                    patched = False
+                if patched:
+                    # gevent worker 中 threading 已被替换为协程，压缩要在真正的系统线程中才能并行，
+                    # 等待结果时也不会阻塞同一进程中的其他请求
+                    from gevent.threadpool import ThreadPoolExecutor
+                else:
+                    from concurrent.futures import ThreadPoolExecutor
+                _executor = ThreadPoolExecutor(max_workers=workers)
+    return _executor
+
+
+class CompressionPolicy:
+    """
+    按文件类型选择压缩方式
+    
+    参数:
+        level: deflate 压缩级别（1-9）
+        workers: 并行压缩线程数，1 表示不并行
+        parallel_min_bytes: 达到该大小的 deflate 成员分块并行压缩
+        block_size: 并行压缩的块大小
+    """
+    
+    def __init__(self, level=6, workers=1, parallel_min_bytes=8 * 1024 * 1024, block_size=CHUNK_SIZE,
+                 stored_extensions=STORED_EXTENSIONS):
+        self.level = level
+        self.workers = max(workers, 1)
+        self.parallel_min_bytes = parallel_min_bytes
+        self.block_size = block_size
+        self.stored_extensions = stored_extensions
+    
+    @staticmethod
+    def from_config(config):
+        """按应用配置创建"""
+        return CompressionPolicy(
+            level=config.get('DOWNLOAD_ZIP_LEVEL', 6),
+            workers=config.get('DOWNLOAD_ZIP_WORKERS', 1),
+            parallel_min_bytes=config.get('DOWNLOAD_ZIP_PARALLEL_MIN_BYTES', 8 * 1024 * 1024)
+        )
+    
+    def compress_type(self, arcname):
+        """成员的压缩方式"""
+        if os.path.splitext(arcname)[1].lower() in self.stored_extensions:
+            return zipfile.ZIP_STORED
+        return zipfile.ZIP_DEFLATED
+    
+    def parallel_compressor(self, file_size):
+        """大文件返回并行压缩器，否则返回 None（使用 zipfile 自带的压缩）"""
+        if self.workers <= 1 or file_size < self.parallel_min_bytes:
+            return None
+        return _ParallelDeflater(self.level, _get_executor(self.workers), self.workers, self.block_size)
+
+
+class _ParallelDeflater:
+    """
+    分块并行 deflate（与 pigz 做法相同）
+    
+    输入按块切分，每块以前一块末尾 32KB 作为预置字典独立压缩，块尾同步刷新（对齐到字节边界），
+    最后一块结束压缩流。各块输出按顺序拼接就是一个完整的 deflate 流，解压端与普通成员没有区别。
+    zlib 压缩时释放 GIL，多个线程可以同时利用多核。接口与 zlib 压缩对象相同（compress/flush）。
+    """
+    
+    def __init__(self, level, executor, workers, block_size):
+        self.level = level
+        self.executor = executor
+        self.max_pending = workers * 2
+        self.block_size = block_size
+        self._buffer = bytearray()
+        self._zdict = b''
+        self._pending = deque()
+    
+    @staticmethod
+    def _compress_block(data, zdict, level, last):
+        if zdict:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    
+    def _submit(self, block, last):
+        self._pending.append(self.executor.submit(self._compress_block, block, self._zdict, self.level, last))
+        self._zdict = block[-DEFLATE_WINDOW:]
+    
+    def _collect(self, keep):
+        """按顺序取出已完成的块；未完成的块超过 keep 个时等待最早的一块"""
+        output = []
+        while self._pending and (len(self._pending) > keep or self._pending[0].done()):
+            output.append(self._pending.popleft().result())
+        return b''.join(output)
+    
+    def compress(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block, last=False)
+        return self._collect(self.max_pending - 1)
+    
+    def flush(self):
+        # 剩余数据（可能为空）作为最后一块，结束压缩流
+        self._submit(bytes(self._buffer), last=True)
+        self._buffer = bytearray()
+        return self._collect(0)
+
+
+class _ChunkSink:
+    """只追加、不可回退的输出接收器（没有 tell/seek，zipfile 会按流式模式写入）"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def pop(self):
+        """取出并清空已缓存的输出"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _write_member(zf, file_path, arcname, policy):
+    """
+    把一个文件写入压缩包，每写入一块产出一次（调用方借此及时取走流式输出）
+    
+    成员信息（修改时间、权限、大小）与 ZipFile.write 相同。
+    """
+    zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+    zinfo.compress_type = policy.compress_type(arcname)
+    zinfo._compresslevel = policy.level
+    
+    with open(file_path, 'rb') as src, zf.open(zinfo, 'w', force_zip64=zinfo.file_size > ZIP64_THRESHOLD) as dest:
+        if zinfo.compress_type == zipfile.ZIP_DEFLATED:
+            compressor = policy.parallel_compressor(zinfo.file_size)
+            if compressor is not None:
+                # 替换 zipfile 内部的压缩对象（CRC 和大小仍由 zipfile 统计）
+                dest._compressor = compressor
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            dest.write(chunk)
+            yield
+
+
+def iter_zip_stream(entries, policy=None, on_entry=None):
+    """
+    逐块生成 ZIP 内容
+    
+    参数:
+        entries: 可迭代对象，元素为 (源文件路径, 压缩包内文件名)
+        policy: 压缩策略（CompressionPolicy），默认按文件类型选择、deflate 级别 6、不并行
+        on_entry: 可选回调 on_entry(index, 源文件路径, 压缩包内文件名)，开始压缩每个成员前调用（用于进度）
+    
+    返回: 生成器，依次产出 bytes
+    """
+    policy = policy or CompressionPolicy()
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w') as zf:
+        for index, (file_path, arcname) in enumerate(entries):
+            if on_entry:
+                on_entry(index, file_path, arcname)
+            for _ in _write_member(zf, file_path, arcname, policy):
+                data = sink.pop()
+                if data:
+                    yield data
+            data = sink.pop()
+            if data:
+                yield data
+    
+    # 中央目录
+    data = sink.pop()
+    if data:
+        yield data
+
+
+def append_to_zip(zip_path, entries, policy=None, on_entry=None):
+    """
+    向已有压缩包追加成员（已有成员不重新压缩，只重写中央目录）
+    
+    参数同 iter_zip_stream。
+    """
+    policy = policy or CompressionPolicy()
+    with zipfile.ZipFile(zip_path, 'a') as zf:
+        for index, (file_path, arcname) in enumerate(entries):
+            if on_entry:
+                on_entry(index, file_path, arcname)
+            for _ in _write_member(zf, file_path, arcname, policy):
+                pass
+
+
+def attachment_headers(filename):
+    """下载响应头（非 ASCII 文件名按 RFC 5987 编码，与 send_file 一致）"""
+    import unicodedata
+    from urllib.parse import quote
+    
+    try:
+        filename.encode('ascii')
+        disposition = f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        disposition = f"attachment; filename=\"{simple}\"; filename*=UTF-8''{quote(filename, safe='')}"
+    return {'Content-Disposition': disposition}
@@ -44,6 +44,101 @@ class Config:
     DEEPSEEK_API_KEY = os.environ.get('DeepSeek_API_KEY', '')
     DEEPSEEK_MODEL = os.environ.get('DeepSeek_MODEL', 'deepseek-reasoner')
     DEEPSEEK_BASE_URL = 'https://api.deepseek.com'
+    
+    # DeepSeek API 连接池配置（进程内共享客户端，keep-alive 复用连接）
+    DEEPSEEK_CONNECT_TIMEOUT = float(os.environ.get('DEEPSEEK_CONNECT_TIMEOUT', '10'))   # 建立连接超时（秒）
+    DEEPSEEK_READ_TIMEOUT = float(os.environ.get('DEEPSEEK_READ_TIMEOUT', '300'))        # 读取超时（秒），推理模型响应较慢
+    DEEPSEEK_MAX_CONNECTIONS = int(os.environ.get('DEEPSEEK_MAX_CONNECTIONS', '20'))     # 最大连接数
+    DEEPSEEK_MAX_KEEPALIVE = int(os.environ.get('DEEPSEEK_MAX_KEEPALIVE', '10'))         # 最大空闲保活连接数
+    
+    # 模型上下文长度（token），超出时先压缩学生内容；AI_CONTENT_SUMMARIZE=true 时允许分段调用 AI 摘要
+    DEEPSEEK_CONTEXT_TOKENS = int(os.environ.get('DEEPSEEK_CONTEXT_TOKENS', '64000'))
+    AI_CONTENT_SUMMARIZE = os.environ.get('AI_CONTENT_SUMMARIZE', 'false').lower() == 'true'
+    
+    # DeepSeek API 限流、重试与熔断（0 表示不限制）
+    DEEPSEEK_RPM_LIMIT = int(os.environ.get('DEEPSEEK_RPM_LIMIT', '120'))                # 每分钟请求数
+    DEEPSEEK_TPM_LIMIT = int(os.environ.get('DEEPSEEK_TPM_LIMIT', '0'))                  # 每分钟 token 数
+    DEEPSEEK_MAX_CONCURRENCY = int(os.environ.get('DEEPSEEK_MAX_CONCURRENCY', '10'))     # 单进程最大并发请求数（被限流时自动减半）
+    DEEPSEEK_MAX_RETRIES = int(os.environ.get('DEEPSEEK_MAX_RETRIES', '4'))              # 429/5xx/超时最大重试次数
+    DEEPSEEK_BACKOFF_BASE = float(os.environ.get('DEEPSEEK_BACKOFF_BASE', '1'))          # 退避基数（秒）
+    DEEPSEEK_BACKOFF_MAX = float(os.environ.get('DEEPSEEK_BACKOFF_MAX', '60'))           # 单次退避上限（秒）
+    DEEPSEEK_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('DEEPSEEK_CIRCUIT_FAILURE_THRESHOLD', '5'))  # 连续失败多少次熔断
+    DEEPSEEK_CIRCUIT_COOLDOWN = float(os.environ.get('DEEPSEEK_CIRCUIT_COOLDOWN', '60'))  # 熔断冷却时间（秒）
+    
+    # AI 评分文件内容提取缓存（按文件内容哈希缓存提取文本和 OCR 结果）
+    EXTRACTION_CACHE_DIR = os.path.join(STORAGE_DIR, 'cache', 'extraction')
+    EXTRACTION_CACHE_MAX_BYTES = int(os.environ.get('EXTRACTION_CACHE_MAX_MB', '512')) * 1024 * 1024
+    
+    # AI 评分结果缓存（相同模型 + Prompt + 温度直接复用评分结果，LLM_CACHE_TTL_HOURS=0 关闭）
+    LLM_CACHE_DIR = os.path.join(STORAGE_DIR, 'cache', 'llm_response')
+    LLM_CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_MB', '128')) * 1024 * 1024
+    LLM_CACHE_TTL = int(float(os.environ.get('LLM_CACHE_TTL_HOURS', '168')) * 3600)
+    
+    # 图片 OCR 结果缓存（按图片内容哈希，跨文件复用模板、校徽、题目截图等重复图片的识别结果）
+    OCR_CACHE_DIR = os.path.join(STORAGE_DIR, 'cache', 'ocr')
+    OCR_CACHE_MAX_BYTES = int(os.environ.get('OCR_CACHE_MAX_MB', '64')) * 1024 * 1024
+    
+    # 图片 OCR 预处理：短边或像素数低于阈值的装饰性小图跳过，超大图片按最长边缩小，灰度后二值化
+    OCR_MIN_IMAGE_SIDE = int(os.environ.get('OCR_MIN_IMAGE_SIDE', '40'))
+    OCR_MIN_IMAGE_PIXELS = int(os.environ.get('OCR_MIN_IMAGE_PIXELS', '20000'))
+    OCR_MAX_IMAGE_SIDE = int(os.environ.get('OCR_MAX_IMAGE_SIDE', '2500'))
+    OCR_BINARIZE = os.environ.get('OCR_BINARIZE', 'true').lower() == 'true'
+    
+    # 图片 OCR 引擎：auto 优先使用进程内常驻的 tesserocr（需另行安装），否则批量调用 tesseract 命令；
+    # 每批图片数越大，语言模型加载开销摊得越薄，但单批占用内存和超时时间也越大
+    OCR_ENGINE = os.environ.get('OCR_ENGINE', 'auto')
+    OCR_TESSERACT_CMD = os.environ.get('OCR_TESSERACT_CMD', 'tesseract')
+    OCR_BATCH_SIZE = int(os.environ.get('OCR_BATCH_SIZE', '16'))
+    
+    # 压缩包（ZIP/7z）提交的提取限制（防止压缩炸弹）、PDF/Word 成员并行提取线程数和文本 token 预算
+    ARCHIVE_MAX_ENTRIES = int(os.environ.get('ARCHIVE_MAX_ENTRIES', '2000'))
+    ARCHIVE_MAX_ENTRY_BYTES = int(os.environ.get('ARCHIVE_MAX_ENTRY_MB', '50')) * 1024 * 1024
+    ARCHIVE_MAX_TOTAL_BYTES = int(os.environ.get('ARCHIVE_MAX_TOTAL_MB', '200')) * 1024 * 1024
+    ARCHIVE_MAX_RATIO = int(os.environ.get('ARCHIVE_MAX_RATIO', '100'))
+    ARCHIVE_EXTRACT_WORKERS = int(os.environ.get('ARCHIVE_EXTRACT_WORKERS', '2'))
+    ARCHIVE_TEXT_TOKEN_BUDGET = int(os.environ.get('ARCHIVE_TEXT_TOKEN_BUDGET', '40000'))
+    
+    # 上传后在后台预提取提交文件文本（AI 批改直接使用），唤醒失败时按间隔兜底轮询（秒）
+    # AI 批改遇到提取中的记录时最多等待的秒数，超时后当场提取
+    SUBMISSION_PREEXTRACT = os.environ.get('SUBMISSION_PREEXTRACT', 'true').lower() == 'true'
+    SUBMISSION_PREEXTRACT_POLL_INTERVAL = int(os.environ.get('SUBMISSION_PREEXTRACT_POLL_INTERVAL', '60'))
+    SUBMISSION_PREEXTRACT_WAIT = int(os.environ.get('SUBMISSION_PREEXTRACT_WAIT', '180'))
+    
+    # 批量下载：后台打包到临时目录，完成后保留指定小时数供下载（支持断点续传），每个用户同时进行的打包任务数上限
+    BATCH_DOWNLOAD_DIR = os.path.join(STORAGE_DIR, 'tmp', 'batch_download')
+    BATCH_DOWNLOAD_TTL = int(float(os.environ.get('BATCH_DOWNLOAD_TTL_HOURS', '24')) * 3600)
+    BATCH_DOWNLOAD_MAX_ACTIVE_PER_USER = int(os.environ.get('BATCH_DOWNLOAD_MAX_ACTIVE_PER_USER', '1'))
+    BATCH_DOWNLOAD_POLL_INTERVAL = int(os.environ.get('BATCH_DOWNLOAD_POLL_INTERVAL', '60'))
+    
+    # 作业打包下载的压缩策略：PDF/Office/压缩包/图片/音视频直接存储，其余文件按级别 deflate；
+    # 达到指定大小的文件分块在多个线程中并行压缩
+    DOWNLOAD_ZIP_LEVEL = int(os.environ.get('DOWNLOAD_ZIP_LEVEL', '6'))
+    DOWNLOAD_ZIP_WORKERS = int(os.environ.get('DOWNLOAD_ZIP_WORKERS', str(min(4, os.cpu_count() or 1))))
+    DOWNLOAD_ZIP_PARALLEL_MIN_BYTES = int(os.environ.get('DOWNLOAD_ZIP_PARALLEL_MIN_MB', '8')) * 1024 * 1024
+    
+    # 单个作业压缩包缓存：提交和文件未变化时直接发送上次的压缩包，只有新提交时追加；超过指定天数未下载的缓存删除
+    ASSIGNMENT_ZIP_CACHE = os.environ.get('ASSIGNMENT_ZIP_CACHE', 'true').lower() == 'true'
+    ASSIGNMENT_ZIP_CACHE_DIR = os.path.join(STORAGE_DIR, 'cache', 'assignment_zip')
+    ASSIGNMENT_ZIP_CACHE_TTL = int(float(os.environ.get('ASSIGNMENT_ZIP_CACHE_TTL_DAYS', '7')) * 86400)
+    
+    # 下载进度：保存在所有 worker 共享的 SQLite 数据库（WAL 模式）中；处理中的进度距上次写入
+    # 不足指定秒数且前进不足指定百分比时不写入，记录超过有效期（秒）后删除
+    PROGRESS_DB_PATH = os.path.join(STORAGE_DIR, 'data', 'progress.db')
+    PROGRESS_MIN_INTERVAL = float(os.environ.get('PROGRESS_MIN_INTERVAL', '0.5'))
+    PROGRESS_MIN_STEP = int(os.environ.get('PROGRESS_MIN_STEP', '5'))
+    PROGRESS_TTL = int(os.environ.get('PROGRESS_TTL', '3600'))
+    
+    # 扫描件 PDF 整页 OCR：并行进程数（每个 gunicorn worker 独立的进程池）和栅格化分辨率
+    OCR_WORKERS = int(os.environ.get('OCR_WORKERS', str(min(4, os.cpu_count() or 1))))
+    OCR_DPI = int(os.environ.get('OCR_DPI', '200'))
+    
+    # AI 批改任务保留策略：完成超过指定天数的任务（含对话记录）归档到压缩文件后从数据库删除，默认 0 表示不归档
+    AI_TASK_RETENTION_DAYS = int(os.environ.get('AI_TASK_RETENTION_DAYS', '0'))
+    AI_TASK_ARCHIVE_DIR = os.path.join(STORAGE_DIR, 'archive', 'ai_grading')
+    
+    # AI 批改队列：入队时通过 Unix 套接字立即唤醒消费进程，定时轮询仅作兜底
+    AI_QUEUE_NOTIFY_DIR = os.environ.get('AI_QUEUE_NOTIFY_DIR', '/tmp/tg_edu_ai_queue_notify')
+    AI_QUEUE_POLL_INTERVAL = int(os.environ.get('AI_QUEUE_POLL_INTERVAL', '60'))
 
 
 class DevelopmentConfig(Config):
@@ -7,6 +7,8 @@
 - reference_answer_original_filename: 参考答案原始文件名
 - reference_answer_file_path: 参考答案文件路径
 - reference_answer_file_size: 参考答案文件大小
+- reference_answer_extracted: 参考答案文件提取出的文本
+- reference_answer_extracted_at: 参考答案文本提取时间
 """
 import sqlite3
 import os
@@ -75,6 +77,18 @@ def migrate():
         else:
             print("reference_answer_file_size 字段已存在")
         
+        if 'reference_answer_extracted' not in columns:
+            cursor.execute("ALTER TABLE assignment ADD COLUMN reference_answer_extracted TEXT")
+            print("已添加 reference_answer_extracted 字段")
+        else:
+            print("reference_answer_extracted 字段已存在")
+        
+        if 'reference_answer_extracted_at' not in columns:
+            cursor.execute("ALTER TABLE assignment ADD COLUMN reference_answer_extracted_at DATETIME")
+            print("已添加 reference_answer_extracted_at 字段")
+        else:
+            print("reference_answer_extracted_at 字段已存在")
+        
         conn.commit()
         print("AI 自动改卷模式字段迁移完成")
         
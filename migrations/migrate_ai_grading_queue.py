@@ -1,6 +1,8 @@
 """AI 批改队列表迁移脚本"""
+import json
 import os
 import sqlite3
+import zlib
 
 
 def migrate():
@@ -60,6 +62,75 @@ def migrate():
         else:
             print("ai_grading_task 表已存在，跳过创建")
         
+        # 补充 ai_grading_task 新增字段
+        cursor.execute("PRAGMA table_info(ai_grading_task)")
+        task_columns = [column[1] for column in cursor.fetchall()]
+        new_task_columns = [
+            # 租约（多进程/多节点安全领取）
+            ('worker_id', 'VARCHAR(100)'),
+            ('lease_token', 'VARCHAR(36)'),
+            ('lease_expires_at', 'TIMESTAMP'),
+            ('heartbeat_at', 'TIMESTAMP'),
+            ('attempts', 'INTEGER DEFAULT 0'),
+            # 批量批改作业标识
+            ('batch_id', 'VARCHAR(36)'),
+            # 跳过评分结果缓存
+            ('bypass_cache', 'BOOLEAN DEFAULT 0'),
+            # 调度优先级
+            ('priority', 'INTEGER DEFAULT 0'),
+            # 分阶段耗时与 token 用量
+            ('wait_ms', 'INTEGER'),
+            ('extract_ms', 'INTEGER'),
+            ('ocr_ms', 'INTEGER'),
+            ('prompt_ms', 'INTEGER'),
+            ('llm_ms', 'INTEGER'),
+            ('validate_ms', 'INTEGER'),
+            ('prompt_tokens', 'INTEGER'),
+            ('completion_tokens', 'INTEGER'),
+            ('prompt_cache_hit_tokens', 'INTEGER'),
+            ('ocr_saved_ms', 'INTEGER'),
+        ]
+        for column_name, column_type in new_task_columns:
+            if column_name not in task_columns:
+                cursor.execute(f"ALTER TABLE ai_grading_task ADD COLUMN {column_name} {column_type}")
+                print(f"已添加 ai_grading_task.{column_name} 字段")
+        cursor.execute('CREATE INDEX IF NOT EXISTS ix_ai_grading_task_lease_token ON ai_grading_task (lease_token)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS ix_ai_grading_task_batch_id ON ai_grading_task (batch_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS ix_ai_grading_task_completed_at ON ai_grading_task (completed_at)')
+        
+        # 对话记录分表存储（zlib 压缩），把旧的内联记录迁移过去
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ai_grading_conversation (
+                task_id INTEGER PRIMARY KEY,
+                data BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (task_id) REFERENCES ai_grading_task (id)
+            )
+        ''')
+        moved = 0
+        while True:
+            cursor.execute(
+                "SELECT id, conversation_log, completed_at FROM ai_grading_task "
+                "WHERE conversation_log IS NOT NULL LIMIT 500"
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            for task_id, log, completed_at in rows:
+                try:
+                    compact = json.dumps(json.loads(log), ensure_ascii=False, separators=(',', ':'))
+                except ValueError:
+                    compact = json.dumps({'raw': log}, ensure_ascii=False)
+                cursor.execute(
+                    "INSERT OR REPLACE INTO ai_grading_conversation (task_id, data, created_at) VALUES (?, ?, ?)",
+                    (task_id, zlib.compress(compact.encode('utf-8'), 6), completed_at)
+                )
+                cursor.execute("UPDATE ai_grading_task SET conversation_log = NULL WHERE id = ?", (task_id,))
+            conn.commit()
+            moved += len(rows)
+        if moved:
+            print(f"已将 {moved} 条对话记录迁移到 ai_grading_conversation 表（可执行 VACUUM 回收空间）")
+        
         # 检查 ai_grading_config 表是否存在
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='ai_grading_config'")
         if not cursor.fetchone():
@@ -0,0 +1,52 @@
+"""独立的 AI 批改队列 worker 进程
+
+任务通过租约原子领取，可以在同一台或多台机器上启动任意数量的 worker
+（与 Web 进程中的定时调度器共享同一个数据库）并行消费队列。
+
+入队时会通过 Unix 套接字唤醒本机的 worker，--interval 只是兜底轮询间隔。
+
+用法:
+    python scripts/ai_queue_worker.py [--interval 30]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.services.ai_queue_service import AIQueueService
+
+
+def run_worker(interval):
+    """循环调度队列任务"""
+    config_name = os.getenv('FLASK_ENV', 'production')
+    app = create_app(config_name)
+    
+    from app.models import AIGradingTask
+    from app.services.queue_notifier import QueueListener, is_supported
+    
+    listener = QueueListener(app.config.get('AI_QUEUE_NOTIFY_DIR')) if is_supported() else None
+    print(f"🚀 AI队列 worker {AIGradingTask.current_worker_id()} 已启动，兜底轮询间隔 {interval} 秒"
+          f"{'，已启用入队唤醒' if listener else ''}")
+    
+    while True:
+        try:
+            with app.app_context():
+                AIQueueService.process_queue()
+        except Exception as e:
+            print(f"❌ AI队列处理失败: {str(e)}")
+            import traceback
+            traceback.print_exc()
+        if listener:
+            listener.wait(timeout=interval)
+        else:
+            time.sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='AI 批改队列 worker')
+    parser.add_argument('--interval', type=float, default=30, help='兜底轮询间隔（秒）')
+    args = parser.parse_args()
+    run_worker(args.interval)
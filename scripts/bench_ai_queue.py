@@ -0,0 +1,169 @@
+"""AI 批改队列吞吐量基准测试：串行处理 vs 线程池并发处理
+
+使用本地模拟 LLM 服务，不会调用真实的 DeepSeek API。
+
+用法:
+    python scripts/bench_ai_queue.py --tasks 40 --latency 0.5 --concurrency 1 5 10
+    # 注入 20% 的 429 和 10% 的 500，观察退避重试、自适应并发和熔断
+    python scripts/bench_ai_queue.py --tasks 40 --throttle-rate 0.2 --error-rate 0.1 --skip-serial
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 使用临时存储目录，避免污染正式数据库
+os.environ['STORAGE_DIR'] = tempfile.mkdtemp(prefix='tg_edu_bench_')
+
+from mock_llm_server import start_mock_server
+
+
+def setup_data(app, task_count):
+    """创建测试用户、作业、提交文件和批改任务"""
+    from app.extensions import db
+    from app.models import User, UserRole, Assignment, Submission, AIGradingTask
+    
+    upload_dir = os.path.join(os.environ['STORAGE_DIR'], 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    
+    with app.app_context():
+        teacher = User(username='bench_teacher', real_name='基准教师', role=UserRole.TEACHER)
+        teacher.set_password('bench')
+        db.session.add(teacher)
+        db.session.commit()
+        
+        assignment = Assignment(title='基准测试作业', description='测试', teacher_id=teacher.id, ai_grading_mode=3)
+        db.session.add(assignment)
+        db.session.commit()
+        
+        for i in range(task_count):
+            file_path = os.path.join(upload_dir, f'submission_{i}.txt')
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(f'学生 {i} 的作业内容\n' * 50)
+            submission = Submission(
+                assignment_id=assignment.id,
+                student_id=teacher.id,
+                student_name=f'学生{i}',
+                student_number=f'{i:04d}',
+                filename=os.path.basename(file_path),
+                original_filename=os.path.basename(file_path),
+                file_path=file_path
+            )
+            db.session.add(submission)
+            db.session.flush()
+            db.session.add(AIGradingTask(
+                submission_id=submission.id,
+                assignment_id=assignment.id,
+                student_id=teacher.id
+            ))
+        db.session.commit()
+
+
+def reset_tasks(app):
+    """将所有任务重置为等待中"""
+    from app.extensions import db
+    from app.models import AIGradingTask
+    
+    with app.app_context():
+        AIGradingTask.query.update({
+            'status': AIGradingTask.STATUS_PENDING,
+            'score': None, 'feedback': None, 'error_message': None,
+            'started_at': None, 'completed_at': None
+        })
+        db.session.commit()
+
+
+def run_serial(app):
+    """旧实现：在调度线程中逐个处理任务"""
+    from app.extensions import db
+    from app.models import AIGradingTask
+    from app.services.ai_queue_service import AIQueueService
+    
+    with app.app_context():
+        tasks = AIGradingTask.query.filter_by(status=AIGradingTask.STATUS_PENDING).all()
+        for task in tasks:
+            task.status = AIGradingTask.STATUS_PROCESSING
+            db.session.commit()
+            AIQueueService._process_single_task(task)
+
+
+def run_pool(app, concurrency):
+    """新实现：线程池并发处理"""
+    from app.models import AIGradingConfig
+    from app.services.ai_queue_service import AIQueueService
+    
+    with app.app_context():
+        AIGradingConfig.set_max_concurrent(concurrency)
+        return AIQueueService.drain(timeout=600)
+
+
+def count_completed(app):
+    from app.models import AIGradingTask
+    with app.app_context():
+        return AIGradingTask.query.filter_by(status=AIGradingTask.STATUS_COMPLETED).count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI 批改队列吞吐量基准测试')
+    parser.add_argument('--tasks', type=int, default=40, help='任务数量')
+    parser.add_argument('--latency', type=float, default=0.5, help='模拟 LLM 响应延迟（秒）')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 5, 10], help='线程池并发数')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='模拟服务返回 429 的比例')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟服务返回 500 的比例')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 响应的 Retry-After 秒数')
+    parser.add_argument('--skip-serial', action='store_true', help='跳过串行基线')
+    args = parser.parse_args()
+    
+    server, base_url = start_mock_server(
+        latency=args.latency,
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after
+    )
+    
+    from app import create_app
+    app = create_app('development')
+    app.config['DEEPSEEK_API_KEY'] = 'bench-key'
+    app.config['DEEPSEEK_BASE_URL'] = base_url
+    app.config['DEEPSEEK_MODEL'] = 'mock-model'
+    # 每轮使用相同的提交内容，关闭评分结果缓存以免后几轮直接命中
+    app.config['LLM_CACHE_TTL'] = 0
+    
+    setup_data(app, args.tasks)
+    
+    print(f'\n任务数: {args.tasks}, 模拟延迟: {args.latency}s')
+    print(f'{"模式":<16}{"耗时(s)":>10}{"吞吐(任务/s)":>16}{"完成数":>8}')
+    
+    if not args.skip_serial:
+        start = time.perf_counter()
+        run_serial(app)
+        elapsed = time.perf_counter() - start
+        print(f'{"串行":<16}{elapsed:>10.2f}{args.tasks / elapsed:>16.2f}{count_completed(app):>8}')
+    
+    for concurrency in args.concurrency:
+        reset_tasks(app)
+        start = time.perf_counter()
+        run_pool(app, concurrency)
+        elapsed = time.perf_counter() - start
+        print(f'{"线程池 x" + str(concurrency):<16}{elapsed:>10.2f}{args.tasks / elapsed:>16.2f}{count_completed(app):>8}')
+    
+    from app.models import AIGradingTask
+    with app.app_context():
+        prompt_cache = AIGradingTask.get_metrics(hours=24, limit=args.tasks * 10)['prompt_cache']
+    print(f'\n上下文缓存: 命中 {prompt_cache["hit_tokens_total"]} 输入 token（{prompt_cache["hit_ratio"]}%）')
+    
+    if args.throttle_rate or args.error_rate:
+        from app.services.llm_guard import llm_guard
+        print(f'\n模拟服务: 请求 {server.request_count} 次，429 {server.throttled_count} 次，500 {server.error_count} 次')
+        print(f'客户端保护: {llm_guard.snapshot()}')
+    
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
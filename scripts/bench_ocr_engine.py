@@ -0,0 +1,80 @@
+"""图片 OCR 引擎基准测试：逐张调用 pytesseract 与批量/常驻引擎的图片/秒对比
+
+模拟作业文档中大量的小截图。需要系统安装 tesseract-ocr（含 chi_sim 语言包，Docker 镜像中已包含），
+tesserocr 模式需要另行安装 tesserocr。
+
+用法:
+    python scripts/bench_ocr_engine.py --images 48 --batch-sizes 1 8 16 32
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.ocr_engine import TesseractBatchEngine, TesserocrEngine
+
+LANG = 'chi_sim+eng'
+
+
+def make_images(count):
+    """生成带几行文字的小截图（二值化前的灰度图）"""
+    from PIL import Image, ImageDraw
+
+    images = []
+    for i in range(count):
+        image = Image.new('L', (640, 160), color=255)
+        draw = ImageDraw.Draw(image)
+        for line in range(3):
+            draw.text((20, 20 + line * 40), f'Screenshot {i} line {line}: def grade(x): return x * {i}', fill=0)
+        images.append(image)
+    return images
+
+
+def run(label, func, images):
+    start = time.perf_counter()
+    texts = func(images)
+    elapsed = time.perf_counter() - start
+    chars = sum(len(text) for text in texts)
+    print(f'{label:<20}{elapsed:>10.2f}{len(images) / elapsed:>14.2f}{chars:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='图片 OCR 引擎基准测试')
+    parser.add_argument('--images', type=int, default=48, help='图片数量')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 16, 32], help='批量命令行每批图片数')
+    parser.add_argument('--tesseract-cmd', default='tesseract', help='tesseract 命令路径')
+    args = parser.parse_args()
+
+    images = make_images(args.images)
+    print(f'图片数: {args.images}, 语言: {LANG}, CPU: {os.cpu_count()}')
+    print(f'{"模式":<20}{"耗时(s)":>10}{"图片/秒":>14}{"字符数":>10}')
+
+    try:
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = args.tesseract_cmd
+        run('pytesseract 逐张', lambda items: [pytesseract.image_to_string(image, lang=LANG).strip() for image in items], images)
+    except ImportError:
+        print('未安装 pytesseract，跳过逐张模式')
+
+    engine = TesseractBatchEngine(args.tesseract_cmd)
+    for batch_size in args.batch_sizes:
+        run(
+            f'批量命令行 x{batch_size}',
+            lambda items: [text for start in range(0, len(items), batch_size)
+                           for text in engine.recognize(items[start:start + batch_size], LANG)],
+            images
+        )
+
+    try:
+        engine = TesserocrEngine()
+    except ImportError:
+        print('未安装 tesserocr，跳过常驻引擎模式')
+        return
+    engine.recognize(images[:1], LANG)  # 预热：加载语言模型
+    run('tesserocr 常驻', lambda items: engine.recognize(items, LANG), images)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""扫描件 PDF 整页 OCR 基准测试：不同并行度下的页/秒与峰值内存
+
+需要系统安装 tesseract-ocr（含 chi_sim 语言包）和 poppler-utils（Docker 镜像中已包含）。
+
+用法:
+    python scripts/bench_pdf_ocr.py --pages 60 --workers 1 2 4
+    python scripts/bench_pdf_ocr.py --pdf /path/to/scanned.pdf --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil
+from app.services.ocr_pool import iter_pdf_page_texts
+
+
+def make_scanned_pdf(path, pages):
+    """生成只包含图片的 PDF（模拟扫描件），A4 @150dpi 灰度"""
+    from PIL import Image, ImageDraw
+    
+    images = []
+    for page_num in range(1, pages + 1):
+        image = Image.new('L', (1240, 1754), color=255)
+        draw = ImageDraw.Draw(image)
+        for line in range(40):
+            draw.text((80, 80 + line * 40), f'Page {page_num} line {line}: scanned homework report text', fill=0)
+        images.append(image)
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=150)
+
+
+class PeakRSSMonitor:
+    """采样当前进程及所有子进程的 RSS 总和，记录峰值"""
+    
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self):
+        process = psutil.Process()
+        while not self._stop.is_set():
+            try:
+                rss = process.memory_info().rss
+                for child in process.children(recursive=True):
+                    try:
+                        rss += child.memory_info().rss
+                    except psutil.Error:
+                        pass
+                self.peak = max(self.peak, rss)
+            except psutil.Error:
+                pass
+            time.sleep(self.interval)
+    
+    def __enter__(self):
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='扫描件 PDF OCR 基准测试')
+    parser.add_argument('--pdf', help='已有的扫描件 PDF（不指定则自动生成）')
+    parser.add_argument('--pages', type=int, default=30, help='自动生成的页数')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='并行进程数')
+    parser.add_argument('--dpi', type=int, default=200, help='栅格化分辨率')
+    args = parser.parse_args()
+    
+    pdf_path = args.pdf
+    if not pdf_path:
+        pdf_path = os.path.join(tempfile.mkdtemp(prefix='tg_edu_ocr_'), 'scanned.pdf')
+        make_scanned_pdf(pdf_path, args.pages)
+    
+    from pdf2image import pdfinfo_from_path
+    page_count = pdfinfo_from_path(pdf_path)['Pages']
+    
+    print(f'PDF: {pdf_path}, 页数: {page_count}, DPI: {args.dpi}, CPU: {os.cpu_count()}')
+    print(f'{"并行进程":<10}{"耗时(s)":>10}{"页/秒":>10}{"峰值RSS(MB)":>14}')
+    
+    for workers in args.workers:
+        # 预热进程池，避免把子进程启动时间计入
+        if workers > 1:
+            list(iter_pdf_page_texts(pdf_path, min(workers, page_count), dpi=72, workers=workers))
+        
+        with PeakRSSMonitor() as monitor:
+            start = time.perf_counter()
+            chars = sum(len(text) for _, text in iter_pdf_page_texts(pdf_path, page_count, dpi=args.dpi, workers=workers))
+            elapsed = time.perf_counter() - start
+        
+        print(f'{workers:<10}{elapsed:>10.2f}{page_count / elapsed:>10.2f}{monitor.peak / 1024 / 1024:>14.1f}'
+              f'  （识别 {chars} 字符）')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""下载进度写入基准测试：原来的每次更新改写 JSON 文件与 SQLite 共享进度库（节流/不节流）的开销对比
+
+模拟打包一个作业时每压缩一个文件更新一次进度，同时另一个进程按前端的频率轮询读取，
+输出每次更新的平均耗时、实际写入次数，以及读取进程看到的最后状态（验证跨进程可见）。
+
+用法:
+    python scripts/bench_progress.py --updates 5000 --poll-interval 0.5
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.progress_tracker import ProgressTracker
+
+
+class LegacyFileTracker:
+    """原实现：每次更新重写整个 JSON 文件（不含原来的两行日志）"""
+
+    def __init__(self, storage_dir):
+        self.storage_dir = storage_dir
+
+    def _path(self, user_id, extra_key):
+        return os.path.join(self.storage_dir, f'download_progress_{user_id}_{extra_key}.json')
+
+    def set_progress(self, user_id, progress_data, extra_key=None):
+        progress_data['updated_at'] = time.time()
+        with open(self._path(user_id, extra_key), 'w', encoding='utf-8') as f:
+            json.dump(progress_data, f, ensure_ascii=False)
+
+    def get_progress(self, user_id, extra_key=None):
+        try:
+            with open(self._path(user_id, extra_key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+def make_tracker(name, directory):
+    if name == 'file':
+        return LegacyFileTracker(directory)
+    db_path = os.path.join(directory, f'progress_{name}.db')
+    if name == 'sqlite':
+        return ProgressTracker(db_path, min_interval=0, min_step=0, ttl=3600)
+    return ProgressTracker(db_path, min_interval=0.5, min_step=5, ttl=3600)
+
+
+def poll(name, directory, interval, stop, result):
+    """模拟前端轮询（另一个 worker 进程）"""
+    tracker = make_tracker(name, directory)
+    reads = 0
+    while not stop.is_set():
+        tracker.get_progress(1, 'assignment_1')
+        reads += 1
+        time.sleep(interval)
+    result.put((reads, tracker.get_progress(1, 'assignment_1')))
+
+
+def run(name, directory, updates, poll_interval):
+    tracker = make_tracker(name, directory)
+    stop = multiprocessing.Event()
+    result = multiprocessing.Queue()
+    reader = multiprocessing.Process(target=poll, args=(name, directory, poll_interval, stop, result))
+    reader.start()
+
+    throttled = isinstance(tracker, ProgressTracker)
+    written = 0
+    start = time.perf_counter()
+    for index in range(updates):
+        before = tracker._last_write.get((1, 'assignment_1')) if throttled else None
+        tracker.set_progress(1, {
+            'status': 'processing',
+            'progress': int(index / updates * 100),
+            'message': f'正在压缩文件: 学生{index:05d}_作业.pdf',
+            'current_file': index + 1,
+            'total_files': updates
+        }, 'assignment_1')
+        if not throttled or tracker._last_write.get((1, 'assignment_1')) != before:
+            written += 1
+    tracker.set_progress(1, {'status': 'completed', 'progress': 100, 'message': '压缩完成'}, 'assignment_1')
+    elapsed = time.perf_counter() - start
+
+    time.sleep(poll_interval * 2)
+    stop.set()
+    reads, final = result.get()
+    reader.join()
+    return elapsed, written + 1, reads, final
+
+
+def main():
+    parser = argparse.ArgumentParser(description='下载进度写入基准测试')
+    parser.add_argument('--updates', type=int, default=5000, help='进度更新次数（相当于压缩的文件数）')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='读取进程的轮询间隔（秒）')
+    parser.add_argument('--modes', nargs='+', choices=['file', 'sqlite', 'throttled'],
+                        default=['file', 'sqlite', 'throttled'], help='测试的进度存储方式')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='tg_edu_progress_')
+    try:
+        print(f'{"方式":<12}{"总耗时(s)":>12}{"每次(us)":>12}{"写入次数":>10}{"读取次数":>10}  读取到的最后状态')
+        for mode in args.modes:
+            elapsed, written, reads, final = run(mode, directory, args.updates, args.poll_interval)
+            status = final.get('status') if final else None
+            print(f'{mode:<12}{elapsed:>12.3f}{elapsed / args.updates * 1e6:>12.1f}{written:>10}{reads:>10}  {status}')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""作业打包压缩策略基准测试：各文件类型的 MB/s 与压缩率，以及大文件并行 deflate 的加速
+
+生成一组接近真实提交的文件（扫描件 PDF、Word 文档、ZIP/7z 压缩包、照片/截图、源代码、CSV 数据），
+按类型分别打包，对比原来的"全部 deflate 9"与按类型选择的压缩策略；再对一个大文本文件比较不同并行线程数。
+
+用法:
+    python scripts/bench_zip_policy.py --mb-per-type 20 --level 6 --workers 1 2 4
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.zip_stream import iter_zip_stream, CompressionPolicy
+
+SOURCE_LINE = 'def grade_{0}(score, weight={1}):\n    """计算第 {0} 题得分"""\n    return round(score * weight / 100, 2)  # TODO {2}\n'
+
+
+def make_text(size, seed):
+    """源代码风格的文本"""
+    rng = random.Random(seed)
+    parts, total = [], 0
+    while total < size:
+        line = SOURCE_LINE.format(rng.randint(1, 500), rng.randint(1, 100), rng.random())
+        parts.append(line)
+        total += len(line.encode('utf-8'))
+    return ''.join(parts).encode('utf-8')[:size]
+
+
+def make_csv(size, seed):
+    rng = random.Random(seed)
+    rows, total = ['student_id,name,score,submitted_at\n'], 0
+    while total < size:
+        row = f'{rng.randint(20200000, 20249999)},学生{rng.randint(1, 999)},{rng.uniform(0, 100):.1f},2024-05-{rng.randint(1, 28):02d}\n'
+        rows.append(row)
+        total += len(row.encode('utf-8'))
+    return ''.join(rows).encode('utf-8')[:size]
+
+
+def make_photo(path, seed, fmt):
+    """带噪声的渐变图（接近照片/截图的压缩特性）"""
+    from PIL import Image
+    rng = random.Random(seed)
+    width, height = 1600, 1200
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    noise = Image.effect_noise((width, height), 40 + rng.randint(0, 20)).convert('RGB')
+    Image.blend(gradient, noise, 0.5).save(path, fmt, quality=85)
+
+
+def make_pdf(path, seed):
+    """图片型 PDF（扫描件）"""
+    from PIL import Image, ImageDraw
+    pages = []
+    for page in range(4):
+        image = Image.effect_noise((1240, 1754), 30).convert('L')
+        draw = ImageDraw.Draw(image)
+        for line in range(40):
+            draw.text((80, 80 + line * 40), f'Page {page} line {line} seed {seed}: homework report', fill=0)
+        pages.append(image)
+    pages[0].save(path, save_all=True, append_images=pages[1:], resolution=150)
+
+
+def make_docx(path, seed):
+    """Word 文档结构（deflate 压缩的 XML）"""
+    body = make_text(2 * 1024 * 1024, seed).decode('utf-8', errors='ignore')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', '<?xml version="1.0"?><Types/>')
+        zf.writestr('word/document.xml', f'<w:document><w:body><w:p><w:t>{body}</w:t></w:p></w:body></w:document>')
+        media = os.path.join(os.path.dirname(path), f'_media_{seed}.jpg')
+        make_photo(media, seed, 'JPEG')
+        zf.write(media, 'word/media/image1.jpg')
+        os.remove(media)
+
+
+def make_zip(path, seed):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(5):
+            zf.writestr(f'src/module_{i}.py', make_text(512 * 1024, seed * 10 + i))
+
+
+def make_7z(path, seed):
+    import py7zr
+    with py7zr.SevenZipFile(path, 'w') as archive:
+        for i in range(5):
+            archive.writestr(make_text(512 * 1024, seed * 10 + i), f'src/module_{i}.py')
+
+
+def make_mix(directory, mb_per_type):
+    """按类型生成文件，每类总大小约 mb_per_type MB，返回 {类型: [(路径, 压缩包内文件名), ...]}"""
+    target = mb_per_type * 1024 * 1024
+    builders = {
+        'pdf': lambda path, seed: make_pdf(path, seed),
+        'docx': make_docx,
+        'zip': make_zip,
+        '7z': make_7z,
+        'jpg': lambda path, seed: make_photo(path, seed, 'JPEG'),
+        'png': lambda path, seed: make_photo(path, seed, 'PNG'),
+        'py': lambda path, seed: open(path, 'wb').write(make_text(1024 * 1024, seed)),
+        'csv': lambda path, seed: open(path, 'wb').write(make_csv(1024 * 1024, seed)),
+    }
+    mix = {}
+    for ext, build in builders.items():
+        entries, total, seed = [], 0, 0
+        while total < target:
+            path = os.path.join(directory, f'{ext}_{seed:03d}.{ext}')
+            try:
+                build(path, seed)
+            except ImportError as e:
+                print(f'跳过 {ext}: {e}')
+                break
+            total += os.path.getsize(path)
+            entries.append((path, os.path.basename(path)))
+            seed += 1
+        if entries:
+            mix[ext] = entries
+    return mix
+
+
+def measure(entries, policy):
+    """返回 (耗时, 输入字节数, 输出字节数)"""
+    size = sum(os.path.getsize(path) for path, _ in entries)
+    start = time.perf_counter()
+    output = sum(len(chunk) for chunk in iter_zip_stream(entries, policy=policy))
+    return time.perf_counter() - start, size, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description='作业打包压缩策略基准测试')
+    parser.add_argument('--mb-per-type', type=int, default=20, help='每种文件类型的总大小（MB）')
+    parser.add_argument('--level', type=int, default=6, help='新策略的 deflate 级别')
+    parser.add_argument('--big-mb', type=int, default=128, help='并行测试用大文本文件大小（MB）')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='并行测试的线程数')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='tg_edu_zip_policy_')
+    try:
+        print(f'生成文件（每类约 {args.mb_per_type}MB）...')
+        mix = make_mix(directory, args.mb_per_type)
+
+        legacy = CompressionPolicy(level=9, stored_extensions=frozenset())
+        policy = CompressionPolicy(level=args.level)
+        print(f'CPU: {os.cpu_count()}')
+        print(f'{"类型":<8}{"输入(MB)":>10}{"原 MB/s":>10}{"原压缩率":>10}{"新 MB/s":>10}{"新压缩率":>10}{"新方式":>10}')
+        totals = {'legacy': [0, 0, 0], 'policy': [0, 0, 0]}
+        for ext, entries in mix.items():
+            row = []
+            for name, current in (('legacy', legacy), ('policy', policy)):
+                elapsed, size, output = measure(entries, current)
+                for i, value in enumerate((elapsed, size, output)):
+                    totals[name][i] += value
+                row.append((size / 1024 ** 2 / elapsed, output / size))
+            method = 'stored' if policy.compress_type(entries[0][1]) == zipfile.ZIP_STORED else f'deflate {args.level}'
+            size_mb = sum(os.path.getsize(path) for path, _ in entries) / 1024 ** 2
+            print(f'{ext:<8}{size_mb:>10.1f}{row[0][0]:>10.1f}{row[0][1]:>10.3f}{row[1][0]:>10.1f}{row[1][1]:>10.3f}{method:>10}')
+        for name, label in (('legacy', '原策略'), ('policy', '新策略')):
+            elapsed, size, output = totals[name]
+            print(f'{label}合计: {size / 1024 ** 2 / elapsed:.1f} MB/s, 压缩率 {output / size:.3f}, 耗时 {elapsed:.1f}s')
+
+        # 大文件并行 deflate
+        big_path = os.path.join(directory, 'big_report.txt')
+        with open(big_path, 'wb') as f:
+            for seed in range(args.big_mb):
+                f.write(make_text(1024 * 1024, seed))
+        print(f'\n大文件并行 deflate（{args.big_mb}MB 文本，级别 {args.level}）')
+        print(f'{"线程数":<8}{"耗时(s)":>10}{"MB/s":>10}{"压缩率":>10}')
+        for workers in args.workers:
+            current = CompressionPolicy(level=args.level, workers=workers)
+            elapsed, size, output = measure([(big_path, 'big_report.txt')], current)
+            print(f'{workers:<8}{elapsed:>10.2f}{size / 1024 ** 2 / elapsed:>10.1f}{output / size:>10.3f}')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""作业打包下载基准测试：流式 ZIP 与内存中整体打包的峰值内存和吞吐量对比
+
+生成一个合成的大作业（默认 5GB，分成若干提交文件），分别用流式生成（app.utils.zip_stream）
+和原来的 BytesIO 整体打包方式压缩，输出丢弃（模拟发送给浏览器），记录峰值 RSS 和 MB/s。
+
+默认文件内容为随机数据（不可压缩，与学生提交的 PDF/图片/压缩包相近）；--sparse 使用全零的稀疏文件，
+不占磁盘空间，压缩很快，适合只观察内存。内存模式需要与压缩包同样大的内存，大作业下请谨慎使用。
+
+用法:
+    python scripts/bench_zip_stream.py --size-gb 5 --files 100 --modes stream
+    python scripts/bench_zip_stream.py --size-gb 1 --files 50 --modes stream memory --compresslevel 1
+    python scripts/bench_zip_stream.py --size-gb 5 --sparse --output /tmp/assignment.zip
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil
+from app.utils.zip_stream import iter_zip_stream, CompressionPolicy
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class PeakRSSMonitor:
+    """采样当前进程的 RSS，记录峰值"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        process = psutil.Process()
+        while not self._stop.is_set():
+            try:
+                self.peak = max(self.peak, process.memory_info().rss)
+            except psutil.Error:
+                pass
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def make_assignment(directory, total_bytes, files, sparse):
+    """生成合成作业提交文件，返回 [(源文件路径, 压缩包内文件名), ...]"""
+    entries = []
+    per_file = total_bytes // files
+    # 随机数据块重复使用（间隔远大于 deflate 的 32KB 窗口，仍然不可压缩），避免生成随机数成为瓶颈
+    block = os.urandom(CHUNK_SIZE * 8)
+    for i in range(files):
+        path = os.path.join(directory, f'submission_{i:04d}.bin')
+        size = per_file + (total_bytes - per_file * files if i == files - 1 else 0)
+        with open(path, 'wb') as f:
+            if sparse:
+                f.truncate(size)
+            else:
+                written = 0
+                while written < size:
+                    data = block[:size - written]
+                    f.write(data)
+                    written += len(data)
+        entries.append((path, f'学生{i:04d}_2024{i:06d}_20240101_120000_作业.bin'))
+    return entries
+
+
+def run_stream(entries, compresslevel, output):
+    out = open(output, 'wb') if output else None
+    total = 0
+    try:
+        for chunk in iter_zip_stream(entries, policy=CompressionPolicy(level=compresslevel)):
+            total += len(chunk)
+            if out:
+                out.write(chunk)
+    finally:
+        if out:
+            out.close()
+    return total
+
+
+def run_memory(entries, compresslevel, output):
+    """原实现：整个压缩包在内存中生成后再发送"""
+    memory_file = BytesIO()
+    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zf:
+        for file_path, arcname in entries:
+            zf.write(file_path, arcname)
+    data = memory_file.getvalue()
+    if output:
+        with open(output, 'wb') as f:
+            f.write(data)
+    return len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='作业打包下载基准测试')
+    parser.add_argument('--size-gb', type=float, default=5, help='合成作业总大小（GB）')
+    parser.add_argument('--files', type=int, default=100, help='提交文件数')
+    parser.add_argument('--sparse', action='store_true', help='使用全零稀疏文件（不占磁盘，压缩快）')
+    parser.add_argument('--modes', nargs='+', choices=['stream', 'memory'], default=['stream'], help='测试的打包方式')
+    parser.add_argument('--compresslevel', type=int, default=9, help='deflate 压缩级别（原实现使用 9）')
+    parser.add_argument('--output', help='把生成的压缩包写入该文件并校验目录（默认丢弃输出）')
+    parser.add_argument('--dir', help='合成文件所在目录（默认临时目录，结束后删除）')
+    args = parser.parse_args()
+
+    total_bytes = int(args.size_gb * 1024 ** 3)
+    directory = args.dir or tempfile.mkdtemp(prefix='tg_edu_zip_')
+    os.makedirs(directory, exist_ok=True)
+    try:
+        print(f'生成合成作业: {args.files} 个文件, 共 {total_bytes / 1024 ** 3:.2f}GB, '
+              f'{"稀疏全零" if args.sparse else "随机数据"}, 目录 {directory}')
+        entries = make_assignment(directory, total_bytes, args.files, args.sparse)
+
+        print(f'{"方式":<10}{"耗时(s)":>10}{"输入MB/s":>12}{"输出(MB)":>12}{"峰值RSS(MB)":>14}')
+        runners = {'stream': run_stream, 'memory': run_memory}
+        for mode in args.modes:
+            with PeakRSSMonitor() as monitor:
+                start = time.perf_counter()
+                size = runners[mode](entries, args.compresslevel, args.output)
+                elapsed = time.perf_counter() - start
+            print(f'{mode:<10}{elapsed:>10.2f}{total_bytes / 1024 ** 2 / elapsed:>12.1f}'
+                  f'{size / 1024 ** 2:>12.1f}{monitor.peak / 1024 ** 2:>14.1f}')
+
+            if args.output:
+                with zipfile.ZipFile(args.output) as zf:
+                    infos = zf.infolist()
+                    assert len(infos) == len(entries), '压缩包成员数不一致'
+                    assert sum(info.file_size for info in infos) == total_bytes, '压缩包解压大小不一致'
+                print(f'  {args.output} 校验通过: {len(infos)} 个成员')
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""AI 批改队列公平调度检查：一位教师积压大量任务时，其他教师的新任务仍应穿插在队首附近
+
+构造教师 A 在 --backlog-minutes 分钟前一次提交的 --backlog 个任务，以及教师 B 刚提交的 --small 个任务，
+按 claim_batch 使用的调度顺序排序，检查 B 的第 i 个任务排在前 2 × i + 老化轮数 + 2 位以内。
+检查失败时以非零状态退出。
+
+用法:
+    python scripts/check_fair_share.py --backlog 300 --small 3 --backlog-minutes 60
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 使用临时存储目录，避免污染正式数据库
+os.environ['STORAGE_DIR'] = tempfile.mkdtemp(prefix='tg_edu_fair_share_')
+
+
+def add_tasks(db, teacher_username, count, created_at):
+    """为一位教师创建一份作业和 count 个等待中的任务，返回任务ID列表"""
+    from app.models import User, UserRole, Assignment, Submission, AIGradingTask
+
+    teacher = User(username=teacher_username, real_name=teacher_username, role=UserRole.TEACHER)
+    teacher.set_password('check')
+    db.session.add(teacher)
+    db.session.commit()
+
+    assignment = Assignment(title=f'{teacher_username} 的作业', description='测试', teacher_id=teacher.id, ai_grading_mode=3)
+    db.session.add(assignment)
+    db.session.commit()
+
+    task_ids = []
+    for i in range(count):
+        submission = Submission(
+            assignment_id=assignment.id,
+            student_id=teacher.id,
+            student_name=f'学生{i}',
+            student_number=f'{i:04d}',
+            filename=f'{i}.txt',
+            original_filename=f'{i}.txt',
+            file_path=f'/nonexistent/{teacher_username}/{i}.txt'
+        )
+        db.session.add(submission)
+        db.session.flush()
+        task = AIGradingTask(
+            submission_id=submission.id,
+            assignment_id=assignment.id,
+            student_id=teacher.id,
+            status=AIGradingTask.STATUS_PENDING,
+            created_at=created_at + timedelta(milliseconds=i)
+        )
+        db.session.add(task)
+        db.session.flush()
+        task_ids.append(task.id)
+    db.session.commit()
+    return task_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI 批改队列公平调度检查')
+    parser.add_argument('--backlog', type=int, default=300, help='教师 A 积压的任务数')
+    parser.add_argument('--small', type=int, default=3, help='教师 B 新提交的任务数')
+    parser.add_argument('--backlog-minutes', type=int, default=60, help='教师 A 的任务已等待的分钟数')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.extensions import db
+    from app.models import AIGradingTask
+
+    app = create_app('development')
+    with app.app_context():
+        now = datetime.utcnow()
+        add_tasks(db, 'teacher_a', args.backlog, now - timedelta(minutes=args.backlog_minutes))
+        small_ids = add_tasks(db, 'teacher_b', args.small, now)
+
+        order = [row[0] for row in db.session.execute(
+            AIGradingTask._schedule_order(AIGradingTask.status == AIGradingTask.STATUS_PENDING, now)
+        )]
+
+    aging_rounds = args.backlog_minutes // AIGradingTask.AGING_MINUTES
+    positions = [order.index(task_id) for task_id in small_ids]
+    print(f'教师 A 积压 {args.backlog} 个（已等待 {args.backlog_minutes} 分钟），教师 B 新提交 {args.small} 个，'
+          f'老化间隔 {AIGradingTask.AGING_MINUTES} 分钟')
+    print(f'教师 B 的任务在调度顺序中的位置（从 0 开始）: {positions}')
+
+    failed = [(i, position) for i, position in enumerate(positions)
+              if position > 2 * i + aging_rounds + 2]
+    if failed:
+        print(f'❌ 教师 B 的任务没有与积压任务穿插: {failed}')
+        sys.exit(1)
+    print('✅ 教师 B 的任务与积压任务交替出队')
+
+
+if __name__ == '__main__':
+    main()
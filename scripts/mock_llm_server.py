@@ -0,0 +1,114 @@
+"""本地模拟 LLM 服务（兼容 OpenAI Chat Completions 接口，用于基准测试）"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """模拟 /chat/completions 接口，固定延迟后返回评分 JSON"""
+    
+    # 支持 keep-alive，便于观察客户端连接复用
+    protocol_version = 'HTTP/1.1'
+    
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+        with server.stats_lock:
+            server.request_count += 1
+            roll = server.random.random()
+        
+        # 故障注入：按比例返回 429（带 Retry-After）或 500
+        if roll < server.throttle_rate:
+            with server.stats_lock:
+                server.throttled_count += 1
+            self._send_error(429, 'Rate limit reached', {'Retry-After': str(server.retry_after)})
+            return
+        if roll < server.throttle_rate + server.error_rate:
+            with server.stats_lock:
+                server.error_count += 1
+            self._send_error(500, 'Internal server error')
+            return
+        
+        time.sleep(server.latency)
+        
+        # 模拟上下文缓存：<student_work> 之前的共享前缀第二次出现时按缓存命中计 token
+        prompt_text = ''.join(m.get('content') or '' for m in body.get('messages', []))
+        prefix = prompt_text.split('<student_work>', 1)[0]
+        with server.stats_lock:
+            prefix_seen = prefix in server.seen_prefixes
+            server.seen_prefixes.add(prefix)
+        prompt_tokens = max(len(prompt_text) // 2, 1)
+        cache_hit_tokens = len(prefix) // 2 if prefix_seen else 0
+        
+        content = json.dumps({'score': 85, 'comment': '模拟评语：作业完成度较好'}, ensure_ascii=False)
+        payload = {
+            'id': 'mock-completion',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'mock-model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': 20,
+                'total_tokens': prompt_tokens + 20,
+                'prompt_cache_hit_tokens': cache_hit_tokens,
+                'prompt_cache_miss_tokens': prompt_tokens - cache_hit_tokens
+            }
+        }
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def _send_error(self, status, message, headers=None):
+        data = json.dumps({'error': {'message': message, 'type': 'mock_error'}}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(latency=0.5, host='127.0.0.1', port=0,
+                      throttle_rate=0.0, error_rate=0.0, retry_after=1, seed=None):
+    """
+    在后台线程中启动模拟服务
+    
+    参数:
+        throttle_rate: 返回 429 的比例
+        error_rate: 返回 500 的比例
+        retry_after: 429 响应携带的 Retry-After 秒数
+    
+    返回: (server, base_url)
+    """
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.throttle_rate = throttle_rate
+    server.error_rate = error_rate
+    server.retry_after = retry_after
+    server.random = random.Random(seed)
+    server.request_count = 0
+    server.throttled_count = 0
+    server.error_count = 0
+    server.stats_lock = threading.Lock()
+    server.seen_prefixes = set()
+    
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    
+    return server, f'http://{host}:{server.server_address[1]}'
@@ -54,6 +54,12 @@ python3 migrations/migrate_ai_grading_mode.py
 # 运行 AI 批改队列表迁移
 python3 migrations/migrate_ai_grading_queue.py
 
+# 运行提交文件预提取文本表迁移
+python3 migrations/migrate_submission_text.py
+
+# 运行批量下载打包任务表迁移
+python3 migrations/migrate_batch_download_job.py
+
 # 然后初始化管理员账户
 python3 -c "
 import os